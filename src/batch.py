@@ -0,0 +1,395 @@
+"""
+Build many puzzle sheets in one run from a JSON manifest, without prompts.
+
+    wuzzle-cli batch manifest.json
+
+The manifest is a list of sheets, or an object with a "sheets" list and
+"defaults" applied to every sheet:
+
+    {
+      "defaults": {"medium": "lichess", "n": 12, "author": "Coach"},
+      "sheets": [
+        {"name": "u10-forks", "theme": "fork", "seed": 1, "title": "Forks",
+         "squad": "Under 10s", "blurb": "White to play."},
+        {"name": "u12-mates", "theme": "mateIn2", "seed": 2, "title": "Mates",
+         "squad": "Under 12s"},
+        {"name": "club", "medium": "csv", "file": "data/club.csv", "n": 6}
+      ]
+    }
+
+Each sheet is written to `<output dir>/<name>/`. The Lichess database, and
+any csv or text file, is read once however many sheets draw from it, each
+distinct position is rendered once however many sheets use it, and the .tex
+files are compiled in parallel. `seed` fixes the random draw; csv and text
+sheets without a seed take positions in file order.
+"""
+import json
+import os
+import random
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from profiling import span
+
+MEDIUMS = ["lichess", "csv", "text"]
+SHEET_FIELDS = {
+    "name",
+    "medium",
+    "theme",
+    "file",
+    "n",
+    "seed",
+    "title",
+    "squad",
+    "blurb",
+    "author",
+}
+DEFAULT_N = 10
+
+
+def _sheet_name(sheet, index):
+    name = sheet.get("name") or sheet.get("squad") or sheet.get("title") or f"sheet-{index + 1}"
+    return re.sub(r"[^\w.-]+", "_", str(name)).strip("._") or f"sheet-{index + 1}"
+
+
+def load_manifest(path):
+    """
+    Read a batch manifest and return its sheets with defaults applied.
+
+    Raises ValueError describing the first invalid sheet.
+    """
+    with open(path) as handle:
+        try:
+            manifest = json.load(handle)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Manifest {path} is not valid JSON: {exc}")
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = manifest.get("defaults", {})
+        manifest = manifest.get("sheets")
+    if not isinstance(manifest, list) or not manifest:
+        raise ValueError("Manifest must be a non-empty list of sheets or have a 'sheets' list.")
+
+    base_dir = Path(path).parent
+    sheets = []
+    names = set()
+    for index, entry in enumerate(manifest):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Sheet {index + 1}: expected an object.")
+        sheet = {"medium": "lichess", "n": DEFAULT_N, "seed": None, **defaults, **entry}
+        label = f"Sheet {index + 1}"
+        unknown = sorted(set(sheet) - SHEET_FIELDS)
+        if unknown:
+            raise ValueError(f"{label}: unknown field(s) {', '.join(unknown)}.")
+        if sheet["medium"] not in MEDIUMS:
+            raise ValueError(f"{label}: medium must be one of {', '.join(MEDIUMS)}.")
+        if sheet["medium"] == "lichess" and not sheet.get("theme"):
+            raise ValueError(f"{label}: a theme is required for the lichess medium.")
+        if sheet["medium"] != "lichess":
+            if not sheet.get("file"):
+                raise ValueError(f"{label}: a file is required for the {sheet['medium']} medium.")
+            # Relative files are found next to the manifest
+            sheet["file"] = str(base_dir / sheet["file"])
+        if not isinstance(sheet["n"], int) or sheet["n"] < 1:
+            raise ValueError(f"{label}: n must be a positive integer.")
+        sheet["name"] = _sheet_name(sheet, index)
+        if sheet["name"] in names:
+            raise ValueError(f"{label}: another sheet is already named {sheet['name']}.")
+        names.add(sheet["name"])
+        sheets.append(sheet)
+    return sheets
+
+
+def _themes_list(theme):
+    return [t.strip() for t in str(theme).split(",") if t.strip()]
+
+
+def _select_lichess(df, sheet):
+    """
+    Draw `n` distinct positions after the first move from the rows tagged with
+    every theme of the sheet.
+    """
+    import chess
+    from dedupe import PositionSet
+    from main import filter_by_themes
+
+    filtered = filter_by_themes(df, _themes_list(sheet["theme"]))
+    seen = PositionSet()
+    fens = []
+    skipped = 0
+    for _, row in filtered.sample(frac=1, random_state=sheet["seed"]).iterrows():
+        try:
+            board = chess.Board(row["FEN"])
+            board.push(chess.Move.from_uci(row["Moves"].split()[0]))
+        except (ValueError, IndexError, AssertionError):
+            skipped += 1
+            continue
+        if seen.add(board):
+            fens.append(board.fen())
+            if len(fens) == sheet["n"]:
+                break
+    _report_skipped(sheet, skipped, "unreadable puzzle(s)")
+    return fens
+
+
+def _report_skipped(sheet, skipped, what):
+    if skipped:
+        print(f"{sheet['name']}: skipped {skipped} {what}.")
+
+
+def _select_from_lines(fens, sheet):
+    """
+    Take `n` distinct positions from the sequence `fens`, in order or drawn
+    at random with the seed; only the lines drawn are read. Lines that are
+    not valid FENs are skipped and counted.
+    """
+    import chess
+    from dedupe import PositionSet
+    from line_index import random_order
+
+    order = range(len(fens))
+    if sheet["seed"] is not None:
+        order = random_order(random.Random(sheet["seed"]), len(fens))
+    seen = PositionSet()
+    selected = []
+    skipped = 0
+    for number in order:
+        fen = fens[number].strip()
+        if not fen:
+            continue
+        try:
+            board = chess.Board(fen)
+        except ValueError:
+            skipped += 1
+            continue
+        if seen.add(board):
+            selected.append(board.fen())
+            if len(selected) == sheet["n"]:
+                break
+    _report_skipped(sheet, skipped, "line(s) that are not valid FENs")
+    return selected
+
+
+def _open_fens(sheet):
+    """
+    The FENs of a sheet's text or csv file, read on demand through a line index.
+
+    :returns: The open `LineIndex` and the FEN sequence.
+    """
+    from line_index import CsvLines, FenColumn, LineIndex
+
+    path = Path(sheet["file"])
+    if not path.exists():
+        raise FileNotFoundError(f"{sheet['name']}: file not found at {path}")
+    with span("read_file") as stage:
+        lines = LineIndex(path)
+        stage.add_items(len(lines))
+    if sheet["medium"] == "text":
+        return lines, lines
+    try:
+        return lines, FenColumn(CsvLines(lines))
+    except ValueError as exc:
+        lines.close()
+        raise ValueError(f"{sheet['name']}: {exc}")
+
+
+def select_positions(sheets, lichess_db_path, themes_file=None):
+    """
+    Choose the positions of every sheet, reading each source once.
+
+    :returns: A list of FENs per sheet.
+    """
+    from main import is_valid_theme, load_lichess_db
+
+    lichess_sheets = [sheet for sheet in sheets if sheet["medium"] == "lichess"]
+    for sheet in lichess_sheets:
+        invalid = [t for t in _themes_list(sheet["theme"]) if not is_valid_theme(t, themes_file)]
+        if invalid:
+            raise ValueError(f"{sheet['name']}: invalid theme(s): {', '.join(invalid)}")
+
+    df = None
+    if lichess_sheets:
+        if not Path(lichess_db_path).exists():
+            raise FileNotFoundError(f"Lichess DB not found at {lichess_db_path}")
+        df = load_lichess_db(lichess_db_path)
+
+    sources = {}
+    selections = []
+    try:
+        for sheet in sheets:
+            with span("select", sheet=sheet["name"]) as stage:
+                if sheet["medium"] == "lichess":
+                    fens = _select_lichess(df, sheet)
+                else:
+                    key = (sheet["medium"], sheet["file"])
+                    if key not in sources:
+                        sources[key] = _open_fens(sheet)
+                    fens = _select_from_lines(sources[key][1], sheet)
+                stage.add_items(len(fens))
+            if len(fens) < sheet["n"]:
+                print(f"{sheet['name']}: only {len(fens)} of {sheet['n']} puzzles available.")
+            selections.append(fens)
+    finally:
+        for lines, _ in sources.values():
+            lines.close()
+    return selections
+
+
+def _render(fen, path, profile):
+    from fen2tex import fen2png
+
+    fen2png(fen, str(path), profile=profile)
+    return path
+
+
+def render_positions(selections, cache_dir, workers=None, profile="screen"):
+    """
+    Render each distinct position of all sheets once, in parallel, with the
+    `fen2tex.IMAGE_PROFILES` entry `profile`.
+
+    :returns: A dict from position key to image path, and a dict from
+        position key to the error of each render that failed.
+    """
+    from dedupe import position_key
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    pending = {}
+    for fens in selections:
+        for fen in fens:
+            key = position_key(fen)
+            if key not in pending:
+                pending[key] = fen
+
+    images = {}
+    failures = {}
+    with span("render_images") as stage, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            key: executor.submit(_render, fen, cache_dir / f"{key:016x}.png", profile)
+            for key, fen in pending.items()
+        }
+        for key, future in futures.items():
+            try:
+                images[key] = future.result()
+            except Exception as exc:
+                # Left to write_sheets to report against the sheets using it
+                failures[key] = exc
+        stage.add_items(len(images))
+    return images, failures
+
+
+def _link_or_copy(source, destination):
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def write_sheets(sheets, selections, images, output_dir, failures=None):
+    """
+    Write each sheet's images and .tex file to its own directory. Sheets with
+    a board that failed to render, as recorded in `failures`, are skipped.
+
+    :returns: The .tex paths, one per sheet written.
+    """
+    from dedupe import position_key
+    from fen2tex import fen2tex
+
+    tex_paths = []
+    for sheet, fens in zip(sheets, selections):
+        if not fens:
+            print(f"{sheet['name']}: no puzzles found; skipping.")
+            continue
+        missing = [fen for fen in fens if position_key(fen) not in images]
+        if missing:
+            error = (failures or {}).get(position_key(missing[0]), "no image")
+            print(
+                f"{sheet['name']}: could not render {len(missing)} board(s), "
+                f"e.g. {missing[0]}: {error}; skipping."
+            )
+            continue
+        sheet_dir = Path(output_dir) / sheet["name"]
+        img_dir = sheet_dir / "images"
+        if img_dir.exists():
+            for old in img_dir.glob("puzzle_*.png"):
+                old.unlink()
+        img_dir.mkdir(parents=True, exist_ok=True)
+        for idx, fen in enumerate(fens):
+            _link_or_copy(images[position_key(fen)], img_dir / f"puzzle_{idx}.png")
+        tex_path = sheet_dir / f"{sheet['name']}.tex"
+        fen2tex(
+            tex_path,
+            img_dir,
+            [""] * len(fens),
+            title=sheet.get("title") or "",
+            squad=sheet.get("squad") or "",
+            blurb=sheet.get("blurb") or "",
+            author=sheet.get("author") or "",
+            run_pdflatex=False,
+            open_pdf=False,
+        )
+        tex_paths.append(tex_path)
+    return tex_paths
+
+
+def compile_sheets(tex_paths, workers=None):
+    """
+    Compile the .tex files with pdflatex in parallel.
+
+    :returns: The paths of the PDFs that were produced.
+    """
+    from fen2tex import compile_pdf
+
+    if shutil.which("pdflatex") is None:
+        print("pdflatex not found; skipping PDF generation.")
+        return []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pdf_paths = list(
+            executor.map(lambda tex_path: compile_pdf(tex_path, interactive=False), tex_paths)
+        )
+    return [path for path in pdf_paths if path.exists()]
+
+
+def run_batch(
+    manifest_path,
+    lichess_db_path,
+    output_dir,
+    themes_file=None,
+    run_pdflatex=True,
+    workers=None,
+    profile="screen",
+):
+    """
+    Build every sheet of the manifest, with boards rendered with the
+    `fen2tex.IMAGE_PROFILES` entry `profile`.
+
+    :returns: The process exit code.
+    """
+    try:
+        sheets = load_manifest(manifest_path)
+        selections = select_positions(sheets, lichess_db_path, themes_file)
+    except (FileNotFoundError, ValueError) as exc:
+        print(str(exc))
+        return 1
+
+    output_dir = Path(output_dir)
+    print(f"Rendering {len(sheets)} sheets...")
+    images, failures = render_positions(
+        selections, output_dir / ".batch-images", workers, profile
+    )
+    tex_paths = write_sheets(sheets, selections, images, output_dir, failures)
+    # The sheets hold their own links or copies of the renders
+    shutil.rmtree(output_dir / ".batch-images", ignore_errors=True)
+    if run_pdflatex and tex_paths:
+        with span("compile_pdfs") as stage:
+            pdf_paths = compile_sheets(tex_paths, workers)
+            stage.add_items(len(pdf_paths))
+        print(f"Compiled {len(pdf_paths)} of {len(tex_paths)} PDFs.")
+    print(f"Wrote {len(tex_paths)} sheets to {output_dir}")
+    if failures:
+        print(f"{len(failures)} board(s) could not be rendered.")
+        return 1
+    return 0 if tex_paths else 1
@@ -0,0 +1,377 @@
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BENCH_DIR = ROOT_DIR / "data/bench"
+DEFAULT_ROWS = 20000
+DEFAULT_PUZZLES = 12
+DEFAULT_REPEAT = 3
+DEFAULT_THEMES = "fork,middlegame"
+DEFAULT_MAX_REGRESSION = 1.25
+BENCHMARKS = [
+    "db_load",
+    "theme_filter",
+    "sampling",
+    "similarity",
+    "fen2png",
+    "fen2tex",
+    "pdf_compile",
+]
+# Positions stored in, and looked up in, the --diversity similarity index
+SIMILARITY_STORED = 500
+SIMILARITY_QUERIES = 200
+RESULTS_VERSION = 1
+
+
+class SkipBenchmark(Exception):
+    """
+    Raised by a benchmark that cannot run here, e.g. without pdflatex.
+    """
+
+
+def _time(function, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+class _Context:
+    """
+    State shared between benchmarks; each step builds on the previous one.
+    """
+
+    def __init__(self, db_path, work_dir, themes, puzzles):
+        self.db_path = db_path
+        self.work_dir = work_dir
+        self.themes = themes
+        self.puzzles = puzzles
+        self.df = None
+        self.filtered = None
+        self.fens = None
+        self.img_dir = work_dir / "images"
+        self.tex_path = work_dir / "bench.tex"
+
+
+def _bench_db_load(context, repeat):
+    from main import load_lichess_db
+
+    # The first load also imports pandas, so it is not timed
+    context.df = load_lichess_db(context.db_path)
+    seconds = _time(lambda: load_lichess_db(context.db_path), repeat)
+    return seconds, len(context.df)
+
+
+def _bench_theme_filter(context, repeat):
+    from main import filter_by_themes
+
+    if context.df is None:
+        _bench_db_load(context, 1)
+    seconds = _time(lambda: filter_by_themes(context.df, context.themes), repeat)
+    context.filtered = filter_by_themes(context.df, context.themes)
+    return seconds, len(context.df)
+
+
+def _bench_sampling(context, repeat):
+    from dedupe import PositionSet
+    from main import iter_lichess_candidates
+
+    if context.filtered is None:
+        _bench_theme_filter(context, 1)
+    if context.filtered.empty:
+        raise SkipBenchmark(f"no puzzles match {','.join(context.themes)}")
+
+    def sample():
+        candidates = iter_lichess_candidates(context.filtered, PositionSet())
+        return [board.fen() for _, board in islice(candidates, context.puzzles)]
+
+    seconds = _time(sample, repeat)
+    context.fens = sample()
+    return seconds, len(context.fens)
+
+
+def _bench_similarity(context, repeat):
+    import random
+
+    from similarity import SimilarityIndex
+    from synthetic_data import random_game
+
+    rng = random.Random(7)
+    index = SimilarityIndex(4)
+    for _ in range(SIMILARITY_STORED):
+        index.add(random_game(rng, rng.randint(10, 60)))
+    queries = [random_game(rng, rng.randint(10, 60)) for _ in range(SIMILARITY_QUERIES)]
+
+    def lookup():
+        for query in queries:
+            index.nearest(query)
+
+    return _time(lookup, repeat), len(queries)
+
+
+def _bench_fen2png(context, repeat):
+    if context.fens is None:
+        _bench_sampling(context, 1)
+    try:
+        from fen2tex import fen2png
+
+        context.img_dir.mkdir(parents=True, exist_ok=True)
+        fen2png(context.fens[0], str(context.img_dir / "puzzle_0.png"))
+    except (ImportError, OSError) as exc:
+        raise SkipBenchmark(f"rendering unavailable: {exc}")
+
+    def render():
+        for idx, fen in enumerate(context.fens):
+            fen2png(fen, str(context.img_dir / f"puzzle_{idx}.png"))
+
+    return _time(render, repeat), len(context.fens)
+
+
+def _bench_fen2tex(context, repeat):
+    from fen2tex import fen2tex
+
+    if context.fens is None:
+        _bench_sampling(context, 1)
+    # fen2tex only needs the image files to exist; they are missing when
+    # rendering is unavailable or fen2png did not run
+    context.img_dir.mkdir(parents=True, exist_ok=True)
+    for idx in range(len(context.fens)):
+        path = context.img_dir / f"puzzle_{idx}.png"
+        if not path.exists():
+            path.touch()
+    comments = [f"Puzzle {idx + 1}" for idx in range(len(context.fens))]
+
+    def write():
+        fen2tex(
+            context.tex_path,
+            context.img_dir,
+            comments,
+            title="Benchmark",
+            squad="Squad",
+            blurb="Blurb",
+            run_pdflatex=False,
+            open_pdf=False,
+        )
+
+    return _time(write, repeat), len(context.fens)
+
+
+def _bench_pdf_compile(context, repeat):
+    from fen2tex import compile_pdf
+
+    if shutil.which("pdflatex") is None:
+        raise SkipBenchmark("pdflatex not found")
+    if not context.tex_path.exists():
+        _bench_fen2tex(context, 1)
+    return _time(lambda: compile_pdf(context.tex_path), repeat), len(context.fens)
+
+
+_BENCHMARKS = {
+    "db_load": _bench_db_load,
+    "theme_filter": _bench_theme_filter,
+    "sampling": _bench_sampling,
+    "similarity": _bench_similarity,
+    "fen2png": _bench_fen2png,
+    "fen2tex": _bench_fen2tex,
+    "pdf_compile": _bench_pdf_compile,
+}
+
+
+def synthetic_db_path(bench_dir, rows, seed=0):
+    """
+    Path of the cached synthetic database for `rows` and `seed`, generating it
+    on first use.
+    """
+    from synthetic_data import write_puzzle_db
+
+    path = Path(bench_dir) / f"puzzles-{rows}-{seed}.csv"
+    if not path.exists():
+        print(f"Generating {rows} synthetic puzzles in {path}...")
+        tmp_path = path.with_suffix(".tmp")
+        write_puzzle_db(tmp_path, rows, seed=seed)
+        tmp_path.replace(path)
+    return path
+
+
+def run_benchmarks(
+    db_path,
+    names=None,
+    repeat=DEFAULT_REPEAT,
+    puzzles=DEFAULT_PUZZLES,
+    themes=DEFAULT_THEMES,
+):
+    """
+    Run benchmarks against a puzzle database and return the results as a
+    JSON-serialisable dict.
+
+    Each result records the wall-clock seconds of every repeat and how many
+    items (rows or puzzles) one repeat processed. Benchmarks that cannot run
+    here are recorded as skipped with the reason.
+    """
+    names = names or BENCHMARKS
+    unknown = [name for name in names if name not in _BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        context = _Context(
+            Path(db_path), Path(tmp), [t.strip() for t in themes.split(",") if t.strip()], puzzles
+        )
+        for name in names:
+            try:
+                seconds, items = _BENCHMARKS[name](context, repeat)
+            except SkipBenchmark as exc:
+                results.append({"name": name, "status": "skipped", "reason": str(exc)})
+                continue
+            results.append(
+                {
+                    "name": name,
+                    "status": "ok",
+                    "items": items,
+                    "seconds": seconds,
+                    "min": min(seconds),
+                    "median": statistics.median(seconds),
+                }
+            )
+
+    return {
+        "version": RESULTS_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "db": str(db_path),
+            "repeat": repeat,
+            "puzzles": puzzles,
+            "themes": themes,
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, max_regression=DEFAULT_MAX_REGRESSION):
+    """
+    Compare the median times of two result sets.
+
+    :returns: `(name, baseline median, current median, ratio, regressed)` for
+        each benchmark that ran in both.
+    """
+    previous = {
+        result["name"]: result for result in baseline["results"] if result["status"] == "ok"
+    }
+    rows = []
+    for result in current["results"]:
+        old = previous.get(result["name"])
+        if result["status"] != "ok" or old is None:
+            continue
+        ratio = result["median"] / old["median"] if old["median"] else float("inf")
+        regressed = ratio > max_regression
+        rows.append((result["name"], old["median"], result["median"], ratio, regressed))
+    return rows
+
+
+def format_results(results):
+    lines = []
+    for result in results["results"]:
+        if result["status"] == "ok":
+            lines.append(
+                f"{result['name']:<14}{result['median'] * 1000:>10.1f} ms"
+                f"  (min {result['min'] * 1000:.1f} ms, {result['items']} items)"
+            )
+        else:
+            lines.append(f"{result['name']:<14}   skipped  ({result['reason']})")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark loading, filtering, sampling and rendering puzzle sheets."
+    )
+    parser.add_argument(
+        "--lichess-db",
+        type=str,
+        help="Puzzle database to benchmark (default: a cached synthetic database).",
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=DEFAULT_ROWS,
+        help=f"Rows in the synthetic database (default: {DEFAULT_ROWS}).",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic database.")
+    parser.add_argument(
+        "--bench-dir",
+        type=str,
+        default=str(DEFAULT_BENCH_DIR),
+        help="Where synthetic databases are cached.",
+    )
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=BENCHMARKS,
+        help="Run only this benchmark (repeatable).",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per benchmark.")
+    parser.add_argument(
+        "--puzzles",
+        type=int,
+        default=DEFAULT_PUZZLES,
+        help="Puzzles sampled, rendered and written per run.",
+    )
+    parser.add_argument(
+        "--themes", type=str, default=DEFAULT_THEMES, help="Comma-separated themes to filter by."
+    )
+    parser.add_argument("--out", type=str, help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", type=str, help="Compare against an earlier results file.")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=DEFAULT_MAX_REGRESSION,
+        help="Exit with an error when a median gets slower than this ratio of the baseline.",
+    )
+    args = parser.parse_args()
+
+    if args.lichess_db:
+        db_path = Path(args.lichess_db)
+        if not db_path.exists():
+            raise SystemExit(f"Lichess DB not found at {db_path}")
+    else:
+        db_path = synthetic_db_path(args.bench_dir, args.rows, args.seed)
+
+    results = run_benchmarks(
+        db_path, names=args.only, repeat=args.repeat, puzzles=args.puzzles, themes=args.themes
+    )
+    print(format_results(results))
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Wrote results to {args.out}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressed = False
+        print(f"\nCompared with {args.compare}:")
+        for name, old, new, ratio, slower in compare_results(
+            baseline, results, args.max_regression
+        ):
+            flag = "  REGRESSION" if slower else ""
+            print(f"{name:<14}{old * 1000:>10.1f} ms -> {new * 1000:.1f} ms  x{ratio:.2f}{flag}")
+            regressed = regressed or slower
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
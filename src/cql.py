@@ -0,0 +1,427 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import chess
+import chess.engine
+
+from pgn_stream import read_game_tail
+from profiling import span
+
+DEFAULT_ENGINES = 2
+DEFAULT_DEPTH = 20
+DEFAULT_SCREEN_DEPTH = 8
+DEFAULT_MIN_GAP = 200
+DEFAULT_MIN_PLY = 10
+MATE_SCORE = 100000
+DEFAULT_REPORT_INTERVAL = 5.0
+
+_DONE = object()
+
+
+class ScanCheckpoint:
+    """
+    Resumable state of a cql scan, persisted as JSON.
+
+    `offset` is the position in the PGN file up to which every game has been
+    fully analysed and reviewed. `params` identifies the scan so a checkpoint
+    is never resumed against a different file or query.
+    """
+
+    def __init__(self, path, params, offset=0, puzzles=None, comments=None, rejected=None):
+        self.path = Path(path)
+        self.params = params
+        self.offset = offset
+        self.puzzles = puzzles if puzzles is not None else []
+        self.comments = comments if comments is not None else []
+        self.rejected = rejected if rejected is not None else []
+
+    @classmethod
+    def load(cls, path, params):
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"Checkpoint not found at {path}")
+        data = json.loads(path.read_text())
+        if data.get("params") != params:
+            raise ValueError(f"Checkpoint {path} was written for a different scan.")
+        return cls(
+            path,
+            params,
+            offset=data["offset"],
+            puzzles=data["puzzles"],
+            comments=data["comments"],
+            rejected=data["rejected"],
+        )
+
+    def save(self):
+        data = {
+            "params": self.params,
+            "offset": self.offset,
+            "puzzles": self.puzzles,
+            "comments": self.comments,
+            "rejected": self.rejected,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data, indent=2))
+        os.replace(tmp_path, self.path)
+
+
+class _ScanProgress:
+    """
+    Throughput counters and the committed file offset of a running scan.
+
+    Games are numbered as they are parsed. A game is complete once each of its
+    positions has been analysed and, if it became a candidate, reviewed; the
+    offset only advances past a contiguous run of complete games.
+    """
+
+    def __init__(self, offset=0):
+        self.offset = offset
+        self.games = 0
+        self.analysed = 0
+        self.candidates = 0
+        self.reviewing = False
+        self.started = time.monotonic()
+        self._pending = {}
+        self._next_game = 0
+
+    def add_game(self, game_index, end_offset, positions):
+        self.games += 1
+        self._pending[game_index] = [positions, end_offset]
+        self._advance()
+
+    def finish_position(self, game_index):
+        self._pending[game_index][0] -= 1
+        self._advance()
+
+    def _advance(self):
+        while self._pending.get(self._next_game, [None])[0] == 0:
+            self.offset = self._pending.pop(self._next_game)[1]
+            self._next_game += 1
+
+    def status(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"{self.games} games ({self.games / elapsed:.1f}/s), "
+            f"{self.analysed} positions analysed ({self.analysed / elapsed:.1f}/s), "
+            f"{self.candidates} candidates"
+        )
+
+
+def _read_game(pgn, tail_depth):
+    with span("parse_game", exclude_input=False) as stage:
+        game = read_game_tail(pgn, tail_depth)
+        stage.add_items(game is not None)
+    return game, pgn.tell()
+
+
+def _run_in_thread(func, *args):
+    """
+    Run a blocking call in a daemon thread and return a future for its result.
+
+    Unlike the default executor, an interrupted scan does not wait for a
+    reviewer prompt that will never be answered.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(result, error):
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run():
+        result = error = None
+        try:
+            result = func(*args)
+        except Exception as exc:
+            error = exc
+        try:
+            loop.call_soon_threadsafe(resolve, result, error)
+        except RuntimeError:
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+async def _produce_positions(pgn, tail_depth, select_positions, positions, engines, progress):
+    """
+    Parse games ahead of the engines and queue the positions to analyse.
+    """
+    loop = asyncio.get_running_loop()
+    error = None
+    game_index = 0
+    try:
+        while True:
+            game, end_offset = await loop.run_in_executor(None, _read_game, pgn, tail_depth)
+            if game is None:
+                break
+            boards = list(select_positions(game))
+            progress.add_game(game_index, end_offset, len(boards))
+            for board in boards:
+                await positions.put((board, game.headers, game_index))
+            game_index += 1
+    except Exception as exc:
+        error = exc
+    for _ in range(engines):
+        await positions.put(_DONE)
+    if error is not None:
+        raise error
+
+
+async def _analyse_positions(engine_path, is_candidate, positions, candidates, progress, track):
+    """
+    Analyse queued positions with one engine and queue the candidates.
+
+    `track` names the engine in profiles.
+    """
+    transport = engine = None
+    try:
+        transport, engine = await chess.engine.popen_uci(engine_path)
+        while True:
+            item = await positions.get()
+            if item is _DONE:
+                break
+            board, headers, game_index = item
+            with span("stockfish", track=track, exclude_input=False) as stage:
+                found = await is_candidate(engine, board)
+                stage.add_items(1)
+            progress.analysed += 1
+            if found:
+                progress.candidates += 1
+                await candidates.put(item)
+            else:
+                progress.finish_position(game_index)
+    finally:
+        await candidates.put(_DONE)
+        if engine is not None:
+            try:
+                await asyncio.wait_for(engine.quit(), timeout=5)
+            except (asyncio.TimeoutError, chess.engine.EngineError):
+                pass
+            finally:
+                transport.close()
+
+
+async def _report_progress(progress, checkpoint, interval):
+    """
+    Periodically save the checkpoint and print a throughput line.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if checkpoint is not None:
+            checkpoint.offset = progress.offset
+            checkpoint.save()
+        if not progress.reviewing:
+            print(progress.status(), file=sys.stderr, flush=True)
+
+
+async def _scan(
+    pgn,
+    tail_depth,
+    select_positions,
+    is_candidate,
+    num_puzzles,
+    engine_path,
+    review,
+    engines,
+    checkpoint=None,
+    report_interval=DEFAULT_REPORT_INTERVAL,
+):
+    """
+    Run the parse -> analyse -> review pipeline over an open PGN file.
+
+    `select_positions(game)` picks the positions of each game to analyse and
+    `is_candidate(engine, board)` decides which of them reach `review`. When a
+    `checkpoint` is given the scan starts from its offset with its puzzles,
+    and saves it every `report_interval` seconds, after every review and on
+    exit, including on interruption.
+    """
+    if checkpoint is None:
+        puzzles, comments, seen = [], [], set()
+        progress = _ScanProgress(pgn.tell())
+    else:
+        puzzles, comments = checkpoint.puzzles, checkpoint.comments
+        seen = set(puzzles) | set(checkpoint.rejected)
+        pgn.seek(checkpoint.offset)
+        progress = _ScanProgress(checkpoint.offset)
+
+    positions = asyncio.Queue(maxsize=engines * 2)
+    candidates = asyncio.Queue()
+
+    tasks = [
+        asyncio.create_task(
+            _produce_positions(pgn, tail_depth, select_positions, positions, engines, progress)
+        ),
+        asyncio.create_task(_report_progress(progress, checkpoint, report_interval)),
+    ]
+    for index in range(engines):
+        tasks.append(
+            asyncio.create_task(
+                _analyse_positions(
+                    engine_path,
+                    is_candidate,
+                    positions,
+                    candidates,
+                    progress,
+                    track=f"engine {index + 1}",
+                )
+            )
+        )
+
+    finished = 0
+    try:
+        while len(puzzles) < num_puzzles and finished < engines:
+            item = await candidates.get()
+            if item is _DONE:
+                finished += 1
+                continue
+            board, headers, game_index = item
+            fen = board.fen()
+            if fen not in seen:
+                seen.add(fen)
+                progress.reviewing = True
+                try:
+                    comment = await _run_in_thread(review, board, headers)
+                finally:
+                    progress.reviewing = False
+                if comment is None:
+                    if checkpoint is not None:
+                        checkpoint.rejected.append(fen)
+                else:
+                    puzzles.append(fen)
+                    comments.append(comment)
+            progress.finish_position(game_index)
+            if checkpoint is not None:
+                checkpoint.offset = progress.offset
+                checkpoint.save()
+    finally:
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if checkpoint is not None:
+            checkpoint.offset = progress.offset
+            checkpoint.save()
+        print(progress.status(), file=sys.stderr, flush=True)
+    for result in results:
+        if isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError):
+            raise result
+    return puzzles, comments
+
+
+async def scan_for_mates(
+    pgn,
+    mate_in_n,
+    num_puzzles,
+    engine_path,
+    review,
+    engines=DEFAULT_ENGINES,
+    depth=DEFAULT_DEPTH,
+    checkpoint=None,
+):
+    """
+    Find mate-in-N positions in an open PGN file.
+
+    Games are parsed ahead of the engines, `engines` analyses run concurrently
+    and confirmed candidates are queued for `review`, which is called with
+    `(board, headers)` in a worker thread and returns a comment, or None to
+    reject the position. Candidates are reviewed in the order their analysis
+    finishes, not in file order, and a position is only ever reviewed once.
+    """
+
+    def select_positions(game):
+        if game.plies < mate_in_n + 1:
+            return []
+        return [game.position(mate_in_n + 1)]
+
+    async def is_candidate(engine, board):
+        info = await engine.analyse(board, chess.engine.Limit(depth=depth))
+        score = info.get("score")
+        return bool(score and score.is_mate() and score.pov(board.turn).mate() == mate_in_n)
+
+    return await _scan(
+        pgn,
+        mate_in_n + 1,
+        select_positions,
+        is_candidate,
+        num_puzzles,
+        engine_path,
+        review,
+        engines,
+        checkpoint=checkpoint,
+    )
+
+
+def is_unique_win(infos, turn, min_gap=DEFAULT_MIN_GAP):
+    """
+    Check whether the best line of a two-line analysis is uniquely winning.
+
+    The best line must either mate while the second does not, or be winning by
+    at least `min_gap` centipawns and ahead of the second line by as much.
+    """
+    if len(infos) < 2 or "score" not in infos[0] or "score" not in infos[1]:
+        return False
+    best = infos[0]["score"].pov(turn)
+    second = infos[1]["score"].pov(turn)
+    if best.is_mate():
+        return best.mate() > 0 and not (second.is_mate() and second.mate() > 0)
+    best_cp = best.score(mate_score=MATE_SCORE)
+    second_cp = second.score(mate_score=MATE_SCORE)
+    return best_cp >= min_gap and best_cp - second_cp >= min_gap
+
+
+async def scan_for_tactics(
+    pgn,
+    num_puzzles,
+    engine_path,
+    review,
+    engines=DEFAULT_ENGINES,
+    screen_depth=DEFAULT_SCREEN_DEPTH,
+    depth=DEFAULT_DEPTH,
+    min_gap=DEFAULT_MIN_GAP,
+    min_ply=DEFAULT_MIN_PLY,
+    checkpoint=None,
+):
+    """
+    Mine every position of every game in an open PGN file for tactics.
+
+    Each position from ply `min_ply` on is screened with a shallow two-line
+    search; only positions where the best move looks uniquely winning are
+    verified at full `depth` before being queued for `review`.
+    """
+
+    def select_positions(game):
+        for board in game.positions():
+            if board.ply() < min_ply:
+                continue
+            if board.is_game_over() or board.legal_moves.count() < 2:
+                continue
+            yield board
+
+    async def is_candidate(engine, board):
+        infos = await engine.analyse(board, chess.engine.Limit(depth=screen_depth), multipv=2)
+        if not is_unique_win(infos, board.turn, min_gap):
+            return False
+        infos = await engine.analyse(board, chess.engine.Limit(depth=depth), multipv=2)
+        return is_unique_win(infos, board.turn, min_gap)
+
+    return await _scan(
+        pgn,
+        None,
+        select_positions,
+        is_candidate,
+        num_puzzles,
+        engine_path,
+        review,
+        engines,
+        checkpoint=checkpoint,
+    )
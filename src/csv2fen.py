@@ -1,39 +1,92 @@
 import csv
 import argparse
+import io
+import re
 
+import chess.pgn
 
-def extract_game_info(input_file, output_file):
-    with open(input_file, "r") as file:
-        data = file.read()
+from pgn_input import BinaryInput, decode_text
+from pgn_splitter import iter_games
 
-    items = data.split("\n\n\n")
+FIELDS = ["Event", "Date", "White", "Black", "Result", "FEN"]
+PUZZLE_FIELDS = ["PuzzleFEN", "SolutionMoves"]
+TAG_REGEX = re.compile(r'^\[([A-Za-z0-9_]+)\s+"(.*)"\]\s*$')
 
-    # Prepare the CSV file
-    csv_file = open(output_file, "w", newline="")
-    csv_writer = csv.writer(csv_file)
 
-    csv_writer.writerow(["Event", "Date", "White", "Black", "Result", "FEN", "Solution"])
+def parse_tags(game_text):
+    """
+    Split a game into its header tags and movetext in a single pass.
+    """
+    tags = {}
+    lines = game_text.splitlines()
+    index = 0
+    while index < len(lines):
+        line = lines[index].strip()
+        if line:
+            match = TAG_REGEX.match(line)
+            if not match:
+                break
+            tags.setdefault(match.group(1), match.group(2))
+        index += 1
+    return tags, "\n".join(lines[index:])
+
+
+def _puzzle_columns(game_text):
+    """
+    Return the position after the first mainline move and the remaining moves in UCI.
+    """
+    game = chess.pgn.read_game(io.StringIO(game_text))
+    if game is None:
+        return ["", ""]
+    board = game.board()
+    moves = list(game.mainline_moves())
+    if moves:
+        board.push(moves[0])
+    return [board.fen(), " ".join(move.uci() for move in moves[1:])]
+
+
+def iter_game_rows(input_file, puzzle_columns=False):
+    """
+    Yield one CSV row per game of a (possibly compressed) PGN file.
+    """
+    with BinaryInput(input_file) as handle:
+        for game in iter_games(handle):
+            game_text = decode_text(game)
+            tags, movetext = parse_tags(game_text)
+            row = [tags.get(field, "") for field in FIELDS]
+
+            solution = ""
+            if "{" in movetext:
+                solution = movetext.split("{", 1)[1].strip()
+            row.append(solution)
+
+            if puzzle_columns:
+                row.extend(_puzzle_columns(game_text))
+            yield row
 
-    for item in items:
-        fields = ["Event", "Date", "White", "Black", "Result", "FEN"]
-        row = []
-        for field in fields:
-            try:
-                value = item.split(f'[{field} "')[1].split('"]')[0]
-            except IndexError:
-                value = ""
-            row.append(value)
 
-        solution = ""
-        if "{" in item:
-            solution = item.split("{", 1)[1].strip()
-        row.append(solution)
+def extract_game_info(input_file, output_file, puzzle_columns=False):
+    """
+    Write the header tags and solution comment of every game to a CSV file.
+
+    Games are streamed one at a time, so the input can be larger than memory.
+    With `puzzle_columns` the position after the first move and the rest of
+    the mainline in UCI are added, in the same form as the Lichess puzzle DB.
 
-        # Write the extracted information as a row in the CSV file
-        csv_writer.writerow(row)
+    :returns: The number of games written.
+    """
+    header = FIELDS + ["Solution"]
+    if puzzle_columns:
+        header += PUZZLE_FIELDS
 
-    # Close the CSV file
-    csv_file.close()
+    count = 0
+    with open(output_file, "w", newline="") as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(header)
+        for row in iter_game_rows(input_file, puzzle_columns=puzzle_columns):
+            csv_writer.writerow(row)
+            count += 1
+    return count
 
 
 def main():
@@ -46,9 +99,15 @@ def main():
     )
     parser.add_argument("input_file", type=str, help="PGN file to extract game information from.")
     parser.add_argument("output_file", type=str, help="CSV file to save game information to.")
+    parser.add_argument(
+        "--puzzle-columns",
+        action="store_true",
+        help="Also write the FEN after the first move and the solution line in UCI.",
+    )
     args = parser.parse_args()
 
-    extract_game_info(args.input_file, args.output_file)
+    count = extract_game_info(args.input_file, args.output_file, args.puzzle_columns)
+    print(f"Wrote {count} games to {args.output_file}")
 
 
 if __name__ == "__main__":
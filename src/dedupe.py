@@ -0,0 +1,156 @@
+import argparse
+import csv
+
+import chess
+import chess.polyglot
+
+from pgn_input import TextInput, uncompressed_name
+
+
+def position_key(board):
+    """
+    Zobrist hash of a position, given as a board or a FEN.
+
+    The halfmove clock and move number are ignored, and an en passant square
+    only counts when an en passant capture is actually possible, so the same
+    position recorded at different points of a game gets the same key.
+    """
+    if not isinstance(board, chess.Board):
+        board = chess.Board(board)
+    return chess.polyglot.zobrist_hash(board)
+
+
+class PositionSet:
+    """
+    Set of positions keyed by `position_key`.
+    """
+
+    def __init__(self, fens=()):
+        self._keys = set()
+        for fen in fens:
+            self.add(fen)
+
+    def add(self, board):
+        """
+        Add a position and return True if it was not already in the set.
+        """
+        key = position_key(board)
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        return True
+
+    def __contains__(self, board):
+        return position_key(board) in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def _is_csv(path):
+    return uncompressed_name(path).suffix.lower() == ".csv"
+
+
+def _fen_index(header):
+    names = [str(name).strip().lower() for name in header]
+    if "fen" not in names:
+        raise ValueError("CSV must include a FEN column.")
+    return names.index("fen")
+
+
+def iter_fen_records(path):
+    """
+    Yield `(fen, record)` pairs from a text file with one FEN per line or a CSV
+    with a FEN column. `record` is the raw line or CSV row; the first item
+    yielded for a CSV is `(None, header)`.
+    """
+    with TextInput(path) as handle:
+        if not _is_csv(path):
+            for line in handle:
+                fen = line.strip()
+                if fen:
+                    yield fen, line.rstrip("\r\n")
+            return
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield None, header
+        fen_index = _fen_index(header)
+        for row in reader:
+            if len(row) > fen_index and row[fen_index].strip():
+                yield row[fen_index].strip(), row
+
+
+def read_fens(path):
+    """
+    Yield the FENs of a text or CSV collection.
+    """
+    for fen, _ in iter_fen_records(path):
+        if fen is not None:
+            yield fen
+
+
+def dedupe_files(input_paths, output_path):
+    """
+    Copy FEN collections to `output_path`, dropping repeated positions.
+
+    All inputs must be text files or all CSVs with the same header. Rows whose
+    FEN cannot be parsed are dropped as well.
+
+    :returns: The number of records read, written and dropped as invalid.
+    """
+    if len({_is_csv(path) for path in input_paths}) > 1:
+        raise ValueError("Inputs must be all text files or all CSV files.")
+    as_csv = _is_csv(input_paths[0])
+
+    seen = PositionSet()
+    read = written = invalid = 0
+    header = None
+    with open(output_path, "w", newline="") as out:
+        writer = csv.writer(out) if as_csv else None
+        for path in input_paths:
+            for fen, record in iter_fen_records(path):
+                if fen is None:
+                    if header is None:
+                        header = record
+                        writer.writerow(header)
+                    elif record != header:
+                        raise ValueError(f"CSV header of {path} does not match {input_paths[0]}.")
+                    continue
+                read += 1
+                try:
+                    is_new = seen.add(fen)
+                except ValueError:
+                    invalid += 1
+                    continue
+                if not is_new:
+                    continue
+                if as_csv:
+                    writer.writerow(record)
+                else:
+                    out.write(record + "\n")
+                written += 1
+    return read, written, invalid
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove repeated positions from FEN collections (text or CSV)."
+    )
+    parser.add_argument("inputs", nargs="+", help="Text files with one FEN per line, or CSVs.")
+    parser.add_argument("--out", required=True, help="Output file, in the format of the inputs.")
+    args = parser.parse_args()
+
+    try:
+        read, written, invalid = dedupe_files(args.inputs, args.out)
+    except (FileNotFoundError, ValueError) as exc:
+        raise SystemExit(str(exc))
+
+    print(f"Read {read} positions, wrote {written} unique positions to {args.out}")
+    if invalid:
+        print(f"Skipped {invalid} invalid FENs")
+
+
+if __name__ == "__main__":
+    main()
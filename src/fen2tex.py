@@ -3,41 +3,171 @@ import os
 import shutil
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-import chess
-import chess.svg
-from PIL import Image, ImageDraw
-from cairosvg import svg2png
+from profiling import prompt, span
 
 current_year = datetime.now().year
 
+# Width and height of each board on the sheet
+BOARD_SIZE_CM = 7
+INCLUDE_BOARD = rf"\includegraphics[width={BOARD_SIZE_CM}cm, height={BOARD_SIZE_CM}cm]{{"
+# Size of the board drawn by chess.svg, which the side-to-move marker is placed in
+SVG_BOARD_SIZE = 390
 
-def fen2png(fen_string, img_name):
+# How fen2png saves boards: the resolution at the size the board is printed
+# on the sheet (None keeps cairosvg's 390px), the size of the palette (None
+# keeps full colour with transparency), whether the palette is grey levels,
+# and whether to spend longer compressing. Images without transparency are
+# embedded by pdflatex without a separate mask to decode. The default,
+# screen, is close to the old 390px (141 DPI at 7cm); print and grayscale
+# have about 4.5 times as many pixels, for sharper printed sheets.
+IMAGE_PROFILES = {
+    "full": {"dpi": None, "colors": None, "grayscale": False, "optimize": False},
+    "print": {"dpi": 300, "colors": 64, "grayscale": False, "optimize": True},
+    "screen": {"dpi": 150, "colors": 64, "grayscale": False, "optimize": True},
+    "grayscale": {"dpi": 300, "colors": 16, "grayscale": True, "optimize": True},
+}
+DEFAULT_IMAGE_PROFILE = "screen"
+
+
+def board_pixels(dpi):
+    """
+    Width in pixels of a board printed at `BOARD_SIZE_CM` with `dpi`.
+    """
+    return round(BOARD_SIZE_CM / 2.54 * dpi)
+
+
+def _image_profile(profile):
+    if profile not in IMAGE_PROFILES:
+        raise ValueError(
+            f"Unknown image profile {profile!r}; use one of {', '.join(IMAGE_PROFILES)}"
+        )
+    return IMAGE_PROFILES[profile]
+
+
+def fen2png(fen_string, img_name, profile=DEFAULT_IMAGE_PROFILE):
     """
-    Convert FEN string to PNG image
+    Convert FEN string to PNG image, saved to a path or binary file object
     E.g: rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR b KQkq - 0 1
+
+    `profile` names the `IMAGE_PROFILES` entry to save the image with.
     """
+    settings = _image_profile(profile)
+    # Imported here so writing the .tex file does not load the image stack
+    import chess
+    import chess.svg
+    from PIL import Image, ImageDraw
+    from cairosvg import svg2png
+
     board = chess.Board(fen=fen_string)
-    svg_board = chess.svg.board(
-        board=board,
-        orientation=board.turn,
-        colors={"margin": "transparent", "coord": "black"},
-    ).encode("UTF-8")
-    png_image = svg2png(bytestring=svg_board)
-    pil_image = Image.open(io.BytesIO(png_image))
+    with span("board_svg"):
+        svg_board = chess.svg.board(
+            board=board,
+            orientation=board.turn,
+            colors={"margin": "transparent", "coord": "black"},
+        ).encode("UTF-8")
+    with span("svg2png"):
+        if settings["dpi"] is None:
+            png_image = svg2png(bytestring=svg_board)
+        else:
+            pixels = board_pixels(settings["dpi"])
+            png_image = svg2png(bytestring=svg_board, output_width=pixels, output_height=pixels)
+
+    with span("save_png"):
+        pil_image = Image.open(io.BytesIO(png_image))
+
+        if board.turn == chess.WHITE:
+            color = (250, 250, 250)
+        else:
+            color = (0, 0, 0)
+
+        scale = pil_image.width / SVG_BOARD_SIZE
+        draw = ImageDraw.Draw(pil_image)
+        coords = [(375, 0), (390, 0), (390, 14), (375, 14)]
+        coords = [(x * scale, y * scale) for x, y in coords]
+        draw.polygon(coords, fill=color, outline="grey", width=max(1, round(3 * scale)))
 
-    if board.turn == chess.WHITE:
-        color = (250, 250, 250)
-    else:
-        color = (0, 0, 0)
+        options = {}
+        if settings["dpi"] is not None:
+            options["dpi"] = (settings["dpi"], settings["dpi"])
+        if settings["colors"] is not None:
+            # Flatten the transparent margin onto the white page
+            background = Image.new("RGB", pil_image.size, "white")
+            pil_image = pil_image.convert("RGBA")
+            background.paste(pil_image, mask=pil_image.getchannel("A"))
+            if settings["grayscale"]:
+                background = background.convert("L")
+            # dither=0: no dithering, which would break up the flat squares
+            pil_image = background.quantize(settings["colors"], dither=0)
+        if settings["optimize"]:
+            options["optimize"] = True
+        pil_image.save(img_name, format="PNG", **options)
 
-    draw = ImageDraw.Draw(pil_image)
-    coords = [(375, 0), (390, 0), (390, 14), (375, 14)]
-    draw.polygon(coords, fill=color, outline="grey", width=3)
 
-    pil_image.save(img_name)
+class RenderWorker:
+    """
+    Render boards with `fen2png` on a background thread as they are accepted,
+    so the images are ready by the time selection ends.
+
+    Boards are rendered to temporary files and `finish` copies them to
+    puzzle_0.png, puzzle_1.png, ... in the final order of the sheet.
+    `profile` names the `IMAGE_PROFILES` entry to render with.
+    """
+
+    def __init__(self, img_dir, profile=DEFAULT_IMAGE_PROFILE):
+        _image_profile(profile)
+        self.img_dir = Path(img_dir)
+        self.profile = profile
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+        self._renders = {}
+
+    def _render(self, fen, path):
+        with span("render_board", exclude_input=False) as stage:
+            fen2png(fen, str(path), profile=self.profile)
+            stage.add_items(1)
+        return path
+
+    def submit(self, fen):
+        """
+        Start rendering `fen` unless it is already rendered or queued.
+        """
+        if fen not in self._renders:
+            path = self.img_dir / f".render_{len(self._renders)}.png"
+            self._renders[fen] = self._executor.submit(self._render, fen, path)
+
+    def finish(self, puzzles):
+        """
+        Wait for the renders and write one image per puzzle, in order.
+        """
+        for fen in puzzles:
+            self.submit(fen)
+        paths = []
+        for idx, fen in enumerate(puzzles):
+            path = self.img_dir / f"puzzle_{idx}.png"
+            shutil.copyfile(self._renders[fen].result(), path)
+            paths.append(path)
+        return paths
+
+    def close(self):
+        """
+        Stop rendering and remove the temporary files.
+        """
+        for future in self._renders.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        for future in self._renders.values():
+            if not future.cancelled() and future.exception() is None:
+                future.result().unlink(missing_ok=True)
+        self._renders.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 def _puzzle_index(path_obj):
@@ -47,6 +177,27 @@ def _puzzle_index(path_obj):
         return 0
 
 
+def compile_pdf(tex_path, interactive=True):
+    """
+    Run pdflatex on a .tex file, writing the PDF alongside it.
+
+    With `interactive=False` pdflatex neither prints nor stops on errors, so
+    several files can be compiled at once.
+    """
+    tex_path = Path(tex_path)
+    command = ["pdflatex", tex_path.name]
+    if not interactive:
+        command.insert(1, "-interaction=batchmode")
+    with span("pdflatex"):
+        subprocess.run(
+            command,
+            cwd=tex_path.parent,
+            check=False,
+            stdin=None if interactive else subprocess.DEVNULL,
+        )
+    return tex_path.with_suffix(".pdf")
+
+
 def fen2tex(
     tex_file_name,
     img_dir,
@@ -73,11 +224,11 @@ def fen2tex(
         raise FileNotFoundError(f"Image directory not found: {img_dir}")
 
     if title is None:
-        title = input("Enter a title for the puzzle sheet: ")
+        title = prompt("Enter a title for the puzzle sheet: ")
     if squad is None:
-        squad = input("Enter the squad name: ")
+        squad = prompt("Enter the squad name: ")
     if blurb is None:
-        blurb = input("Enter a blurb for the puzzle sheet: ")
+        blurb = prompt("Enter a blurb for the puzzle sheet: ")
     if author is None:
         author = ""
 
@@ -91,7 +242,8 @@ def fen2tex(
     if not image_paths:
         raise FileNotFoundError(f"No puzzle images found in {img_dir}")
 
-    with tex_path.open("w") as f:
+    with span("write_tex") as stage, tex_path.open("w") as f:
+        stage.add_items(len(image_paths))
         f.write(
             r"""\documentclass[12pt]{article}
                     \usepackage[english]{babel}
@@ -162,7 +314,7 @@ def fen2tex(
                     + "\n"
                     + r"\centering"
                     + "\n"
-                    + r"\includegraphics[width=7cm, height=7cm]{"
+                    + INCLUDE_BOARD
                     + img_ref
                     + r"}"
                     + r"\caption*{"
@@ -180,7 +332,7 @@ def fen2tex(
                     + "\n"
                     + r"\centering"
                     + "\n"
-                    + r"\includegraphics[width=7cm, height=7cm]{"
+                    + INCLUDE_BOARD
                     + img_ref
                     + r"}"
                     + r"\caption*{"
@@ -198,7 +350,7 @@ def fen2tex(
                     + "\n"
                     + r"\centering"
                     + "\n"
-                    + r"\includegraphics[width=7cm, height=7cm]{"
+                    + INCLUDE_BOARD
                     + img_ref
                     + r"}"
                     + r"\caption*{"
@@ -216,7 +368,7 @@ def fen2tex(
                     + "\n"
                     + r"\centering"
                     + "\n"
-                    + r"\includegraphics[width=7cm, height=7cm]{"
+                    + INCLUDE_BOARD
                     + img_ref
                     + r"}"
                     + r"\caption*{"
@@ -238,7 +390,7 @@ def fen2tex(
                     + "\n"
                     + r"\centering"
                     + "\n"
-                    + r"\includegraphics[width=7cm, height=7cm]{"
+                    + INCLUDE_BOARD
                     + img_ref
                     + r"}"
                     + r"\caption*{"
@@ -256,7 +408,7 @@ def fen2tex(
                     + "\n"
                     + r"\centering"
                     + "\n"
-                    + r"\includegraphics[width=7cm, height=7cm]{"
+                    + INCLUDE_BOARD
                     + img_ref
                     + r"}"
                     + r"\caption*{"
@@ -279,7 +431,7 @@ def fen2tex(
         if shutil.which("pdflatex") is None:
             print("pdflatex not found; skipping PDF generation.")
         else:
-            subprocess.run(["pdflatex", tex_path.name], cwd=output_dir, check=False)
+            compile_pdf(tex_path)
 
     if open_pdf and pdf_file_path.exists():
         if sys.platform == "darwin":
@@ -1,10 +1,18 @@
 import argparse
 import csv
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
 from pathlib import Path
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DEFAULT_LICHESS_DB = ROOT_DIR / "data/lichess_db_puzzle.csv"
 DEFAULT_OUT = ROOT_DIR / "data/themes-unique.txt"
+RATING_BIN_WIDTH = 100
+# Below this size a single process is faster than starting workers.
+MIN_PARALLEL_BYTES = 8 * 1024 * 1024
 
 
 def iter_themes(csv_path):
@@ -28,6 +36,172 @@ def extract_unique_themes(csv_path):
     return sorted(set(iter_themes(csv_path)))
 
 
+class ThemeStats:
+    """
+    Per-theme puzzle counts, theme co-occurrence and rating histograms.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.counts = Counter()
+        self.cooccurrence = Counter()
+        self.ratings = Counter()
+
+    def add_row(self, row):
+        if not row or row[0] == "PuzzleId" or len(row) <= 7:
+            return
+        self.rows += 1
+        themes = sorted(set(row[7].split()))
+        try:
+            rating_bin = int(row[3]) // RATING_BIN_WIDTH * RATING_BIN_WIDTH
+        except ValueError:
+            rating_bin = None
+        for theme in themes:
+            self.counts[theme] += 1
+            if rating_bin is not None:
+                self.ratings[(theme, rating_bin)] += 1
+        for pair in combinations(themes, 2):
+            self.cooccurrence[pair] += 1
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.counts.update(other.counts)
+        self.cooccurrence.update(other.cooccurrence)
+        self.ratings.update(other.ratings)
+        return self
+
+    def themes(self):
+        return sorted(self.counts)
+
+    def matches(self, themes):
+        """
+        Number of puzzles tagged with all of `themes`.
+
+        Exact for one or two themes; for more it is an upper bound, the
+        smallest pairwise co-occurrence.
+        """
+        themes = sorted(set(themes))
+        if not themes:
+            return self.rows
+        if len(themes) == 1:
+            return self.counts.get(themes[0], 0)
+        return min(self.cooccurrence.get(pair, 0) for pair in combinations(themes, 2))
+
+    def to_dict(self):
+        cooccurrence = {}
+        for (first, second), count in sorted(self.cooccurrence.items()):
+            cooccurrence.setdefault(first, {})[second] = count
+        ratings = {}
+        for (theme, rating_bin), count in sorted(self.ratings.items()):
+            ratings.setdefault(theme, {})[str(rating_bin)] = count
+        return {
+            "rows": self.rows,
+            "counts": dict(sorted(self.counts.items())),
+            "cooccurrence": cooccurrence,
+            "rating_bin_width": RATING_BIN_WIDTH,
+            "ratings": ratings,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.rows = data["rows"]
+        stats.counts.update(data["counts"])
+        for first, others in data["cooccurrence"].items():
+            for second, count in others.items():
+                stats.cooccurrence[(first, second)] = count
+        for theme, bins in data["ratings"].items():
+            for rating_bin, count in bins.items():
+                stats.ratings[(theme, int(rating_bin))] = count
+        return stats
+
+
+def stats_path_for(themes_path):
+    """
+    The statistics file saved alongside a themes file: themes-unique-stats.json.
+    """
+    themes_path = Path(themes_path)
+    return themes_path.with_name(f"{themes_path.stem}-stats.json")
+
+
+def load_theme_stats(themes_path):
+    """
+    Load the statistics saved alongside `themes_path`, or None if there are none.
+    """
+    if themes_path is None:
+        return None
+    stats_path = stats_path_for(themes_path)
+    if not stats_path.exists():
+        return None
+    return ThemeStats.from_dict(json.loads(stats_path.read_text()))
+
+
+def iter_rows_in_range(csv_path, start, end):
+    """
+    Yield the CSV rows that start within bytes [start, end) of a file, so that
+    consecutive ranges together read every row exactly once.
+    """
+    with open(csv_path, "rb") as handle:
+        position = start
+        if start > 0:
+            # Skip the row that straddles the boundary; its owner reads it.
+            handle.seek(start - 1)
+            position = start - 1 + len(handle.readline())
+
+        def lines():
+            nonlocal position
+            while position < end:
+                line = handle.readline()
+                if not line:
+                    return
+                position += len(line)
+                yield line.decode("utf-8", errors="replace")
+
+        yield from csv.reader(lines())
+
+
+def _scan_range(csv_path, start, end):
+    """
+    Collect statistics for the rows that start within bytes [start, end).
+    """
+    stats = ThemeStats()
+    for row in iter_rows_in_range(csv_path, start, end):
+        stats.add_row(row)
+    return stats
+
+
+def compute_theme_stats(csv_path, workers=None):
+    """
+    Compute theme statistics in one pass, split by byte range across processes.
+    """
+    size = os.path.getsize(csv_path)
+    workers = workers or os.cpu_count() or 1
+    if size < MIN_PARALLEL_BYTES:
+        workers = 1
+    if workers == 1:
+        return _scan_range(csv_path, 0, size)
+
+    bounds = [size * i // workers for i in range(workers + 1)]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+
+    stats = ThemeStats()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_scan_range, csv_path, start, end) for start, end in ranges]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+
+def format_theme_counts(stats):
+    """
+    One line per theme, most common first.
+    """
+    width = max((len(theme) for theme in stats.counts), default=0)
+    return "\n".join(
+        f"{theme:<{width}}  {count}" for theme, count in stats.counts.most_common()
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Extract unique themes from the Lichess puzzle database."
@@ -47,7 +221,12 @@ def main():
     parser.add_argument(
         "--print",
         action="store_true",
-        help="Print themes to stdout in addition to writing the file.",
+        help="Print themes and their puzzle counts to stdout in addition to writing the file.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes (defaults to the number of CPUs).",
     )
     args = parser.parse_args()
 
@@ -55,16 +234,19 @@ def main():
     if not csv_path.exists():
         raise SystemExit(f"Lichess DB not found at {csv_path}")
 
-    themes = extract_unique_themes(csv_path)
+    stats = compute_theme_stats(csv_path, workers=args.workers)
+    themes = stats.themes()
     out_path = Path(args.out)
     out_path.parent.mkdir(parents=True, exist_ok=True)
     out_path.write_text("\n".join(themes) + "\n")
+    stats_path = stats_path_for(out_path)
+    stats_path.write_text(json.dumps(stats.to_dict()))
 
     if args.print:
-        for theme in themes:
-            print(theme)
+        print(format_theme_counts(stats))
 
     print(f"Wrote {len(themes)} themes to {out_path}")
+    print(f"Wrote statistics for {stats.rows} puzzles to {stats_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+"""
+Random access to the lines of large text and CSV files.
+
+`LineIndex` memory-maps a file and keeps the byte offset of every line, so
+any line can be read in O(1) without loading the file. The offsets are
+saved in a sidecar file next to the source (`puzzles.txt` ->
+`puzzles.txt.lineidx`) and reused until the source's size or modification
+time changes. When the sidecar cannot be written the index is kept in
+memory only.
+"""
+import csv
+import mmap
+import os
+import struct
+from array import array
+from pathlib import Path
+
+from pgn_input import decode_text
+
+SIDECAR_SUFFIX = ".lineidx"
+_MAGIC = b"WZLIDX01"
+# magic, source size, source mtime in ns, number of lines
+_HEADER = struct.Struct("<8sQQQ")
+_CHUNK_SIZE = 1 << 20
+
+
+def sidecar_path(path):
+    path = Path(path)
+    return path.with_name(path.name + SIDECAR_SUFFIX)
+
+
+def _scan_offsets(mm):
+    """
+    Byte offsets of the start of every line.
+    """
+    offsets = array("Q")
+    size = len(mm)
+    if size == 0:
+        return offsets
+    offsets.append(0)
+    for start in range(0, size, _CHUNK_SIZE):
+        chunk = mm[start : start + _CHUNK_SIZE]
+        position = chunk.find(b"\n")
+        while position != -1:
+            offsets.append(start + position + 1)
+            position = chunk.find(b"\n", position + 1)
+    if offsets[-1] == size:
+        # The file ends with a newline; no line starts there
+        offsets.pop()
+    return offsets
+
+
+def random_order(rng, count):
+    """
+    Yield 0 .. count - 1 in random order, each once.
+
+    This is a Fisher-Yates shuffle done lazily, so drawing k numbers costs
+    O(k) time and memory however large `count` is.
+    """
+    swapped = {}
+    for low in range(count):
+        pick = rng.randrange(low, count)
+        yield swapped.get(pick, pick)
+        swapped[pick] = swapped.pop(low, low)
+
+
+def _read_sidecar(path, stat):
+    try:
+        with open(path, "rb") as handle:
+            magic, size, mtime_ns, count = _HEADER.unpack(handle.read(_HEADER.size))
+            if magic != _MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                return None
+            offsets = array("Q")
+            offsets.fromfile(handle, count)
+            return offsets
+    except (OSError, EOFError, struct.error):
+        return None
+
+
+def _write_sidecar(path, stat, offsets):
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as handle:
+            handle.write(_HEADER.pack(_MAGIC, stat.st_size, stat.st_mtime_ns, len(offsets)))
+            offsets.tofile(handle)
+        os.replace(tmp_path, path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+
+class LineIndex:
+    """
+    The lines of a file, read through a memory map by line number.
+
+    Lines are returned without their line ending, decoded as UTF-8 or, when
+    that fails, Latin-1. Use as a context manager to release the map.
+    """
+
+    def __init__(self, path, use_sidecar=True):
+        self.path = Path(path)
+        stat = self.path.stat()
+        self._file = open(self.path, "rb")
+        self._mm = None
+        if stat.st_size:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = stat.st_size
+        self.offsets = None
+        if use_sidecar:
+            self.offsets = _read_sidecar(sidecar_path(self.path), stat)
+        if self.offsets is None:
+            self.offsets = _scan_offsets(self._mm) if self._mm is not None else array("Q")
+            if use_sidecar and self.offsets:
+                _write_sidecar(sidecar_path(self.path), stat, self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def raw(self, number):
+        """
+        The bytes of line `number`, without the line ending.
+        """
+        if number < 0:
+            number += len(self.offsets)
+        start = self.offsets[number]
+        end = self.offsets[number + 1] if number + 1 < len(self.offsets) else self.size
+        line = self._mm[start:end]
+        return line.rstrip(b"\r\n")
+
+    def __getitem__(self, number):
+        return decode_text(self.raw(number))
+
+    def __iter__(self):
+        for number in range(len(self.offsets)):
+            yield self[number]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvLines:
+    """
+    The rows of a CSV file with a header, as dicts, read through a `LineIndex`.
+
+    Rows are physical lines, so quoted fields must not contain line breaks.
+    Row 0 is the first row after the header.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        header_line = lines[0].lstrip("\ufeff") if len(lines) else ""
+        self.header = next(csv.reader([header_line]), [])
+
+    def __len__(self):
+        return max(0, len(self.lines) - 1)
+
+    def __getitem__(self, number):
+        values = next(csv.reader([self.lines[number + 1]]), [])
+        return dict(zip(self.header, values))
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self[number]
+
+
+class FenColumn:
+    """
+    The FEN column of a `CsvLines`, as a sequence of stripped strings.
+    """
+
+    def __init__(self, rows):
+        names = [name.strip().lower() for name in rows.header]
+        if "fen" not in names:
+            raise ValueError("CSV must include a FEN column.")
+        self.rows = rows
+        self.column = rows.header[names.index("fen")]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, number):
+        return self.rows[number].get(self.column, "").strip()
@@ -1,15 +1,15 @@
 import argparse
 import os
+import queue
+import re
+import threading
 from pathlib import Path
-from functools import reduce
-import webbrowser
+from functools import partial, reduce
 
-import pandas as pd
-import chess
-import chess.pgn
-import chess.engine
+from profiling import prompt, span
 
-from fen2tex import fen2tex, fen2png
+# pandas, python-chess, the engine pipeline and the renderers are imported
+# where they are first used, so `--help` and the text medium start quickly.
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DEFAULT_DATA_DIR = ROOT_DIR / "data"
@@ -17,23 +17,29 @@ DEFAULT_OUTPUT_DIR = ROOT_DIR / "output"
 DEFAULT_LICHESS_DB = DEFAULT_DATA_DIR / "lichess_db_puzzle.csv"
 DEFAULT_THEMES_FILE = DEFAULT_DATA_DIR / "themes-unique.txt"
 DEFAULT_STOCKFISH_PATH = os.environ.get("STOCKFISH_PATH")
+DEFAULT_REVIEW_PORT = 8765
+DEFAULT_SERVE_PORT = 8766
+# Candidates drawn ahead of the reviewer in the interactive selection loops.
+PREFETCH_DEPTH = 3
 
 
 def open_puzzle_url(url, open_in_browser=True):
     if open_in_browser:
+        import webbrowser
+
         webbrowser.open_new_tab(url)
     else:
         print(f"URL: {url}")
 
 
 def confirm_browser_open():
-    choice = input("Open browser tabs for puzzles? [Y/n]: ").strip().lower()
+    choice = prompt("Open browser tabs for puzzles? [Y/n]: ").strip().lower()
     return choice in ("", "y", "yes")
 
 
 def validate_choice():
     while True:
-        choice = input("Enter 1 to select this puzzle, 0 to pick another one: ")
+        choice = prompt("Enter 1 to select this puzzle, 0 to pick another one: ")
         if choice == "1" or choice == "0":
             return choice
         else:
@@ -41,7 +47,7 @@ def validate_choice():
 
 
 def prompt_for_comment(puzzle_number):
-    return input(f"Enter a comment for puzzle {puzzle_number}: ")
+    return prompt(f"Enter a comment for puzzle {puzzle_number}: ")
 
 
 def _load_themes(themes_file):
@@ -78,7 +84,13 @@ def print_valid_themes(themes_file=DEFAULT_THEMES_FILE):
     if themes is None:
         print(f"Themes file not found at {themes_file}")
         return
-    print(themes)
+    from lichess_themes import format_theme_counts, load_theme_stats
+
+    stats = load_theme_stats(themes_file)
+    if stats is not None:
+        print(format_theme_counts(stats))
+    else:
+        print("\n".join(themes))
 
 
 def get_puzzle_url(puzzle):
@@ -86,42 +98,279 @@ def get_puzzle_url(puzzle):
     return "https://lichess.org/analysis/" + puzzle_und
 
 
+LICHESS_COLUMNS = [
+    "PuzzleId",
+    "FEN",
+    "Moves",
+    "Rating",
+    "RatingDeviation",
+    "Popularity",
+    "NbPlays",
+    "Themes",
+    "GameUrl",
+    "OpeningTags",
+]
+
+
+def load_lichess_db(lichess_db_path):
+    """
+    Read the Lichess puzzle database into a DataFrame with named columns,
+    leaving out the rows quarantined by `wuzzle-validate`.
+    """
+    import pandas as pd
+
+    with span("read_csv") as stage:
+        df = pd.read_csv(lichess_db_path, header=None)
+        stage.add_items(len(df))
+    if df.shape[1] < len(LICHESS_COLUMNS):
+        raise ValueError("Lichess DB file has an unexpected number of columns.")
+
+    df = df.iloc[:, : len(LICHESS_COLUMNS)]
+    if str(df.iloc[0, 0]) == "PuzzleId":
+        df = df.iloc[1:]
+    df.columns = LICHESS_COLUMNS
+
+    from validate_db import load_quarantine, quarantine_path_for
+
+    quarantined = load_quarantine(lichess_db_path)
+    if quarantined:
+        keep = ~df["PuzzleId"].astype(str).isin(quarantined)
+        print(
+            f"Skipping {len(df) - int(keep.sum())} puzzles listed in "
+            f"{quarantine_path_for(lichess_db_path)}."
+        )
+        df = df[keep]
+    return df
+
+
+def filter_by_themes(df, themes_list):
+    """
+    Keep the puzzles tagged with every theme in `themes_list`. Themes match
+    whole tags, so "mate" does not match mateIn2, as in the serve API and
+    the theme counts.
+    """
+    with span("filter_themes") as stage:
+        stage.add_items(len(df))
+        return reduce(
+            lambda left, right: left[
+                left["Themes"].str.contains(rf"(?:^|\s){re.escape(right)}(?:\s|$)", na=False)
+            ],
+            themes_list,
+            df,
+        )
+
+
+def iter_lichess_candidates(df, seen):
+    """
+    Draw puzzles at random until every row has been drawn, yielding
+    `(row, board)` with the board after the opponent's first move.
+
+    Positions already in `seen` are skipped and every position yielded is
+    added to it. Rows whose FEN or first move cannot be played, as in a
+    database that has not been through wuzzle-validate, are skipped.
+    """
+    import chess
+
+    drawn = set()
+    while len(drawn) < len(df):
+        with span("draw_candidate", exclude_input=False) as stage:
+            row = df.sample(n=1).iloc[0]
+            drawn.add(row.name)
+            stage.add_items(1)
+            try:
+                board = chess.Board(row["FEN"])
+                board.push(chess.Move.from_uci(row["Moves"].split()[0]))
+            except (ValueError, IndexError, AssertionError, AttributeError):
+                continue
+            is_new = seen.add(board)
+        if is_new:
+            yield row, board
+
+
+class _Prefetcher:
+    """
+    Iterate over `iterable` in a background thread, keeping up to `depth`
+    items ready so the reviewer does not wait for each draw.
+
+    Exceptions raised while drawing are re-raised by `next`. Use as a context
+    manager so an abandoned iteration stops the thread.
+    """
+
+    def __init__(self, iterable, depth=PREFETCH_DEPTH):
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._done = False
+        threading.Thread(target=self._fill, args=(iter(iterable),), daemon=True).start()
+
+    def _put(self, entry):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self, iterator):
+        try:
+            for item in iterator:
+                if not self._put((True, item)):
+                    return
+        except Exception as exc:
+            self._put((False, exc))
+            return
+        self._put((False, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        ok, value = self._queue.get()
+        if ok:
+            return value
+        self._done = True
+        if value is not None:
+            raise value
+        raise StopIteration
+
+    def close(self):
+        self._stop.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def review_in_terminal(candidates, n, on_accept=None, open_in_browser=True):
+    """
+    Review candidates one at a time at the terminal, opening each on Lichess.
+
+    `on_accept(fen)` is called as soon as a puzzle is accepted.
+
+    :returns: The accepted FENs, their captions, and whether the candidates
+        ran out first.
+    """
+    puzzles = []
+    comments = []
+    while len(puzzles) < n:
+        candidate = next(candidates, None)
+        if candidate is None:
+            return puzzles, comments, True
+        print(f"Puzzle {len(puzzles) + 1}:")
+        for label, value in candidate.details.items():
+            print(f"{label}: {value}")
+        open_puzzle_url(candidate.url, open_in_browser=open_in_browser)
+        choice = validate_choice()
+        if choice == "1":
+            puzzles.append(candidate.fen)
+            if on_accept is not None:
+                on_accept(candidate.fen)
+            comment = prompt_for_comment(len(puzzles))
+            comments.append(candidate.caption(comment))
+        else:
+            print("Puzzle rejected.")
+    return puzzles, comments, False
+
+
+def _apply_diversity(candidates, on_accept, diversity):
+    """
+    Skip candidates near a puzzle in the `SimilarityIndex` `diversity`, and
+    add each accepted puzzle to it. Positions that cannot be parsed are
+    never near another.
+
+    :returns: The filtered candidates and the wrapped `on_accept`.
+    """
+    if diversity is None:
+        return candidates, on_accept
+
+    def is_near(fen):
+        try:
+            return diversity.is_near(fen)
+        except ValueError:
+            return False
+
+    def diverse():
+        for candidate in candidates:
+            if not is_near(candidate.fen):
+                yield candidate
+
+    def accept(fen):
+        try:
+            diversity.add(fen)
+        except ValueError:
+            pass
+        if on_accept is not None:
+            on_accept(fen)
+
+    return diverse(), accept
+
+
+def _lichess_candidate(row, board):
+    import chess
+    from review_server import Candidate
+
+    solution = [chess_move for chess_move in row["Moves"].split()[1:]]
+    try:
+        solution = board.variation_san([chess.Move.from_uci(move) for move in solution])
+    except ValueError:
+        solution = " ".join(solution)
+    details = {"Themes": row["Themes"], "Rating": str(row["Rating"]), "Solution": solution}
+    return Candidate(board.fen(), row["GameUrl"], details)
+
+
+def _lichess_details(positions, board):
+    """
+    Themes, rating and solution of the Lichess puzzle with the position of
+    `board` (a board or FEN), from the `PositionIndex` `positions`, or an
+    empty dict.
+    """
+    if positions is None:
+        return {}
+    try:
+        return positions.details(board)
+    except ValueError:
+        return {}
+
+
 def get_puzzles_from_lichess(
     theme,
     n=10,
     lichess_db_path=DEFAULT_LICHESS_DB,
     themes_file=DEFAULT_THEMES_FILE,
     open_in_browser=True,
+    seen=None,
+    on_accept=None,
+    reviewer=None,
+    diversity=None,
 ):
     """
     Get n random puzzles with the given theme.
+
+    Positions already in `seen` are skipped and every position shown is added
+    to it, so repeated positions are only reviewed once. The next candidates
+    are drawn in the background while the current one is reviewed, and
+    `on_accept(fen)` is called as soon as a puzzle is accepted. `reviewer`
+    replaces `review_in_terminal`, e.g. with the web review UI. Candidates
+    near a puzzle in the `SimilarityIndex` `diversity` are skipped.
     """
     lichess_db_path = Path(lichess_db_path)
     if not lichess_db_path.exists():
         raise FileNotFoundError(f"Lichess DB not found at {lichess_db_path}")
 
-    df = pd.read_csv(lichess_db_path, header=None)
-    expected_columns = [
-        "PuzzleId",
-        "FEN",
-        "Moves",
-        "Rating",
-        "RatingDeviation",
-        "Popularity",
-        "NbPlays",
-        "Themes",
-        "GameUrl",
-        "OpeningTags",
-    ]
-    if df.shape[1] < len(expected_columns):
-        raise ValueError("Lichess DB file has an unexpected number of columns.")
-
-    df = df.iloc[:, : len(expected_columns)]
-    if str(df.iloc[0, 0]) == "PuzzleId":
-        df = df.iloc[1:]
-    df.columns = expected_columns
+    from dedupe import PositionSet
+    from lichess_themes import load_theme_stats
 
     themes_list = [t.strip() for t in theme.split(",") if t.strip()]
+    stats = load_theme_stats(themes_file)
+    if stats is not None and all(t in stats.counts for t in themes_list):
+        bound = "" if len(themes_list) <= 2 else "At most "
+        print(f"{bound}{stats.matches(themes_list)} puzzles match {', '.join(themes_list)}.")
+
+    df = load_lichess_db(lichess_db_path)
     themes_file = Path(themes_file) if themes_file else None
 
     if themes_list:
@@ -135,42 +384,37 @@ def get_puzzles_from_lichess(
         else:
             print(f"Warning: themes file not found at {themes_file}; skipping validation.")
 
-        df = reduce(
-            lambda left, right: left[left["Themes"].str.contains(right, na=False)],
-            themes_list,
-            df,
-        )
+        df = filter_by_themes(df, themes_list)
 
     if df.empty:
         print("No puzzles found for the selected theme(s).")
         return [], []
 
-    puzzles = []
-    comments = []
-    i = 0
-    while len(puzzles) < n:
-        row = df.sample(n=1).iloc[0]
-        fen = row["FEN"]
-        url = row["GameUrl"]
-        moves = row["Moves"]
-        print(f"Puzzle {i + 1}:")
-        print(row["Themes"])
-        open_puzzle_url(url, open_in_browser=open_in_browser)
-        choice = validate_choice()
-        if choice == "1":
-            board = chess.Board(fen)
-            first_move = chess.Move.from_uci(moves.split()[0])
-            board.push(first_move)
-            fen = board.fen()
-            puzzles.append(fen)
-            comment = prompt_for_comment(i + 1)
-            comments.append(comment)
-            i += 1
-        else:
-            print("Puzzle rejected.")
+    if seen is None:
+        seen = PositionSet()
+    if reviewer is None:
+        reviewer = partial(review_in_terminal, open_in_browser=open_in_browser)
+    candidates = (
+        _lichess_candidate(row, board) for row, board in iter_lichess_candidates(df, seen)
+    )
+    with _Prefetcher(candidates) as prefetched:
+        prefetched, on_accept = _apply_diversity(prefetched, on_accept, diversity)
+        puzzles, comments, exhausted = reviewer(prefetched, n, on_accept=on_accept)
+    if exhausted:
+        print("No more unseen puzzles for the selected theme(s).")
     return puzzles, comments
 
 
+def _is_new_position(seen, fen):
+    """
+    Add a FEN to `seen`; FENs that cannot be parsed are never treated as repeats.
+    """
+    try:
+        return seen.add(fen)
+    except ValueError:
+        return True
+
+
 def _column_map(columns):
     return {str(col).strip().lower(): col for col in columns}
 
@@ -209,12 +453,90 @@ def _format_comment(white, black, event, year, comment):
     return r" \\ ".join(lines)
 
 
-def get_puzzles_from_csv(filename, n=10, verbose=True, all_puzzles=False, open_in_browser=True):
+def _iter_csv_rows(rows, fen_col, seen):
+    """
+    Yield `(row, fen)` for the unseen positions of a `CsvLines`, in file order.
+    """
+    for row in rows:
+        fen = row.get(fen_col, "").strip()
+        if fen and _is_new_position(seen, fen):
+            yield row, fen
+
+
+def get_puzzles_from_csv(
+    filename,
+    n=10,
+    verbose=True,
+    all_puzzles=False,
+    open_in_browser=True,
+    seen=None,
+    on_accept=None,
+    reviewer=None,
+    diversity=None,
+    positions=None,
+):
     """
     Get puzzles from another csv
+
+    Rows are read on demand through a line index rather than loaded up
+    front. Repeated positions, and positions already in `seen`, are skipped.
+    The next candidates are read in the background while the current one is
+    reviewed, and `on_accept(fen)` is called as soon as a puzzle is accepted.
+    `reviewer` replaces `review_in_terminal`, e.g. with the web review UI.
+    Candidates near a puzzle in the `SimilarityIndex` `diversity` are skipped.
+    Positions found in the `PositionIndex` `positions` show the details of
+    their Lichess puzzle.
+    """
+    from line_index import CsvLines, LineIndex
+
+    with span("read_csv") as stage:
+        lines = LineIndex(filename)
+        stage.add_items(len(lines))
+    try:
+        puzzles, comments = _review_csv_rows(
+            CsvLines(lines),
+            n,
+            verbose,
+            all_puzzles,
+            open_in_browser,
+            seen,
+            on_accept,
+            reviewer,
+            diversity,
+            positions,
+        )
+    finally:
+        lines.close()
+
+    reorder_choice = prompt("Would you like to reorder the puzzles? (yes/no): ")
+    if reorder_choice.lower() == "yes":
+        new_order = prompt("Enter the puzzle numbers in the new order, comma-separated: ")
+        new_order_indices = [int(x) - 1 for x in new_order.split(",")]
+        puzzles = [puzzles[i] for i in new_order_indices]
+        comments = [comments[i] for i in new_order_indices]
+
+    return puzzles, comments
+
+
+def _review_csv_rows(
+    rows,
+    n,
+    verbose,
+    all_puzzles,
+    open_in_browser,
+    seen,
+    on_accept,
+    reviewer,
+    diversity,
+    positions=None,
+):
     """
-    df = pd.read_csv(filename)
-    column_map = _column_map(df.columns)
+    Review the rows of a `CsvLines` for `get_puzzles_from_csv`.
+    """
+    from dedupe import PositionSet
+    from review_server import Candidate
+
+    column_map = _column_map(rows.header)
 
     fen_col = _get_column(column_map, "fen")
     if not fen_col:
@@ -226,101 +548,134 @@ def get_puzzles_from_csv(filename, n=10, verbose=True, all_puzzles=False, open_i
     year_col = _get_column(column_map, "year")
     date_col = _get_column(column_map, "date")
 
-    puzzles = []
-    comments = []
-    i = 0
-
-    total_puzzles = len(df) if all_puzzles else n
+    if seen is None:
+        seen = PositionSet()
+    if reviewer is None:
+        reviewer = partial(review_in_terminal, open_in_browser=open_in_browser)
+
+    def candidate(row, fen):
+        white = row.get(white_col, "").strip() if white_col else ""
+        black = row.get(black_col, "").strip() if black_col else ""
+        event = row.get(event_col, "").strip() if event_col else ""
+        year_value = row.get(year_col, "").strip() if year_col else ""
+        if not year_value and date_col:
+            year_value = _extract_year(row.get(date_col))
+        details = {}
+        if white or black:
+            details["Game"] = f"{white} - {black}"
+        if event or year_value:
+            details["Event"] = " ".join(part for part in [event, year_value] if part)
+        details.update(_lichess_details(positions, fen))
+        caption = None
+        if verbose:
+            caption = partial(_format_comment, white, black, event, year_value)
+        return Candidate(fen, get_puzzle_url(fen), details, caption)
+
+    total_puzzles = len(rows) if all_puzzles else n
+    candidates = (candidate(row, fen) for row, fen in _iter_csv_rows(rows, fen_col, seen))
+    with _Prefetcher(candidates) as prefetched:
+        prefetched, on_accept = _apply_diversity(prefetched, on_accept, diversity)
+        puzzles, comments, exhausted = reviewer(prefetched, total_puzzles, on_accept=on_accept)
+    if exhausted and not all_puzzles:
+        print("No more unseen puzzles in the file.")
+    return puzzles, comments
 
-    for _, row in df.iterrows():
-        if i >= total_puzzles:
-            break
-        fen = str(row[fen_col]).strip()
-        if not fen:
-            continue
-        url = get_puzzle_url(fen)
-        print(f"Puzzle {i + 1}:")
-        open_puzzle_url(url, open_in_browser=open_in_browser)
-        choice = validate_choice()
-        if choice == "1":
-            puzzles.append(fen)
-            white = str(row[white_col]).strip() if white_col else ""
-            black = str(row[black_col]).strip() if black_col else ""
-            event = str(row[event_col]).strip() if event_col else ""
-            year_value = str(row[year_col]).strip() if year_col else ""
-            if not year_value and date_col:
-                year_value = _extract_year(row[date_col])
-            comment = prompt_for_comment(i + 1)
-            if verbose:
-                comments.append(_format_comment(white, black, event, year_value, comment))
-            else:
-                comments.append(comment)
-            i += 1
-        else:
-            print("Puzzle rejected.")
 
-    while not all_puzzles and len(puzzles) < n:
-        row = df.sample(n=1).iloc[0]
-        fen = str(row[fen_col]).strip()
-        if not fen:
-            continue
-        url = get_puzzle_url(fen)
-        print(f"Puzzle {i + 1}:")
-        print(fen)
-        open_puzzle_url(url, open_in_browser=open_in_browser)
-        choice = validate_choice()
-        if choice == "1":
-            puzzles.append(fen)
-            white = str(row[white_col]).strip() if white_col else ""
-            black = str(row[black_col]).strip() if black_col else ""
-            event = str(row[event_col]).strip() if event_col else ""
-            year_value = str(row[year_col]).strip() if year_col else ""
-            if not year_value and date_col:
-                year_value = _extract_year(row[date_col])
-            comment = prompt_for_comment(i + 1)
-            if verbose:
-                comments.append(_format_comment(white, black, event, year_value, comment))
-            else:
-                comments.append(comment)
-            i += 1
-        else:
-            print("Puzzle rejected.")
+def get_puzzles_from_text_file(
+    filename, open_in_browser=True, seen=None, on_accept=None, reviewer=None, positions=None
+):
+    """
+    Get puzzles from a text file.
 
-    reorder_choice = input("Would you like to reorder the puzzles? (yes/no): ")
-    if reorder_choice.lower() == "yes":
-        new_order = input("Enter the puzzle numbers in the new order, comma-separated: ")
-        new_order_indices = [int(x) - 1 for x in new_order.split(",")]
-        puzzles = [puzzles[i] for i in new_order_indices]
-        comments = [comments[i] for i in new_order_indices]
+    Lines are read on demand through a line index. Repeated positions,
+    positions already in `seen`, and lines that are not valid FENs are
+    skipped. `on_accept(fen)` is called as
+    soon as a puzzle is accepted. `reviewer` replaces `review_in_terminal`,
+    e.g. with the web review UI. Positions found in the `PositionIndex`
+    `positions` show the details of their Lichess puzzle.
+    """
+    import chess
+    from dedupe import PositionSet
+    from line_index import LineIndex
+    from review_server import Candidate
+
+    with span("read_file") as stage:
+        all_puzzles = LineIndex(filename)
+        stage.add_items(len(all_puzzles))
+    if seen is None:
+        seen = PositionSet()
+    if reviewer is None:
+        reviewer = partial(review_in_terminal, open_in_browser=open_in_browser)
+
+    def candidates():
+        for number, puzzle in enumerate(all_puzzles, start=1):
+            puzzle = puzzle.strip()
+            if puzzle and _is_new_position(seen, puzzle):
+                try:
+                    board = chess.Board(puzzle)
+                except ValueError as exc:
+                    print(f"Skipping line {number}, which is not a valid FEN: {exc}")
+                    continue
+                yield Candidate(
+                    board.fen(), get_puzzle_url(puzzle), _lichess_details(positions, board)
+                )
 
+    with all_puzzles:
+        puzzles, comments, _ = reviewer(candidates(), len(all_puzzles), on_accept=on_accept)
     return puzzles, comments
 
 
-def get_puzzles_from_text_file(filename, open_in_browser=True):
+def _review_game_positions(open_in_browser=True, accepted=0, positions=None):
     """
-    Get puzzles from a text file.
+    Build the review callback used by the cql scans. Positions found in the
+    `PositionIndex` `positions` show the details of their Lichess puzzle.
     """
-    with open(filename, "r") as f:
-        all_puzzles = f.readlines()
-    puzzles = []
-    comments = []
-    for puzzle in all_puzzles:
-        puzzle = puzzle.strip()
-        if not puzzle:
-            continue
-        puzzle_und = puzzle.replace(" ", "_")
-        url = "https://lichess.org/analysis/" + puzzle_und
+
+    def review(board, headers):
+        nonlocal accepted
+        fen = board.fen()
+        url = get_puzzle_url(fen)
+        for label, value in _lichess_details(positions, board).items():
+            print(f"{label}: {value}")
         open_puzzle_url(url, open_in_browser=open_in_browser)
         choice = validate_choice()
-        if choice == "1":
-            board = chess.Board(puzzle)
-            fen = board.fen()
-            puzzles.append(fen)
-            comment = prompt_for_comment(len(comments) + 1)
-            comments.append(comment)
-        else:
+        if choice != "1":
             print("Puzzle rejected.")
-    return puzzles, comments
+            return None
+        white = headers.get("White", "Unknown")
+        black = headers.get("Black", "Unknown")
+        event = headers.get("Event", "Unknown Event")
+        date = headers.get("Date", "????")
+        year = _extract_year(date)
+        accepted += 1
+        comment = prompt_for_comment(accepted)
+        return _format_comment(white, black, event, year, comment)
+
+    return review
+
+
+def _get_engine_path(stockfish_path):
+    engine_path = stockfish_path or DEFAULT_STOCKFISH_PATH
+    if not engine_path:
+        raise ValueError("Stockfish path not set. Use --stockfish or STOCKFISH_PATH.")
+    return engine_path
+
+
+def _open_checkpoint(checkpoint_path, resume, params):
+    if checkpoint_path is None:
+        if resume:
+            raise ValueError("--resume requires --checkpoint.")
+        return None
+    from cql import ScanCheckpoint
+
+    if resume:
+        checkpoint = ScanCheckpoint.load(checkpoint_path, params)
+        print(
+            f"Resuming from byte {checkpoint.offset} with {len(checkpoint.puzzles)} puzzle(s) "
+            "already selected."
+        )
+        return checkpoint
+    return ScanCheckpoint(checkpoint_path, params)
 
 
 def find_mate_in_n_puzzles(
@@ -329,58 +684,114 @@ def find_mate_in_n_puzzles(
     num_puzzles,
     stockfish_path=None,
     open_in_browser=True,
+    engines=None,
+    checkpoint_path=None,
+    resume=False,
+    positions=None,
 ):
-    puzzles = []
-    comments = []
-    engine_path = stockfish_path or DEFAULT_STOCKFISH_PATH
-    if not engine_path:
-        raise ValueError("Stockfish path not set. Use --stockfish or STOCKFISH_PATH.")
+    """
+    Scan games for forced mates of `mate_in_n` moves. Positions found in the
+    `PositionIndex` `positions` show the details of their Lichess puzzle.
+    """
+    import asyncio
+    from cql import DEFAULT_ENGINES, scan_for_mates
+    from pgn_input import open_pgn
+
+    engine_path = _get_engine_path(stockfish_path)
+    params = {"pgn": str(Path(pgn_file_path).resolve()), "mode": "mate", "mate_in_n": mate_in_n}
+    checkpoint = _open_checkpoint(checkpoint_path, resume, params)
+    accepted = len(checkpoint.puzzles) if checkpoint else 0
+    review = _review_game_positions(
+        open_in_browser=open_in_browser, accepted=accepted, positions=positions
+    )
+    with open_pgn(pgn_file_path) as pgn:
+        return asyncio.run(
+            scan_for_mates(
+                pgn,
+                mate_in_n,
+                num_puzzles,
+                engine_path,
+                review,
+                engines=DEFAULT_ENGINES if engines is None else engines,
+                checkpoint=checkpoint,
+            )
+        )
 
-    with open(pgn_file_path, encoding="ISO-8859-1") as pgn:
-        while True:
-            game = chess.pgn.read_game(pgn)
-            if game is None or len(puzzles) >= num_puzzles:
-                break
 
-            board = game.board()
-            for move in game.mainline_moves():
-                board.push(move)
+def find_tactic_puzzles(
+    pgn_file_path,
+    num_puzzles,
+    stockfish_path=None,
+    open_in_browser=True,
+    engines=None,
+    checkpoint_path=None,
+    resume=False,
+    positions=None,
+):
+    """
+    Mine every position of every game for uniquely winning moves. Positions
+    found in the `PositionIndex` `positions` show the details of their
+    Lichess puzzle.
+    """
+    import asyncio
+    from cql import DEFAULT_ENGINES, scan_for_tactics
+    from pgn_input import open_pgn
+
+    engine_path = _get_engine_path(stockfish_path)
+    params = {"pgn": str(Path(pgn_file_path).resolve()), "mode": "tactics"}
+    checkpoint = _open_checkpoint(checkpoint_path, resume, params)
+    accepted = len(checkpoint.puzzles) if checkpoint else 0
+    review = _review_game_positions(
+        open_in_browser=open_in_browser, accepted=accepted, positions=positions
+    )
+    with open_pgn(pgn_file_path) as pgn:
+        return asyncio.run(
+            scan_for_tactics(
+                pgn,
+                num_puzzles,
+                engine_path,
+                review,
+                engines=DEFAULT_ENGINES if engines is None else engines,
+                checkpoint=checkpoint,
+            )
+        )
 
-            if len(board.move_stack) < mate_in_n + 1:
-                continue
 
-            engine = chess.engine.SimpleEngine.popen_uci(engine_path)
-            for _ in range(mate_in_n + 1):
-                if board.move_stack:
-                    board.pop()
+def find_query_puzzles(pgn_file_path, query, num_puzzles, open_in_browser=True, positions=None):
+    """
+    Review positions matching a position query, without an engine. Positions
+    found in the `PositionIndex` `positions` show the details of their
+    Lichess puzzle.
+    """
+    from pgn_input import open_pgn
+    from position_query import PositionQuery, iter_matching_positions
 
-            info = engine.analyse(board, chess.engine.Limit(depth=20))
-            engine.quit()
+    query = PositionQuery(query)
+    review = _review_game_positions(open_in_browser=open_in_browser, positions=positions)
+    puzzles = []
+    comments = []
+    with open_pgn(pgn_file_path) as pgn:
+        for board, headers in iter_matching_positions(pgn, query):
+            if len(puzzles) >= num_puzzles:
+                break
+            fen = board.fen()
+            if fen in puzzles:
+                continue
+            comment = review(board, headers)
+            if comment is not None:
+                puzzles.append(fen)
+                comments.append(comment)
+    return puzzles, comments
 
-            score = info.get("score")
-            if score and score.is_mate():
-                mate_value = (
-                    score.white().mate() if board.turn == chess.WHITE else score.black().mate()
-                )
 
-                if mate_value == mate_in_n:
-                    fen = board.fen()
-                    url = get_puzzle_url(fen)
-                    open_puzzle_url(url, open_in_browser=open_in_browser)
-                    choice = validate_choice()
-                    if choice == "1":
-                        puzzles.append(fen)
-                        white = game.headers.get("White", "Unknown")
-                        black = game.headers.get("Black", "Unknown")
-                        event = game.headers.get("Event", "Unknown Event")
-                        date = game.headers.get("Date", "????")
-                        year = _extract_year(date)
-                        comment = prompt_for_comment(len(comments) + 1)
-                        full_comment = _format_comment(white, black, event, year, comment)
-                        comments.append(full_comment)
-                    else:
-                        print("Puzzle rejected.")
-    return puzzles, comments
+def _positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
 
 
 def main():
@@ -391,16 +802,26 @@ def main():
     3. For each FEN string, generate a PNG image.
     4. Generate a PDF file with the images.
     """
+    from fen2tex import BOARD_SIZE_CM, DEFAULT_IMAGE_PROFILE, IMAGE_PROFILES
+
     parser = argparse.ArgumentParser(description="Generate a puzzle with a given theme.")
     parser.add_argument(
         "medium",
         type=str,
-        help="The medium from which to get the puzzles. (lichess, text, csv, cql)",
+        help=(
+            "The medium from which to get the puzzles. (lichess, text, csv, cql), batch to "
+            "build every sheet of a JSON manifest without prompts, or serve to answer puzzle, "
+            "board and sheet requests over HTTP."
+        ),
     )
     parser.add_argument(
         "theme",
         type=str,
-        help="The theme of the puzzle. Should be of the form theme1,theme2,theme3.",
+        nargs="?",
+        help=(
+            "The theme of the puzzle. Should be of the form theme1,theme2,theme3. "
+            "The manifest path in batch mode."
+        ),
     )
     parser.add_argument("--f", "--file", dest="f", type=str, help="The file to read from.")
     parser.add_argument("--n", type=int, help="The number of puzzles to generate.", default=10)
@@ -420,6 +841,39 @@ def main():
     parser.add_argument("--themes-file", type=str, help="Path to themes-unique.txt.")
     parser.add_argument("--output-dir", type=str, help="Output directory.")
     parser.add_argument("--stockfish", type=str, help="Path to Stockfish binary.")
+    parser.add_argument(
+        "--engines",
+        type=_positive_int,
+        help="Number of Stockfish processes analysing in parallel for the cql medium (default: 2).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=_positive_int,
+        help="In batch mode, processes rendering boards and compiling PDFs (default: CPU count).",
+    )
+    parser.add_argument(
+        "--mine",
+        action="store_true",
+        help="In cql mode, screen every position for tactics instead of mate-in-N endings.",
+    )
+    parser.add_argument(
+        "--query",
+        type=str,
+        help=(
+            "In cql mode, review positions matching this position query instead of using an "
+            'engine, e.g. "material:KRP*krp* passed(P[a-h]6)".'
+        ),
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        help="In cql mode, periodically save scan progress to this JSON file.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue a cql scan from the file given by --checkpoint.",
+    )
     parser.add_argument(
         "--no-open",
         action="store_true",
@@ -430,11 +884,65 @@ def main():
         action="store_true",
         help="Do not prompt before opening browser tabs.",
     )
+    parser.add_argument(
+        "--review",
+        choices=["terminal", "web"],
+        default="terminal",
+        help=(
+            "Review candidates at the terminal, or in a local web page showing each board "
+            "with its details (lichess, csv and text mediums)."
+        ),
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help=(
+            f"Port of the local review page for --review web (default: {DEFAULT_REVIEW_PORT}), "
+            f"or of the serve API (default: {DEFAULT_SERVE_PORT})."
+        ),
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="Serve the API on this Unix socket instead of a TCP port.",
+    )
     parser.add_argument(
         "--no-pdf",
         action="store_true",
         help="Skip PDF generation with pdflatex.",
     )
+    parser.add_argument(
+        "--image-profile",
+        choices=list(IMAGE_PROFILES),
+        default=DEFAULT_IMAGE_PROFILE,
+        help=(
+            f"How board images are saved: screen ({IMAGE_PROFILES['screen']['dpi']} DPI at "
+            f"{BOARD_SIZE_CM}cm), print ({IMAGE_PROFILES['print']['dpi']} DPI, larger and "
+            "slower to compile), grayscale (grey levels for black and white printing), all with "
+            "a small palette and optimized compression, or full (the original full-colour "
+            "images). "
+            f"Default: {DEFAULT_IMAGE_PROFILE}."
+        ),
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        help=(
+            "Text or CSV file of FENs whose positions should not be offered again "
+            "(lichess, csv and text mediums). May be given more than once."
+        ),
+    )
+    parser.add_argument(
+        "--diversity",
+        type=int,
+        default=0,
+        metavar="DISTANCE",
+        help=(
+            "In lichess and csv mode, skip candidates within DISTANCE piece-square changes of an "
+            "accepted or excluded puzzle; moving one piece counts as 2 (default: off)."
+        ),
+    )
     parser.add_argument("--title", type=str, help="Puzzle sheet title.")
     parser.add_argument("--squad", type=str, help="Squad name.")
     parser.add_argument("--blurb", type=str, help="Puzzle sheet blurb.")
@@ -443,9 +951,58 @@ def main():
         type=str,
         help="Author name for the PDF header (defaults to the current year only).",
     )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="TRACE",
+        help=(
+            "Time each stage and write a Chrome trace JSON file (default: profile.json in the "
+            "output directory), then print a summary. Time spent waiting for input is excluded."
+        ),
+    )
 
     args = parser.parse_args()
-
+    if args.theme is None and args.medium != "serve":
+        parser.error("the following arguments are required: theme")
+    if args.query:
+        # Query scans need no engine and are not checkpointed
+        ignored = [
+            flag
+            for flag, value in [
+                ("--mine", args.mine),
+                ("--engines", args.engines),
+                ("--checkpoint", args.checkpoint),
+                ("--resume", args.resume),
+            ]
+            if value
+        ]
+        if ignored:
+            parser.error(f"{', '.join(ignored)} cannot be combined with --query")
+    if args.profile is None:
+        return _run(args)
+
+    import profiling
+
+    recorder = profiling.enable()
+    try:
+        with span("main"):
+            return _run(args)
+    finally:
+        profiling.disable()
+        output_dir = Path(args.output_dir) if args.output_dir else DEFAULT_OUTPUT_DIR
+        trace_path = Path(args.profile) if args.profile else output_dir / "profile.json"
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        profiling.write_trace(recorder, trace_path)
+        print()
+        print(profiling.format_summary(recorder))
+        print(f"Wrote trace to {trace_path}")
+
+
+def _run(args):
+    """
+    Select puzzles from the chosen medium and build the puzzle sheet.
+    """
     data_dir = Path(args.data_dir) if args.data_dir else DEFAULT_DATA_DIR
     lichess_db_path = (
         Path(args.lichess_db)
@@ -459,75 +1016,116 @@ def main():
     open_pdf = not args.no_open
     run_pdflatex = not args.no_pdf
 
-    if open_in_browser and not args.no_confirm_open:
+    if args.medium == "batch":
+        from batch import run_batch
+
+        return run_batch(
+            Path(args.theme),
+            lichess_db_path,
+            output_dir,
+            themes_file=themes_file,
+            run_pdflatex=run_pdflatex,
+            workers=args.workers,
+            profile=args.image_profile,
+        )
+    if args.medium == "serve":
+        from puzzle_server import serve
+
+        port = DEFAULT_SERVE_PORT if args.port is None else args.port
+        return serve(
+            lichess_db_path, port=port, socket_path=args.socket, profile=args.image_profile
+        )
+    if args.review == "web" and args.medium == "cql":
+        print("--review web is not available for the cql medium.")
+        return 1
+    if args.diversity and args.medium not in ("lichess", "csv"):
+        print("--diversity is only available for the lichess and csv mediums.")
+        return 1
+    if open_in_browser and args.review == "terminal" and not args.no_confirm_open:
         open_in_browser = confirm_browser_open()
 
     output_dir.mkdir(parents=True, exist_ok=True)
+    img_dir = output_dir / "images"
+    img_dir.mkdir(parents=True, exist_ok=True)
 
-    all_puzzles = args.all_puzzles
-    theme = args.theme
-    n = args.n
-    filename = args.f
-    mate_in_n_value = args.mate_in_n
+    from dedupe import PositionSet, read_fens
+    from fen2tex import RenderWorker, fen2tex
 
-    try:
-        if args.medium == "lichess":
-            if not lichess_db_path.exists():
-                print(f"Lichess DB not found at {lichess_db_path}")
-                return 1
-            puzzles, comments = get_puzzles_from_lichess(
-                theme,
-                n,
-                lichess_db_path=lichess_db_path,
-                themes_file=themes_file,
-                open_in_browser=open_in_browser,
-            )
-        elif args.medium == "text":
-            if not filename:
-                print("--file is required when medium is 'text'.")
-                return 1
-            puzzles, comments = get_puzzles_from_text_file(
-                filename, open_in_browser=open_in_browser
-            )
-        elif args.medium == "csv":
-            if not filename:
-                print("--file is required when medium is 'csv'.")
-                return 1
-            puzzles, comments = get_puzzles_from_csv(
-                filename, n, False, all_puzzles, open_in_browser=open_in_browser
-            )
-        elif args.medium == "cql":
-            if not filename:
-                print("--file is required when medium is 'cql'.")
-                return 1
-            puzzles, comments = find_mate_in_n_puzzles(
-                filename,
-                mate_in_n_value,
-                n,
-                stockfish_path=stockfish_path,
-                open_in_browser=open_in_browser,
-            )
-        else:
-            print("Unknown medium. Use one of: lichess, text, csv, cql")
-            return 1
-    except (FileNotFoundError, ValueError) as exc:
-        print(str(exc))
-        return 1
+    positions = None
+    if args.medium in ("csv", "text", "cql"):
+        from position_index import open_position_index
 
-    if not puzzles:
-        print("No puzzles selected.")
-        return 1
+        positions = open_position_index(lichess_db_path)
 
-    img_dir = output_dir / "images"
-    img_dir.mkdir(parents=True, exist_ok=True)
+    reviewer = None
+    server = None
+    if args.review == "web":
+        from review_server import ReviewServer
 
-    print("Generating images...")
-    for idx, puzzle in enumerate(puzzles):
-        print(f"Generating image {idx}...")
-        img_name = img_dir / f"puzzle_{idx}.png"
-        fen2png(puzzle, str(img_name))
+        try:
+            port = DEFAULT_REVIEW_PORT if args.port is None else args.port
+            server = ReviewServer(port=port)
+        except OSError as exc:
+            print(f"Could not start the review page: {exc}")
+            return 1
+        print(f"Review puzzles at {server.url}")
+        open_puzzle_url(server.url, open_in_browser=open_in_browser)
+        reviewer = server.review
+
+    # Accepted puzzles are rendered in the background while selection goes on
+    with RenderWorker(img_dir, profile=args.image_profile) as renderer:
+        try:
+            seen = PositionSet()
+            diversity = None
+            if args.diversity:
+                from similarity import SimilarityIndex
+
+                diversity = SimilarityIndex(args.diversity)
+            with span("load_exclusions") as stage:
+                for exclude_path in args.exclude:
+                    for fen in read_fens(exclude_path):
+                        if _is_new_position(seen, fen) and diversity is not None:
+                            try:
+                                diversity.add(fen)
+                            except ValueError:
+                                pass
+                        stage.add_items(1)
+
+            with span("select", medium=args.medium) as stage:
+                puzzles, comments = _select_puzzles(
+                    args,
+                    lichess_db_path,
+                    themes_file,
+                    stockfish_path,
+                    open_in_browser,
+                    seen,
+                    renderer.submit,
+                    reviewer,
+                    diversity,
+                    positions,
+                )
+                stage.add_items(len(puzzles or []))
+        except (FileNotFoundError, ValueError) as exc:
+            print(str(exc))
+            return 1
+        finally:
+            if server is not None:
+                server.close()
+            if positions is not None:
+                positions.close()
 
-    safe_theme = theme.replace(",", "_").replace(" ", "_")
+        if puzzles is None:
+            return 1
+        if not puzzles:
+            print("No puzzles selected.")
+            return 1
+
+        print("Generating images...")
+        with span("render_images") as stage:
+            renderer.finish(puzzles)
+            stage.add_items(len(puzzles))
+
+    safe_theme = args.theme.replace(",", "_").replace(" ", "_")
     tex_base = output_dir / safe_theme
     fen2tex(
         tex_base,
@@ -543,5 +1141,113 @@ def main():
     return 0
 
 
+def _select_puzzles(
+    args,
+    lichess_db_path,
+    themes_file,
+    stockfish_path,
+    open_in_browser,
+    seen,
+    on_accept,
+    reviewer=None,
+    diversity=None,
+    positions=None,
+):
+    """
+    Run the interactive selection for `args.medium`, with `reviewer` in
+    place of the terminal review for the lichess, csv and text mediums, the
+    `SimilarityIndex` `diversity` for the lichess and csv mediums, and the
+    `PositionIndex` `positions` for the csv, text and cql mediums.
+
+    :returns: The selected puzzles and their comments, or `(None, None)` when
+        the arguments cannot be used or a scan was interrupted.
+    """
+    theme = args.theme
+    n = args.n
+    filename = args.f
+
+    if args.medium == "lichess":
+        if not lichess_db_path.exists():
+            print(f"Lichess DB not found at {lichess_db_path}")
+            return None, None
+        return get_puzzles_from_lichess(
+            theme,
+            n,
+            lichess_db_path=lichess_db_path,
+            themes_file=themes_file,
+            open_in_browser=open_in_browser,
+            seen=seen,
+            on_accept=on_accept,
+            reviewer=reviewer,
+            diversity=diversity,
+        )
+    if args.medium == "text":
+        if not filename:
+            print("--file is required when medium is 'text'.")
+            return None, None
+        return get_puzzles_from_text_file(
+            filename,
+            open_in_browser=open_in_browser,
+            seen=seen,
+            on_accept=on_accept,
+            reviewer=reviewer,
+            positions=positions,
+        )
+    if args.medium == "csv":
+        if not filename:
+            print("--file is required when medium is 'csv'.")
+            return None, None
+        return get_puzzles_from_csv(
+            filename,
+            n,
+            False,
+            args.all_puzzles,
+            open_in_browser=open_in_browser,
+            seen=seen,
+            on_accept=on_accept,
+            reviewer=reviewer,
+            diversity=diversity,
+            positions=positions,
+        )
+    if args.medium == "cql":
+        if not filename:
+            print("--file is required when medium is 'cql'.")
+            return None, None
+        try:
+            if args.query:
+                return find_query_puzzles(
+                    filename, args.query, n, open_in_browser=open_in_browser, positions=positions
+                )
+            if args.mine:
+                return find_tactic_puzzles(
+                    filename,
+                    n,
+                    stockfish_path=stockfish_path,
+                    open_in_browser=open_in_browser,
+                    engines=args.engines,
+                    checkpoint_path=args.checkpoint,
+                    resume=args.resume,
+                    positions=positions,
+                )
+            return find_mate_in_n_puzzles(
+                filename,
+                args.mate_in_n,
+                n,
+                stockfish_path=stockfish_path,
+                open_in_browser=open_in_browser,
+                engines=args.engines,
+                checkpoint_path=args.checkpoint,
+                resume=args.resume,
+                positions=positions,
+            )
+        except KeyboardInterrupt:
+            print("\nScan interrupted.")
+            if args.checkpoint:
+                print(f"Progress saved to {args.checkpoint}; rerun with --resume to continue.")
+            return None, None
+    print("Unknown medium. Use one of: lichess, text, csv, cql")
+    return None, None
+
+
 if __name__ == "__main__":
     main()
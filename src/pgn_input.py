@@ -0,0 +1,169 @@
+import bz2
+import gzip
+import io
+import lzma
+from pathlib import Path
+
+_MAGIC_BYTES = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+]
+COMPRESSED_SUFFIXES = {".gz", ".bz2", ".xz", ".zst"}
+
+
+def detect_compression(head):
+    """
+    Return the compression format for the first bytes of a file, or None.
+    """
+    for magic, name in _MAGIC_BYTES:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _decompressor(compression, raw):
+    if compression is None:
+        return raw
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if compression == "bz2":
+        return bz2.BZ2File(raw, mode="rb")
+    if compression == "xz":
+        return lzma.LZMAFile(raw, mode="rb")
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise ValueError(
+            "Reading .zst files requires the zstandard package (pip install zstandard)."
+        ) from exc
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=False))
+
+
+def decode_text(data):
+    """
+    Decode bytes as UTF-8, falling back to Latin-1 when they are not valid UTF-8.
+    """
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def uncompressed_name(path):
+    """
+    Strip a compression suffix: games.pgn.zst -> games.pgn.
+    """
+    path = Path(path)
+    if path.suffix.lower() in COMPRESSED_SUFFIXES:
+        return path.with_suffix("")
+    return path
+
+
+class BinaryInput:
+    """
+    Binary reader that transparently decompresses gzip, bz2, xz and zstd files.
+
+    The format is detected from the magic bytes, not the file name, and data
+    is decompressed as it is read, never to disk.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._raw = open(self.path, "rb")
+        try:
+            self.compression = detect_compression(self._raw.peek(6)[:6])
+            self._stream = _decompressor(self.compression, self._raw)
+        except BaseException:
+            self._raw.close()
+            raise
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def readline(self, size=-1):
+        return self._stream.readline(size)
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def seek(self, offset):
+        """
+        Move to an offset in the decompressed data.
+
+        Compressed streams get there by decompressing, which is only cheap
+        when moving forward.
+        """
+        self._stream.seek(offset)
+
+    def tell(self):
+        """
+        How far into the decompressed data reading has got.
+        """
+        return self._stream.tell()
+
+    def compressed_tell(self):
+        """
+        How far into the file on disk reading has got, for progress reporting.
+        """
+        return self._raw.tell()
+
+    def close(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TextInput:
+    """
+    Line-oriented text reader over a possibly compressed file.
+
+    Each line is decoded as UTF-8, falling back to Latin-1 for lines that are
+    not valid UTF-8, so mixed-encoding collections read without errors.
+    `tell` and `seek` use offsets into the decompressed bytes.
+    """
+
+    def __init__(self, path):
+        self.binary = BinaryInput(path)
+        self.offset = 0
+
+    def readline(self):
+        line = self.binary.readline()
+        self.offset += len(line)
+        return decode_text(line)
+
+    def read(self):
+        return "".join(iter(self.readline, ""))
+
+    def __iter__(self):
+        return iter(self.readline, "")
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset):
+        self.binary.seek(offset)
+        self.offset = offset
+
+    def close(self):
+        self.binary.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_pgn(path):
+    """
+    Open a plain or compressed PGN file for reading as text.
+    """
+    return TextInput(path)
@@ -1,73 +1,247 @@
-import sys
+import argparse
+import os
+import re
 from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional
 
+from pgn_input import BinaryInput, uncompressed_name
 
-def split_pgn(input_file: str, max_games: int = 64) -> None:
+DEFAULT_MAX_GAMES = 64
+# A tag pair such as [Event "..."]; movetext annotations like [%clk 0:03:00]
+# also start with a bracket but have no quoted value.
+_TAG_LINE = re.compile(rb'^\[\w+\s+"')
+
+
+def _in_comment(movetext: bytes, in_comment: bool) -> bool:
+    """
+    Whether a {...} comment is still open after a line of movetext.
+    Comments do not nest, so the last brace on the line decides.
+    """
+    opened = movetext.rfind(b"{")
+    closed = movetext.rfind(b"}")
+    if opened == closed:  # neither brace
+        return in_comment
+    return opened > closed
+
+
+def iter_games(handle: BinaryIO) -> Iterator[bytes]:
     """
-    Split a PGN file into multiple files with a maximum number of games per file.
+    Yield the raw text of each game in a binary PGN stream, one game at a time.
+
+    A new game starts at a tag line that follows movetext, or at an Event tag
+    that follows other tags. Lines inside a {...} comment, such as a wrapped
+    [%clk ...] annotation, are movetext. Leading and trailing blank lines are
+    dropped.
 
     Args:
-        input_file: Path to the input PGN file
-        max_games: Maximum number of games per output file (default: 64)
+        handle: PGN file opened in binary mode
     """
-    # Read the entire file
-    with open(input_file, "r") as f:
-        content = f.read()
-
-    # Split into individual games
-    # A new game starts with an Event tag
-    games = []
-    current_game = []
-
-    for line in content.split("\n"):
-        # If we find a new [Event tag and we already have a game in progress
-        if (
-            line.strip().startswith("[Event ")
-            and current_game
-            and any(g.strip().startswith("[") for g in current_game)
-        ):
-            games.append("\n".join(current_game))
-            current_game = []
-        current_game.append(line)
-
-    # Add the last game if exists
-    if current_game:
-        games.append("\n".join(current_game))
-
-    # Remove any empty games (just whitespace)
-    games = [game for game in games if any(line.strip() for line in game.split("\n"))]
-
-    total_games = len(games)
-    print(f"Found {total_games} games in {input_file}")
-
-    # Calculate number of files needed
-    num_files = (total_games + max_games - 1) // max_games
-
-    # Create output files
-    input_path = Path(input_file)
-    base_name = input_path.stem
-    extension = input_path.suffix
+    lines = []
+    has_tags = False
+    has_moves = False
+    in_comment = False
+
+    for line in handle:
+        stripped = line.strip()
+        is_tag = not in_comment and _TAG_LINE.match(stripped) is not None
+        if is_tag and (has_moves or (has_tags and stripped.startswith(b"[Event "))):
+            game = b"".join(lines).strip()
+            if game:
+                yield game
+            lines = []
+            has_tags = False
+            has_moves = False
+        lines.append(line)
+        if is_tag:
+            has_tags = True
+        elif stripped:
+            has_moves = True
+            in_comment = _in_comment(stripped, in_comment)
+
+    game = b"".join(lines).strip()
+    if game:
+        yield game
+
+
+def _uncompressed_size(input_path: Path) -> int:
+    """
+    Size of the PGN text in a file. Compressed input is decompressed once to
+    count it, since the sizes stored by the formats are missing or wrap.
+    """
+    with BinaryInput(input_path) as f:
+        if f.compression is None:
+            return os.path.getsize(input_path)
+        size = 0
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            size += len(chunk)
+        return size
 
-    for i in range(num_files):
-        start_idx = i * max_games
-        end_idx = min((i + 1) * max_games, total_games)
 
-        # Create output filename: original_name_1.pgn, original_name_2.pgn, etc.
-        output_file = input_path.parent / f"{base_name}_{i + 1}{extension}"
+class _ShardWriter:
+    """
+    Write games to numbered output files: name_1.pgn, name_2.pgn, etc.
+    """
+
+    def __init__(self, input_path: Path, output_dir: Path):
+        self.input_path = uncompressed_name(input_path)
+        self.output_dir = output_dir
+        self.paths: List[Path] = []
+        self.handle: Optional[BinaryIO] = None
+        self.games = 0
+        self.size = 0
+
+    def open_next(self) -> None:
+        self.close()
+        output_file = (
+            self.output_dir
+            / f"{self.input_path.stem}_{len(self.paths) + 1}{self.input_path.suffix}"
+        )
+        self.paths.append(output_file)
+        self.handle = open(output_file, "wb")
+        self.games = 0
+        self.size = 0
+
+    def size_with(self, game: bytes) -> int:
+        """
+        Size of the current file once `game` is added and the file is closed.
+        """
+        separator = 2 if self.games else 0
+        return self.size + separator + len(game) + 1
+
+    def write(self, game: bytes) -> None:
+        # Separate games with a blank line
+        if self.games:
+            self.handle.write(b"\n\n")
+            self.size += 2
+        self.handle.write(game)
+        self.games += 1
+        self.size += len(game)
+
+    def close(self) -> None:
+        if self.handle is None:
+            return
+        self.handle.write(b"\n")  # End file with newline
+        self.handle.close()
+        self.handle = None
+        print(f"Created {self.paths[-1]} with {self.games} games")
+
+
+def split_pgn(
+    input_file: str,
+    max_games: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    shards: Optional[int] = None,
+    output_dir: Optional[str] = None,
+) -> List[Path]:
+    """
+    Split a PGN file into multiple files, streaming one game at a time.
+
+    Either cap each output file with `max_games` and/or `max_bytes`, or ask for
+    `shards` files of roughly equal byte size. With no limits at all, files
+    hold at most 64 games. A single game larger than `max_bytes` still gets a
+    file of its own. Compressed input (.gz, .bz2, .xz, .zst) is decompressed
+    on the fly and the output files are plain PGN.
 
-        # Write games to file, ensuring proper separation between games
-        with open(output_file, "w") as f:
-            f.write("\n\n".join(games[start_idx:end_idx]))
-            f.write("\n")  # End file with newline
+    Args:
+        input_file: Path to the input PGN file
+        max_games: Maximum number of games per output file
+        max_bytes: Maximum size in bytes of each output file
+        shards: Number of output files, balanced by byte size
+        output_dir: Directory for the output files (default: next to the input)
 
-        print(f"Created {output_file} with {end_idx - start_idx} games")
+    Returns:
+        The paths of the files written.
+    """
+    if shards is not None:
+        if max_games is not None or max_bytes is not None:
+            raise ValueError("shards cannot be combined with max_games or max_bytes.")
+        if shards < 1:
+            raise ValueError("shards must be at least 1.")
+    elif max_games is None and max_bytes is None:
+        max_games = DEFAULT_MAX_GAMES
+    if max_games is not None and max_games < 1:
+        raise ValueError("max_games must be at least 1.")
+    if max_bytes is not None and max_bytes < 1:
+        raise ValueError("max_bytes must be at least 1.")
 
-    print(f"\nSplit {total_games} games into {num_files} files")
+    input_path = Path(input_file)
+    out_dir = Path(output_dir) if output_dir else input_path.parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Shards are balanced on the position in the decompressed text; the
+    # position in a compressed file only moves a whole block at a time.
+    shard_size = _uncompressed_size(input_path) / shards if shards else 0
+    writer = _ShardWriter(input_path, out_dir)
+    total_games = 0
+    position = 0
+
+    with BinaryInput(input_path) as f:
+        for game in iter_games(f):
+            previous, position = position, f.tell()
+            if writer.handle is None:
+                writer.open_next()
+            elif shards:
+                # Each game goes to the shard that contains its midpoint
+                midpoint = (previous + position) / 2
+                if len(writer.paths) < shards and midpoint >= shard_size * len(writer.paths):
+                    writer.open_next()
+            elif (max_games is not None and writer.games >= max_games) or (
+                max_bytes is not None and writer.size_with(game) > max_bytes
+            ):
+                writer.open_next()
+            writer.write(game)
+            total_games += 1
+
+    writer.close()
+    print(f"\nSplit {total_games} games from {input_file} into {len(writer.paths)} files")
+    return writer.paths
+
+
+def main() -> None:
+    from main import _positive_int
+
+    parser = argparse.ArgumentParser(
+        description="Split a PGN file into smaller files without loading it into memory."
+    )
+    parser.add_argument(
+        "input_file", type=str, help="PGN file to split (optionally .gz, .bz2, .xz or .zst)."
+    )
+    parser.add_argument(
+        "--max-games",
+        type=_positive_int,
+        help=f"Maximum number of games per output file (default: {DEFAULT_MAX_GAMES}).",
+    )
+    parser.add_argument(
+        "--max-bytes", type=_positive_int, help="Maximum size in bytes of each output file."
+    )
+    parser.add_argument(
+        "--shards",
+        type=_positive_int,
+        help="Split into this many files of roughly equal size instead.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        help="Directory for the output files (default: next to the input file).",
+    )
+    args = parser.parse_args()
+
+    if args.shards is not None and (args.max_games is not None or args.max_bytes is not None):
+        parser.error("--shards cannot be combined with --max-games or --max-bytes.")
+    if not Path(args.input_file).exists():
+        raise SystemExit(f"PGN file not found at {args.input_file}")
+
+    try:
+        split_pgn(
+            args.input_file,
+            max_games=args.max_games,
+            max_bytes=args.max_bytes,
+            shards=args.shards,
+            output_dir=args.output_dir,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python pgn_splitter.py <input_pgn_file>")
-        sys.exit(1)
-
-    split_pgn(sys.argv[1])
+    main()
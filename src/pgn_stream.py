@@ -0,0 +1,106 @@
+from functools import partial
+
+import chess
+import chess.pgn
+
+
+class GameTail:
+    """
+    Headers and the last few positions of a game's mainline.
+    """
+
+    def __init__(self, headers, board, plies, errors):
+        self.headers = headers
+        self.board = board
+        self.plies = plies
+        self.errors = errors
+
+    def position(self, plies_before_end=0):
+        """
+        Return the position `plies_before_end` plies before the final position.
+        """
+        available = len(self.board.move_stack) if self.board is not None else 0
+        if plies_before_end > available:
+            raise ValueError(
+                f"Only {available} plies are retained, cannot go back {plies_before_end}."
+            )
+        board = self.board.copy(stack=plies_before_end)
+        for _ in range(plies_before_end):
+            board.pop()
+        return board
+
+    def positions(self):
+        """
+        Yield every retained position, oldest first, ending with the final one.
+        """
+        if self.board is None:
+            return
+        moves = list(self.board.move_stack)
+        board = self.position(len(moves))
+        yield board.copy(stack=False)
+        for move in moves:
+            board.push(move)
+            yield board.copy(stack=False)
+
+
+class MainlineVisitor(chess.pgn.BaseVisitor):
+    """
+    Base visitor that follows the mainline only.
+
+    Variations are skipped by the parser, comments and NAGs are dropped and no
+    `GameNode` tree is built. Subclasses see every mainline position through
+    `visit_board` and build their own `result`.
+    """
+
+    def begin_game(self):
+        self.headers = chess.pgn.Headers()
+        self.errors = []
+
+    def begin_headers(self):
+        return self.headers
+
+    def visit_header(self, tagname, tagvalue):
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def handle_error(self, error):
+        self.errors.append(error)
+
+
+class TailVisitor(MainlineVisitor):
+    """
+    Streaming visitor that keeps only the end of the mainline.
+
+    Only the last `depth` moves are kept in the result, so the memory per game
+    does not depend on how heavily it is annotated. A `depth` of None keeps
+    the whole mainline.
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+
+    def begin_game(self):
+        super().begin_game()
+        self.board = None
+
+    def visit_board(self, board):
+        self.board = board
+
+    def result(self):
+        if self.board is None:
+            return GameTail(self.headers, None, 0, self.errors)
+        plies = len(self.board.move_stack)
+        stack = True if self.depth is None else self.depth
+        return GameTail(self.headers, self.board.copy(stack=stack), plies, self.errors)
+
+
+def read_game_tail(handle, depth):
+    """
+    Read the next game from `handle`, keeping only its last `depth` positions,
+    or all of them when `depth` is None.
+
+    Returns None at the end of the file.
+    """
+    return chess.pgn.read_game(handle, Visitor=partial(TailVisitor, depth))
@@ -0,0 +1,331 @@
+"""
+Look up Lichess puzzles by position.
+
+`wuzzle-positions` builds a hash table from the position of every puzzle in
+the Lichess database, after the opponent's first move, to the byte offset of
+its row, and saves it next to the database
+(lichess_db_puzzle-positions.idx). `PositionIndex` memory-maps the table and
+the database, so finding the puzzle for a position is one hash probe and one
+row read, without loading the database. The csv, text and cql mediums use it
+to show the themes, rating and solution of positions that are also Lichess
+puzzles.
+"""
+import argparse
+import csv
+import mmap
+import os
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_LICHESS_DB = ROOT_DIR / "data/lichess_db_puzzle.csv"
+# Rows are hashed in chunks of this many bytes, several per worker
+CHUNK_BYTES = 16 * 1024 * 1024
+_MAGIC = b"WZPOS002"
+# magic, database size, database mtime in ns, quarantine list mtime in ns
+# (0 without one), table capacity, positions, padded to 64 bytes so the
+# tables that follow are aligned
+_HEADER = struct.Struct("<8sQQQQQ16x")
+
+
+def index_path_for(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(f"{csv_path.stem}-positions.idx")
+
+
+def _quarantine_mtime_ns(csv_path):
+    from validate_db import quarantine_path_for
+
+    try:
+        return quarantine_path_for(csv_path).stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _hash_range(csv_path, start, end, quarantined):
+    """
+    Position keys and row offsets of the rows that start within bytes
+    [start, end).
+    """
+    import chess
+
+    from dedupe import position_key
+    from pgn_input import decode_text
+
+    keys = array("Q")
+    offsets = array("Q")
+    with open(csv_path, "rb") as handle:
+        position = start
+        if start > 0:
+            # Skip the row that straddles the boundary; its owner reads it.
+            handle.seek(start - 1)
+            position = start - 1 + len(handle.readline())
+        while position < end:
+            line = handle.readline()
+            if not line:
+                break
+            offset = position
+            position += len(line)
+            row = next(csv.reader([decode_text(line)]), None)
+            if not row or len(row) < 3 or row[0] == "PuzzleId" or row[0] in quarantined:
+                continue
+            try:
+                board = chess.Board(row[1])
+                board.push(chess.Move.from_uci(row[2].split()[0]))
+            except (ValueError, IndexError, AssertionError):
+                continue
+            keys.append(position_key(board))
+            offsets.append(offset)
+    return keys, offsets
+
+
+def _capacity(count):
+    capacity = 16
+    while capacity < 2 * count:
+        capacity *= 2
+    return capacity
+
+
+def build_position_index(csv_path, workers=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Build the position table for a database and save it next to it.
+
+    When several puzzles share a position the first one in the file is kept.
+    Quarantined puzzles are left out, and the index goes out of date when
+    the quarantine list changes.
+
+    :returns: The index path and the number of positions indexed.
+    """
+    from validate_db import load_quarantine
+
+    csv_path = Path(csv_path)
+    stat = csv_path.stat()
+    quarantine_mtime_ns = _quarantine_mtime_ns(csv_path)
+    quarantined = load_quarantine(csv_path)
+    bounds = list(range(0, stat.st_size, chunk_bytes)) + [stat.st_size]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(ranges) <= 1:
+        parts = [_hash_range(csv_path, start, end, quarantined) for start, end in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_hash_range, csv_path, start, end, quarantined)
+                for start, end in ranges
+            ]
+            parts = [future.result() for future in futures]
+
+    capacity = _capacity(sum(len(keys) for keys, _ in parts))
+    mask = capacity - 1
+    table_keys = array("Q", bytes(8 * capacity))
+    # Offsets are stored plus one, so zero marks an empty slot
+    table_offsets = array("Q", bytes(8 * capacity))
+    count = 0
+    for keys, offsets in parts:
+        for key, offset in zip(keys, offsets):
+            slot = key & mask
+            while table_offsets[slot] and table_keys[slot] != key:
+                slot = (slot + 1) & mask
+            if not table_offsets[slot]:
+                table_keys[slot] = key
+                table_offsets[slot] = offset + 1
+                count += 1
+
+    index_path = index_path_for(csv_path)
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    with open(tmp_path, "wb") as handle:
+        handle.write(
+            _HEADER.pack(
+                _MAGIC, stat.st_size, stat.st_mtime_ns, quarantine_mtime_ns, capacity, count
+            )
+        )
+        table_keys.tofile(handle)
+        table_offsets.tofile(handle)
+    os.replace(tmp_path, index_path)
+    return index_path, count
+
+
+class PositionIndex:
+    """
+    A saved position table and its database, memory-mapped for lookups.
+
+    Raises ValueError when the index file is not a complete position index.
+    """
+
+    def __init__(self, csv_path):
+        from main import LICHESS_COLUMNS
+
+        self.columns = LICHESS_COLUMNS
+        self.csv_path = Path(csv_path)
+        try:
+            self._open()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self):
+        index_path = index_path_for(self.csv_path)
+        self._index_file = open(index_path, "rb")
+        if os.fstat(self._index_file.fileno()).st_size < _HEADER.size:
+            raise ValueError(f"{index_path} is not a position index")
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            self.db_size,
+            self.db_mtime_ns,
+            self.quarantine_mtime_ns,
+            capacity,
+            self.count,
+        ) = _HEADER.unpack_from(self._index)
+        if magic != _MAGIC:
+            raise ValueError(f"{index_path} is not a position index")
+        if capacity & (capacity - 1) or len(self._index) != _HEADER.size + 16 * capacity:
+            raise ValueError(f"{index_path} is truncated or corrupt")
+        self._mask = capacity - 1
+        table = memoryview(self._index)[_HEADER.size :]
+        self._keys = table[: 8 * capacity].cast("Q")
+        self._offsets = table[8 * capacity : 16 * capacity].cast("Q")
+        table.release()
+        self._db_file = open(self.csv_path, "rb")
+        self._db = mmap.mmap(self._db_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def is_current(self):
+        """
+        Whether the database and its quarantine list are unchanged since the
+        index was built.
+        """
+        stat = self.csv_path.stat()
+        return (
+            stat.st_size == self.db_size
+            and stat.st_mtime_ns == self.db_mtime_ns
+            and _quarantine_mtime_ns(self.csv_path) == self.quarantine_mtime_ns
+        )
+
+    def offset(self, board):
+        """
+        Byte offset of the row of the puzzle for `board`, or None.
+        """
+        from dedupe import position_key
+
+        key = position_key(board)
+        slot = key & self._mask
+        while True:
+            stored = self._offsets[slot]
+            if not stored:
+                return None
+            if self._keys[slot] == key:
+                return stored - 1
+            slot = (slot + 1) & self._mask
+
+    def lookup(self, board):
+        """
+        The database row of the puzzle for a board or FEN, as a dict of
+        columns, or None if no puzzle has that position.
+        """
+        from pgn_input import decode_text
+
+        offset = self.offset(board)
+        if offset is None:
+            return None
+        end = self._db.find(b"\n", offset)
+        line = self._db[offset : end if end != -1 else len(self._db)]
+        row = next(csv.reader([decode_text(line.rstrip(b"\r\n"))]), [])
+        return dict(zip(self.columns, row))
+
+    def details(self, board):
+        """
+        Themes, rating and solution (in SAN) of the puzzle for `board`, as
+        label -> text pairs for review, or an empty dict.
+        """
+        import chess
+
+        if not isinstance(board, chess.Board):
+            board = chess.Board(board)
+        row = self.lookup(board)
+        if row is None:
+            return {}
+        moves = row.get("Moves", "").split()[1:]
+        try:
+            solution = board.variation_san([chess.Move.from_uci(move) for move in moves])
+        except ValueError:
+            solution = " ".join(moves)
+        return {
+            "Lichess puzzle": f"https://lichess.org/training/{row['PuzzleId']}",
+            "Themes": row.get("Themes", ""),
+            "Rating": row.get("Rating", ""),
+            "Solution": solution,
+        }
+
+    def close(self):
+        for name in ("_keys", "_offsets"):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        for name in ("_db", "_db_file", "_index", "_index_file"):
+            handle = getattr(self, name, None)
+            if handle is not None:
+                handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_position_index(csv_path):
+    """
+    The position index of a database, or None if it has not been built, it
+    cannot be read, or the database or its quarantine list has changed since.
+    """
+    if not index_path_for(csv_path).exists() or not Path(csv_path).exists():
+        return None
+    try:
+        index = PositionIndex(csv_path)
+    except (OSError, ValueError) as exc:
+        print(
+            f"Cannot use the position index: {exc}; rebuild it with wuzzle-positions "
+            "to show Lichess puzzle details."
+        )
+        return None
+    if not index.is_current():
+        print(
+            f"{index_path_for(csv_path)} is out of date; rebuild it with wuzzle-positions "
+            "to show Lichess puzzle details."
+        )
+        index.close()
+        return None
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Index the Lichess puzzle database by position, so puzzles from other sources "
+            "show their Lichess themes, rating and solution."
+        )
+    )
+    parser.add_argument(
+        "--lichess-db",
+        type=str,
+        default=str(DEFAULT_LICHESS_DB),
+        help="Path to lichess_db_puzzle.csv.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes (defaults to the number of CPUs).",
+    )
+    args = parser.parse_args()
+
+    csv_path = Path(args.lichess_db)
+    if not csv_path.exists():
+        raise SystemExit(f"Lichess DB not found at {csv_path}")
+    index_path, count = build_position_index(csv_path, workers=args.workers)
+    print(f"Indexed {count} positions in {index_path}")
+
+
+if __name__ == "__main__":
+    main()
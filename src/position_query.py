@@ -0,0 +1,344 @@
+"""
+A small Chess Query Language-style pattern language over positions.
+
+Queries are evaluated with python-chess bitboard operations, so a whole PGN
+can be searched at parse speed without an engine. Terms written next to each
+other must all hold; `and`, `or`, `not` and parentheses combine them.
+
+Piece designators are a piece part followed by an optional square part:
+
+    R           white rook anywhere          [RQ]     white rook or queen
+    p[a-h]6     black pawn on the 6th rank   A / a    any white / black piece
+    Nf3         white knight on f3           q[ace][1-3]
+
+Terms:
+
+    R, p[a-h]6, ...      a matching piece is on the board
+    #R == 2              piece counts (==, =, !=, <, <=, >, >=)
+    material:KRP*krp*    exact material; `X*` allows any number of X and
+                         kings may be omitted
+    attacks(N, q)        a piece of the first designator attacks the second
+    pinned(n)            a matching piece is pinned to its king
+    passed(P[a-h]6)      a matching pawn is passed
+    wtm, btm             side to move
+    check, mate, stalemate
+
+For example, white rook endgames with a passed pawn on the sixth rank:
+
+    material:KRP*krp* passed(P[a-h]6)
+"""
+
+import re
+from functools import partial
+
+import chess
+import chess.pgn
+
+from pgn_stream import MainlineVisitor
+
+_TOKEN_REGEX = re.compile(r"\s*(?:(<=|>=|==|!=|<|>|=)|([(),])|([^\s(),<>=!]+))")
+_DESIGNATOR_REGEX = re.compile(
+    r"^(?P<pieces>[KQRBNPkqrbnpAa]|\[[KQRBNPkqrbnpAa]+\])"
+    r"(?:(?P<files>[a-h]|\[[a-h-]+\])(?P<ranks>[1-8]|\[[1-8-]+\]))?$"
+)
+_MATERIAL_REGEX = re.compile(r"^(?:[KQRBNPkqrbnp]\*?)+$")
+_COMPARATORS = {
+    "==": lambda a, b: a == b,
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+_FLAGS = {
+    "wtm": lambda board: board.turn == chess.WHITE,
+    "btm": lambda board: board.turn == chess.BLACK,
+    "check": lambda board: board.is_check(),
+    "mate": lambda board: board.is_checkmate(),
+    "stalemate": lambda board: board.is_stalemate(),
+}
+
+
+def _front_span(color, square):
+    file = chess.square_file(square)
+    rank = chess.square_rank(square)
+    files = 0
+    for f in range(max(file - 1, 0), min(file + 1, 7) + 1):
+        files |= chess.BB_FILES[f]
+    ranks = 0
+    for r in range(rank + 1, 8) if color == chess.WHITE else range(rank):
+        ranks |= chess.BB_RANKS[r]
+    return files & ranks
+
+
+_FRONT_SPANS = {
+    color: [_front_span(color, square) for square in chess.SQUARES] for color in chess.COLORS
+}
+
+
+def _expand(spec, first, last):
+    """
+    Expand `x`, `[xyz]` or `[x-z]` into the covered indices.
+    """
+    if not spec.startswith("["):
+        return [ord(spec) - ord(first)]
+    body = spec[1:-1]
+    indices = []
+    i = 0
+    while i < len(body):
+        start = body[i]
+        end = start
+        if i + 2 < len(body) and body[i + 1] == "-":
+            end = body[i + 2]
+            i += 3
+        else:
+            i += 1
+        if not (first <= start <= end <= last):
+            raise ValueError(f"Invalid square range {spec!r}")
+        indices.extend(range(ord(start) - ord(first), ord(end) - ord(first) + 1))
+    return indices
+
+
+def _parse_designator(word):
+    """
+    Return a function mapping a board to the bitboard of matching pieces.
+    """
+    match = _DESIGNATOR_REGEX.match(word)
+    if not match:
+        raise ValueError(f"Invalid piece designator {word!r}")
+
+    pieces = match.group("pieces").strip("[]")
+    kinds = []
+    for symbol in pieces:
+        if symbol in "Aa":
+            color = chess.WHITE if symbol == "A" else chess.BLACK
+            kinds.extend((color, piece_type) for piece_type in chess.PIECE_TYPES)
+        else:
+            piece = chess.Piece.from_symbol(symbol)
+            kinds.append((piece.color, piece.piece_type))
+
+    squares = chess.BB_ALL
+    if match.group("files"):
+        files = 0
+        for f in _expand(match.group("files"), "a", "h"):
+            files |= chess.BB_FILES[f]
+        ranks = 0
+        for r in _expand(match.group("ranks"), "1", "8"):
+            ranks |= chess.BB_RANKS[r]
+        squares = files & ranks
+
+    def mask(board):
+        result = 0
+        for color, piece_type in kinds:
+            result |= board.pieces_mask(piece_type, color)
+        return result & squares
+
+    return mask
+
+
+def _parse_material(signature):
+    if not _MATERIAL_REGEX.match(signature):
+        raise ValueError(f"Invalid material signature {signature!r}")
+    exact = {}
+    wildcard = {"K", "k"}
+    for symbol, star in re.findall(r"([KQRBNPkqrbnp])(\*?)", signature):
+        if star:
+            wildcard.add(symbol)
+        else:
+            exact[symbol] = exact.get(symbol, 0) + 1
+            wildcard.discard(symbol)
+    checks = []
+    for symbol in "KQRBNPkqrbnp":
+        if symbol in wildcard:
+            continue
+        piece = chess.Piece.from_symbol(symbol)
+        checks.append((piece.piece_type, piece.color, exact.get(symbol, 0)))
+
+    def matches(board):
+        for piece_type, color, count in checks:
+            if chess.popcount(board.pieces_mask(piece_type, color)) != count:
+                return False
+        return True
+
+    return matches
+
+
+def _attacks(attackers, targets, board):
+    target_mask = targets(board)
+    if not target_mask:
+        return False
+    for square in chess.scan_forward(attackers(board)):
+        if board.attacks_mask(square) & target_mask:
+            return True
+    return False
+
+
+def _pinned(pieces, board):
+    for square in chess.scan_forward(pieces(board)):
+        if board.is_pinned(board.color_at(square), square):
+            return True
+    return False
+
+
+def _passed(pawns, board):
+    for square in chess.scan_forward(pawns(board) & board.pawns):
+        color = board.color_at(square)
+        if not _FRONT_SPANS[color][square] & board.pieces_mask(chess.PAWN, not color):
+            return True
+    return False
+
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            match = _TOKEN_REGEX.match(text, pos)
+            if not match or match.end() == pos:
+                raise ValueError(f"Invalid query near {text[pos:]!r}")
+            self.tokens.append(match.group(match.lastindex))
+            pos = match.end()
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            wanted = expected or "a term"
+            raise ValueError(f"Expected {wanted!r} but found {token!r}")
+        self.index += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty query.")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected {self.peek()!r}")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == "or":
+            self.take()
+            nodes.append(self.parse_and())
+        if len(nodes) == 1:
+            return nodes[0]
+        return lambda board: any(node(board) for node in nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() not in (None, "or", ")", ","):
+            if self.peek() == "and":
+                self.take()
+            nodes.append(self.parse_not())
+        if len(nodes) == 1:
+            return nodes[0]
+        return lambda board: all(node(board) for node in nodes)
+
+    def parse_not(self):
+        if self.peek() == "not":
+            self.take()
+            node = self.parse_not()
+            return lambda board: not node(board)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.take()
+        if token == "(":
+            node = self.parse_or()
+            self.take(")")
+            return node
+        if token in _FLAGS:
+            return _FLAGS[token]
+        if token.startswith("material:"):
+            return _parse_material(token[len("material:") :])
+        if token.startswith("#"):
+            pieces = _parse_designator(token[1:])
+            op = self.take()
+            if op not in _COMPARATORS:
+                raise ValueError(f"Expected a comparison after {token!r}")
+            value = self.take()
+            if not value.isdigit():
+                raise ValueError(f"Expected a number after {token} {op}")
+            compare = _COMPARATORS[op]
+            count = int(value)
+            return lambda board: compare(chess.popcount(pieces(board)), count)
+        if token in ("attacks", "pinned", "passed") and self.peek() == "(":
+            self.take("(")
+            first = _parse_designator(self.take())
+            if token == "attacks":
+                self.take(",")
+                second = _parse_designator(self.take())
+                self.take(")")
+                return partial(_attacks, first, second)
+            self.take(")")
+            return partial(_pinned if token == "pinned" else _passed, first)
+        pieces = _parse_designator(token)
+        return lambda board: bool(pieces(board))
+
+
+class PositionQuery:
+    """
+    A compiled position query. See the module docstring for the syntax.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._matches = _Parser(text).parse()
+
+    def matches(self, board):
+        return self._matches(board)
+
+    def __repr__(self):
+        return f"PositionQuery({self.text!r})"
+
+
+class QueryVisitor(MainlineVisitor):
+    """
+    Evaluate a query against every mainline position while the game is parsed.
+
+    The result is the game headers and the matching positions; with
+    `first_only` only the first match of each game is kept and later
+    positions are no longer evaluated.
+    """
+
+    def __init__(self, query, first_only=True):
+        self.query = query
+        self.first_only = first_only
+
+    def begin_game(self):
+        super().begin_game()
+        self.matches = []
+        self._last_ply = None
+
+    def visit_board(self, board):
+        ply = len(board.move_stack)
+        if ply == self._last_ply or (self.first_only and self.matches):
+            return
+        self._last_ply = ply
+        if self.query.matches(board):
+            self.matches.append(board.copy(stack=False))
+
+    def result(self):
+        return self.headers, self.matches
+
+
+def iter_matching_positions(pgn, query, first_only=True):
+    """
+    Yield `(board, headers)` for positions of an open PGN file matching `query`.
+    """
+    if not isinstance(query, PositionQuery):
+        query = PositionQuery(query)
+    visitor = partial(QueryVisitor, query, first_only)
+    while True:
+        game = chess.pgn.read_game(pgn, Visitor=visitor)
+        if game is None:
+            break
+        headers, matches = game
+        for board in matches:
+            yield board, headers
@@ -0,0 +1,283 @@
+"""
+Per-stage timing and memory spans for `wuzzle-cli --profile`.
+
+Code marks pipeline stages with `span`, which does nothing until `enable` is
+called, so instrumented code pays almost nothing in normal runs:
+
+    with span("read_csv") as stage:
+        df = pd.read_csv(path)
+        stage.add_items(len(df))
+
+Interactive prompts go through `prompt`, and the time spent waiting on them
+is left out of the wall time of every span open at the time, except spans
+marked `exclude_input=False` for work that carries on in the background
+while the user types. Each span records wall time, CPU time of its thread,
+the process's peak RSS when it ends and an item count. `write_trace` saves
+the spans in the Chrome trace event format (load it in chrome://tracing or
+https://ui.perfetto.dev) and `format_summary` totals them per stage.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_recorder = None
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_items(self, count):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    One timed stage. Use `span` rather than creating these directly.
+    """
+
+    def __init__(self, recorder, name, category, track, exclude_input, args):
+        self.recorder = recorder
+        self.name = name
+        self.category = category
+        self.track = track
+        self.exclude_input = exclude_input
+        self.args = args
+        self.items = 0
+
+    def add_items(self, count):
+        self.items += count
+
+    def __enter__(self):
+        self.tid = self.track or threading.get_ident()
+        self.input_wait = self.recorder.input_wait
+        self.cpu = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        wall = end - self.start
+        waited = self.recorder.input_wait - self.input_wait if self.exclude_input else 0.0
+        self.recorder.add(
+            {
+                "name": self.name,
+                "category": self.category,
+                "tid": self.tid,
+                "start": self.start,
+                "wall": wall,
+                "active": max(0.0, wall - waited),
+                "input_wait": waited,
+                "cpu": time.thread_time() - self.cpu,
+                "peak_rss": _peak_rss_bytes(),
+                "items": self.items,
+                "args": self.args,
+            }
+        )
+        return False
+
+
+class Recorder:
+    """
+    Collects finished spans from any thread.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.input_wait = 0.0
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def wait_for_input(self, text):
+        start = time.perf_counter()
+        try:
+            return input(text)
+        finally:
+            waited = time.perf_counter() - start
+            with self._lock:
+                self.input_wait += waited
+                self.spans.append(
+                    {
+                        "name": "input",
+                        "category": "input",
+                        "tid": threading.get_ident(),
+                        "start": start,
+                        "wall": waited,
+                        "active": 0.0,
+                        "input_wait": waited,
+                        "cpu": 0.0,
+                        "peak_rss": None,
+                        "items": 0,
+                        "args": {"prompt": text.strip()},
+                    }
+                )
+
+
+def enable():
+    """
+    Start recording spans, discarding any recorded before.
+    """
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def disable():
+    """
+    Stop recording and return the recorder, or None if recording was off.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def span(name, category="stage", track=None, exclude_input=True, **args):
+    """
+    Context manager timing the stage `name`; a no-op unless recording.
+
+    `track` names the row the span is drawn on in the trace (default: the
+    current thread). Extra keyword arguments are stored with the span.
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+    return Span(_recorder, name, category, track, exclude_input, args)
+
+
+def prompt(text):
+    """
+    `input(text)`, with the wait left out of the recorded spans.
+    """
+    if _recorder is None:
+        return input(text)
+    return _recorder.wait_for_input(text)
+
+
+def trace_events(recorder):
+    """
+    The recorded spans as Chrome trace events.
+    """
+    pid = os.getpid()
+    tids = {}
+    events = []
+    for record in sorted(recorder.spans, key=lambda record: record["start"]):
+        tid = record["tid"]
+        if tid not in tids:
+            tids[tid] = len(tids) + 1
+            name = tid if isinstance(tid, str) else f"thread {tids[tid]}"
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tids[tid],
+                    "args": {"name": name},
+                }
+            )
+        args = dict(record["args"])
+        args.update(
+            {
+                "active_ms": round(record["active"] * 1000, 3),
+                "input_wait_ms": round(record["input_wait"] * 1000, 3),
+                "cpu_ms": round(record["cpu"] * 1000, 3),
+                "items": record["items"],
+            }
+        )
+        if record["peak_rss"] is not None:
+            args["peak_rss_mb"] = round(record["peak_rss"] / 2**20, 1)
+        events.append(
+            {
+                "name": record["name"],
+                "cat": record["category"],
+                "ph": "X",
+                "ts": round((record["start"] - recorder.origin) * 1e6, 1),
+                "dur": round(record["wall"] * 1e6, 1),
+                "pid": pid,
+                "tid": tids[tid],
+                "args": args,
+            }
+        )
+    return events
+
+
+def write_trace(recorder, path):
+    """
+    Save the recorded spans as a Chrome trace JSON file.
+    """
+    with open(path, "w") as handle:
+        json.dump({"traceEvents": trace_events(recorder), "displayTimeUnit": "ms"}, handle)
+
+
+def summarize(recorder):
+    """
+    Totals per stage, in the order stages first started.
+
+    :returns: A list of dicts with name, calls, active (wall time without
+        input waits), cpu, peak_rss and items.
+    """
+    stages = {}
+    for record in sorted(recorder.spans, key=lambda record: record["start"]):
+        if record["category"] == "input":
+            continue
+        stage = stages.setdefault(
+            record["name"],
+            {
+                "name": record["name"],
+                "calls": 0,
+                "active": 0.0,
+                "cpu": 0.0,
+                "peak_rss": None,
+                "items": 0,
+            },
+        )
+        stage["calls"] += 1
+        stage["active"] += record["active"]
+        stage["cpu"] += record["cpu"]
+        stage["items"] += record["items"]
+        if record["peak_rss"] is not None:
+            stage["peak_rss"] = max(stage["peak_rss"] or 0, record["peak_rss"])
+    return list(stages.values())
+
+
+def format_summary(recorder):
+    """
+    A table of `summarize`, followed by the total time spent waiting for input.
+    """
+    stages = summarize(recorder)
+    width = max([len(stage["name"]) for stage in stages] + [5])
+    lines = [
+        f"{'stage':<{width}}  {'calls':>6}  {'wall ms':>10}  {'cpu ms':>10}"
+        f"  {'peak MB':>8}  {'items':>7}"
+    ]
+    for stage in stages:
+        peak = f"{stage['peak_rss'] / 2**20:.1f}" if stage["peak_rss"] is not None else "-"
+        lines.append(
+            f"{stage['name']:<{width}}  {stage['calls']:>6}  {stage['active'] * 1000:>10.1f}"
+            f"  {stage['cpu'] * 1000:>10.1f}  {peak:>8}  {stage['items']:>7}"
+        )
+    lines.append(f"Waiting for input (excluded): {recorder.input_wait:.1f} s")
+    return "\n".join(lines)
@@ -0,0 +1,432 @@
+"""
+Long-running puzzle service for `wuzzle-cli serve`.
+
+The Lichess database is loaded once into a `PuzzleIndex` with a row index per
+theme, the board renderer is warmed up with one render, and rendered boards
+are cached, so requests skip the start-up costs of a CLI run. Boards are
+rendered with one image profile for the whole service:
+
+    GET  /health                  puzzle and theme counts
+    GET  /themes                  puzzles per theme
+    GET  /puzzles?themes=fork,pin&n=10&seed=1&min_rating=1200&max_rating=1800
+    GET  /board.png?fen=<FEN>
+    POST /sheet                   {"themes": "fork", "n": 12, "seed": 1, "title": "...",
+                                   "squad": "...", "blurb": "...", "author": "...",
+                                   "fens": [...], "format": "pdf" | "tex"}
+
+/sheet answers with the compiled PDF, or with a zip of the .tex file and its
+images for "tex". Giving "fens" uses those positions instead of a query.
+Requests are handled concurrently, on a TCP port bound to localhost or on a
+Unix socket.
+"""
+import io
+import json
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import traceback
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from profiling import span
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+DEFAULT_N = 10
+MAX_N = 200
+BOARD_CACHE_SIZE = 4096
+RENDER_THREADS = 4
+_LATEX_SPECIALS = {
+    "\\": r"\textbackslash{}",
+    "{": r"\{",
+    "}": r"\}",
+    "$": r"\$",
+    "&": r"\&",
+    "#": r"\#",
+    "%": r"\%",
+    "_": r"\_",
+    "^": r"\^{}",
+    "~": r"\~{}",
+}
+
+
+def _latex_escape(text):
+    return "".join(_LATEX_SPECIALS.get(char, char) for char in str(text or ""))
+
+
+def _themes_list(themes):
+    if isinstance(themes, (list, tuple)):
+        return [str(t).strip() for t in themes if str(t).strip()]
+    return [t.strip() for t in str(themes or "").split(",") if t.strip()]
+
+
+class PuzzleIndex:
+    """
+    The Lichess puzzles in memory, with the rows of each theme indexed.
+
+    Themes are matched as whole tags, so "mate" does not match "mateIn2".
+    """
+
+    def __init__(self, df):
+        import numpy as np
+        import pandas as pd
+
+        self.df = df.reset_index(drop=True)
+        self.ratings = pd.to_numeric(self.df["Rating"], errors="coerce").to_numpy()
+        with span("index_themes") as stage:
+            tags = self.df["Themes"].fillna("").str.split().explode()
+            rows = tags.index.to_numpy()
+            self.theme_rows = {
+                theme: np.sort(rows[positions])
+                for theme, positions in tags.groupby(tags).indices.items()
+            }
+            stage.add_items(len(self.df))
+
+    @classmethod
+    def load(cls, lichess_db_path):
+        from main import load_lichess_db
+
+        return cls(load_lichess_db(lichess_db_path))
+
+    def __len__(self):
+        return len(self.df)
+
+    def theme_counts(self):
+        return {theme: len(rows) for theme, rows in sorted(self.theme_rows.items())}
+
+    def query(self, themes, n=DEFAULT_N, seed=None, min_rating=None, max_rating=None):
+        """
+        Draw up to `n` distinct puzzles tagged with every theme in `themes`.
+        Rows whose FEN or first move cannot be played are skipped.
+
+        :returns: Dicts with the puzzle id, the FEN after the opponent's first
+            move, the solution moves in UCI, themes, rating and game URL.
+        """
+        import chess
+        import numpy as np
+        from dedupe import PositionSet
+
+        themes = _themes_list(themes)
+        unknown = [theme for theme in themes if theme not in self.theme_rows]
+        if unknown:
+            raise ValueError(f"Unknown theme(s): {', '.join(unknown)}")
+        rows = np.arange(len(self.df))
+        for theme in themes:
+            rows = np.intersect1d(rows, self.theme_rows[theme], assume_unique=True)
+        if min_rating is not None:
+            rows = rows[self.ratings[rows] >= min_rating]
+        if max_rating is not None:
+            rows = rows[self.ratings[rows] <= max_rating]
+
+        seen = PositionSet()
+        puzzles = []
+        for row_number in np.random.default_rng(seed).permutation(rows):
+            row = self.df.iloc[row_number]
+            try:
+                moves = row["Moves"].split()
+                board = chess.Board(row["FEN"])
+                board.push(chess.Move.from_uci(moves[0]))
+            except (ValueError, IndexError, AssertionError, AttributeError):
+                continue
+            if not seen.add(board):
+                continue
+            rating = self.ratings[row_number]
+            puzzles.append(
+                {
+                    "id": str(row["PuzzleId"]),
+                    "fen": board.fen(),
+                    "solution": moves[1:],
+                    "themes": str(row["Themes"]).split(),
+                    "rating": None if np.isnan(rating) else int(rating),
+                    "url": str(row["GameUrl"]),
+                }
+            )
+            if len(puzzles) == n:
+                break
+        return puzzles
+
+
+class BoardCache:
+    """
+    Rendered boards as PNG bytes, keyed by position and evicted least
+    recently used first. `profile` names the `fen2tex.IMAGE_PROFILES` entry
+    to render with.
+    """
+
+    def __init__(self, maxsize=BOARD_CACHE_SIZE, profile="screen"):
+        self.maxsize = maxsize
+        self.profile = profile
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fen):
+        from dedupe import position_key
+        from review_server import render_board
+
+        key = position_key(fen)
+        with self._lock:
+            if key in self._boards:
+                self._boards.move_to_end(key)
+                return self._boards[key]
+        with span("render_board"):
+            png = render_board(fen, self.profile)
+        with self._lock:
+            self._boards[key] = png
+            while len(self._boards) > self.maxsize:
+                self._boards.popitem(last=False)
+        return png
+
+
+class PuzzleService:
+    """
+    The work behind each endpoint, shared by all request threads.
+    """
+
+    def __init__(self, index, boards=None):
+        self.index = index
+        self.boards = boards or BoardCache()
+        self._executor = ThreadPoolExecutor(
+            max_workers=RENDER_THREADS, thread_name_prefix="serve-render"
+        )
+
+    def warm_up(self):
+        """
+        Render one board so the renderer and its imports are loaded.
+        """
+        import chess
+
+        self.boards.get(chess.STARTING_FEN)
+
+    def health(self):
+        return {"puzzles": len(self.index), "themes": len(self.index.theme_rows)}
+
+    def board(self, fen):
+        import chess
+
+        return self.boards.get(chess.Board(fen).fen())
+
+    def sheet(self, request):
+        """
+        Build a sheet for a /sheet request.
+
+        :returns: `(body, content type)`.
+        """
+        from fen2tex import compile_pdf, fen2tex
+
+        output = request.get("format", "pdf")
+        if output not in ("pdf", "tex"):
+            raise ValueError("format must be pdf or tex")
+        if output == "pdf" and shutil.which("pdflatex") is None:
+            raise RuntimeError("pdflatex is not installed; request format tex instead")
+        fens = request.get("fens")
+        if fens is None:
+            puzzles = self.index.query(
+                request.get("themes", ""),
+                _int(request.get("n", DEFAULT_N), "n", 1, MAX_N),
+                seed=_optional_int(request, "seed"),
+                min_rating=_optional_int(request, "min_rating"),
+                max_rating=_optional_int(request, "max_rating"),
+            )
+            fens = [puzzle["fen"] for puzzle in puzzles]
+        if not isinstance(fens, list) or not all(isinstance(fen, str) for fen in fens):
+            raise ValueError("fens must be a list of FEN strings")
+        if not fens:
+            raise ValueError("No puzzles match the request.")
+        if len(fens) > MAX_N:
+            raise ValueError(f"At most {MAX_N} puzzles fit on one sheet")
+
+        with tempfile.TemporaryDirectory(prefix="wuzzle-sheet-") as tmp:
+            sheet_dir = Path(tmp)
+            img_dir = sheet_dir / "images"
+            img_dir.mkdir()
+            pngs = list(self._executor.map(self.board, fens))
+            for idx, png in enumerate(pngs):
+                (img_dir / f"puzzle_{idx}.png").write_bytes(png)
+            tex_path = sheet_dir / "sheet.tex"
+            fen2tex(
+                tex_path,
+                img_dir,
+                [""] * len(fens),
+                title=_latex_escape(request.get("title")),
+                squad=_latex_escape(request.get("squad")),
+                blurb=_latex_escape(request.get("blurb")),
+                author=_latex_escape(request.get("author")),
+                run_pdflatex=False,
+                open_pdf=False,
+            )
+            if output == "pdf":
+                pdf_path = compile_pdf(tex_path, interactive=False)
+                if not pdf_path.exists():
+                    raise RuntimeError("pdflatex failed to build the sheet")
+                return pdf_path.read_bytes(), "application/pdf"
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w") as archive:
+                archive.write(tex_path, tex_path.name)
+                for path in sorted(img_dir.iterdir()):
+                    archive.write(path, f"images/{path.name}")
+            return buffer.getvalue(), "application/zip"
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _int(value, name, low=None, high=None):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+    if (low is not None and number < low) or (high is not None and number > high):
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return number
+
+
+def _optional_int(params, name):
+    """
+    `params[name]` as an int, or None when absent; query string values are lists.
+    """
+    value = params.get(name)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return None if value is None else _int(value, name)
+
+
+def _handler_for(service):
+    class Handler(BaseHTTPRequestHandler):
+        # Unix socket clients have no address to log
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, data):
+            self._send(status, json.dumps(data).encode("utf-8"), "application/json")
+
+        def _handle(self, respond):
+            try:
+                respond()
+            except ValueError as exc:
+                self._send_json(400, {"error": str(exc)})
+            except RuntimeError as exc:
+                self._send_json(503, {"error": str(exc)})
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client went away
+            except Exception:
+                print(f"Error handling {self.command} {self.path}:", file=sys.stderr)
+                traceback.print_exc()
+                self._send_json(500, {"error": "Internal server error"})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path == "/health":
+                self._send_json(200, service.health())
+            elif url.path == "/themes":
+                self._send_json(200, service.index.theme_counts())
+            elif url.path == "/puzzles":
+
+                def respond():
+                    puzzles = service.index.query(
+                        params.get("themes", [""])[0],
+                        _int(params.get("n", [DEFAULT_N])[0], "n", 1, MAX_N),
+                        seed=_optional_int(params, "seed"),
+                        min_rating=_optional_int(params, "min_rating"),
+                        max_rating=_optional_int(params, "max_rating"),
+                    )
+                    self._send_json(200, {"puzzles": puzzles})
+
+                self._handle(respond)
+            elif url.path == "/board.png":
+
+                def respond():
+                    if "fen" not in params:
+                        raise ValueError("fen is required")
+                    self._send(200, service.board(params["fen"][0]), "image/png")
+
+                self._handle(respond)
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/sheet":
+                self._send_json(404, {"error": "Not found"})
+                return
+
+            def respond():
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    raise ValueError("Expected a JSON body")
+                if not isinstance(request, dict):
+                    raise ValueError("Expected a JSON object")
+                body, content_type = service.sheet(request)
+                self._send(200, body, content_type)
+
+            self._handle(respond)
+
+    return Handler
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """
+    An HTTP server for `service` on `host:port`, or on a Unix socket.
+    """
+    handler = _handler_for(service)
+    if socket_path is not None:
+        Path(socket_path).unlink(missing_ok=True)
+        return _UnixHTTPServer(str(socket_path), handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(lichess_db_path, port=DEFAULT_PORT, socket_path=None, profile="screen"):
+    """
+    Load the database, warm up the renderer and serve until interrupted.
+
+    :returns: The process exit code.
+    """
+    if not Path(lichess_db_path).exists():
+        print(f"Lichess DB not found at {lichess_db_path}")
+        return 1
+    print(f"Loading {lichess_db_path}...")
+    service = PuzzleService(PuzzleIndex.load(lichess_db_path), BoardCache(profile=profile))
+    try:
+        service.warm_up()
+    except (ImportError, OSError) as exc:
+        print(f"Board rendering unavailable: {exc}")
+    try:
+        server = make_server(service, port=port, socket_path=socket_path)
+    except OSError as exc:
+        print(f"Could not start the server: {exc}")
+        return 1
+    if socket_path is not None:
+        print(f"Serving {len(service.index)} puzzles on {socket_path}")
+    else:
+        host, port = server.server_address[:2]
+        print(f"Serving {len(service.index)} puzzles at http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path is not None:
+            Path(socket_path).unlink(missing_ok=True)
+    return 0
@@ -0,0 +1,383 @@
+"""
+Local web UI for reviewing puzzle candidates.
+
+The page and the board images are served from this machine, so review works
+offline: each candidate is shown as a locally rendered board with its
+details (themes, rating, solution line), and is accepted or rejected from
+the keyboard. Boards for the next few candidates are rendered ahead of time
+and preloaded by the page.
+"""
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Candidates drawn and rendered ahead of the one on screen.
+LOOKAHEAD = 5
+DECISION_TIMEOUT = 30
+
+
+class Candidate:
+    """
+    A position offered for review.
+
+    `details` are label -> text pairs shown next to the board, and `caption`
+    turns the reviewer's comment into the caption used on the sheet.
+    """
+
+    def __init__(self, fen, url, details=None, caption=None):
+        self.fen = fen
+        self.url = url
+        self.details = details or {}
+        self._caption = caption
+
+    def caption(self, comment):
+        if self._caption is None:
+            return comment
+        return self._caption(comment)
+
+
+def render_board(fen, profile="screen"):
+    """
+    PNG bytes of the board as drawn on the puzzle sheet, saved with the
+    `fen2tex.IMAGE_PROFILES` entry `profile`.
+    """
+    from fen2tex import fen2png
+
+    buffer = io.BytesIO()
+    fen2png(fen, buffer, profile=profile)
+    return buffer.getvalue()
+
+
+class ReviewServer:
+    """
+    Serve the review page on `host:port` until `close`.
+
+    `review` has the same signature as `main.review_in_terminal` and can be
+    passed as the `reviewer` of the selection functions.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, lookahead=LOOKAHEAD):
+        self.lookahead = lookahead
+        self._condition = threading.Condition()
+        self._queue = []
+        self._boards = {}
+        self._decision = None
+        self._next_id = 0
+        self._accepted = 0
+        self._reviewed = 0
+        self._target = 0
+        self._done = False
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="review-render")
+        self.httpd = ThreadingHTTPServer((host, port), _handler_for(self))
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _fill(self, candidates):
+        """
+        Draw candidates until `lookahead` are waiting behind the current one.
+        """
+        while len(self._queue) <= self.lookahead:
+            candidate = next(candidates, None)
+            if candidate is None:
+                return
+            with self._condition:
+                candidate_id = self._next_id
+                self._next_id += 1
+                self._boards[candidate_id] = self._executor.submit(render_board, candidate.fen)
+                self._queue.append((candidate_id, candidate))
+                self._condition.notify_all()
+
+    def review(self, candidates, n, on_accept=None):
+        """
+        Review candidates in the browser until `n` are accepted.
+
+        :returns: The accepted FENs, their captions, and whether the
+            candidates ran out first.
+        """
+        puzzles = []
+        comments = []
+        with self._condition:
+            self._accepted = 0
+            self._reviewed = 0
+            self._target = n
+            self._done = False
+        try:
+            while len(puzzles) < n:
+                self._fill(candidates)
+                with self._condition:
+                    if not self._queue:
+                        return puzzles, comments, True
+                    candidate_id, candidate = self._queue[0]
+                    while self._decision is None or self._decision[0] != candidate_id:
+                        self._condition.wait()
+                    _, accept, comment = self._decision
+                    self._decision = None
+                    self._queue.pop(0)
+                    self._boards.pop(candidate_id, None)
+                    self._reviewed += 1
+                    if accept:
+                        self._accepted += 1
+                if accept:
+                    puzzles.append(candidate.fen)
+                    if on_accept is not None:
+                        on_accept(candidate.fen)
+                    comments.append(candidate.caption(comment))
+                with self._condition:
+                    self._condition.notify_all()
+            return puzzles, comments, False
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def state(self):
+        with self._condition:
+            return self._state()
+
+    def _state(self):
+        state = {
+            "done": self._done,
+            "accepted": self._accepted,
+            "reviewed": self._reviewed,
+            "target": self._target,
+            "current": None,
+            "upcoming": [candidate_id for candidate_id, _ in self._queue[1:]],
+        }
+        if self._queue and not self._done:
+            candidate_id, candidate = self._queue[0]
+            state["current"] = {
+                "id": candidate_id,
+                "fen": candidate.fen,
+                "url": candidate.url,
+                "details": candidate.details,
+            }
+        return state
+
+    def decide(self, candidate_id, accept, comment=""):
+        """
+        Record a decision for the current candidate and wait for the next one.
+
+        :returns: The new state, or None if `candidate_id` is not current.
+        """
+        with self._condition:
+            if self._done or not self._queue or self._queue[0][0] != candidate_id:
+                return None
+            self._decision = (candidate_id, accept, comment)
+            self._condition.notify_all()
+            self._condition.wait_for(
+                lambda: self._done or not self._queue or self._queue[0][0] != candidate_id,
+                timeout=DECISION_TIMEOUT,
+            )
+            return self._state()
+
+    def board(self, candidate_id):
+        """
+        PNG bytes for a queued candidate, or None if it is not queued.
+        """
+        with self._condition:
+            future = self._boards.get(candidate_id)
+        return None if future is None else future.result()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _handler_for(server):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, data):
+            self._send(status, json.dumps(data).encode("utf-8"), "application/json")
+
+        def do_GET(self):
+            if self.path == "/":
+                self._send(200, PAGE.encode("utf-8"), "text/html; charset=utf-8")
+            elif self.path == "/api/state":
+                self._send_json(200, server.state())
+            elif self.path.startswith("/board/") and self.path.endswith(".png"):
+                try:
+                    png = server.board(int(self.path[len("/board/") : -len(".png")]))
+                except ValueError:
+                    png = None
+                if png is None:
+                    self._send(404, b"Not found", "text/plain")
+                else:
+                    self._send(200, png, "image/png")
+            else:
+                self._send(404, b"Not found", "text/plain")
+
+        def do_POST(self):
+            if self.path != "/api/decision":
+                self._send(404, b"Not found", "text/plain")
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length))
+                state = server.decide(
+                    int(data["id"]), bool(data["accept"]), str(data.get("comment", ""))
+                )
+            except (KeyError, TypeError, ValueError):
+                self._send_json(400, {"error": "Expected id, accept and comment."})
+                return
+            if state is None:
+                self._send_json(409, server.state())
+            else:
+                self._send_json(200, state)
+
+    return Handler
+
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Wuzzle review</title>
+<style>
+  body { font-family: sans-serif; margin: 2em auto; max-width: 60em; color: #222; }
+  main { display: flex; gap: 2em; align-items: flex-start; }
+  #board { width: 400px; height: 400px; border: 1px solid #ccc; }
+  dl { margin: 0 0 1em; }
+  dt { font-weight: bold; margin-top: .5em; }
+  input { width: 100%; font-size: 1em; padding: .3em; box-sizing: border-box; }
+  kbd { border: 1px solid #aaa; border-radius: 3px; padding: 0 .3em; }
+  .help { color: #666; font-size: .9em; }
+  #status { margin-bottom: 1em; }
+</style>
+</head>
+<body>
+<div id="status">Loading candidates...</div>
+<main>
+  <img id="board" alt="">
+  <section>
+    <dl id="details"></dl>
+    <p><a id="link" target="_blank" rel="noopener">Open on Lichess</a></p>
+    <input id="comment" placeholder="Comment (press c to edit, Enter to accept)">
+    <p class="help">
+      <kbd>a</kbd> accept &nbsp; <kbd>r</kbd> reject &nbsp;
+      <kbd>c</kbd> comment &nbsp; <kbd>Esc</kbd> leave the comment field
+    </p>
+  </section>
+</main>
+<script>
+let current = null;
+let busy = false;
+const preloaded = {};
+
+function show(state) {
+  const status = document.getElementById("status");
+  status.textContent = state.accepted + " / " + state.target + " accepted, "
+    + state.reviewed + " reviewed";
+  for (const id of state.upcoming) {
+    if (!preloaded[id]) {
+      preloaded[id] = new Image();
+      preloaded[id].src = "/board/" + id + ".png";
+    }
+  }
+  if (state.done) {
+    current = null;
+    status.textContent += ". Review finished; return to the terminal.";
+    return;
+  }
+  if (!state.current) {
+    current = null;
+    setTimeout(refresh, 300);
+    return;
+  }
+  if (current && current.id === state.current.id) {
+    return;
+  }
+  current = state.current;
+  document.getElementById("board").src = "/board/" + current.id + ".png";
+  document.getElementById("board").alt = current.fen;
+  document.getElementById("link").href = current.url;
+  const details = document.getElementById("details");
+  details.innerHTML = "";
+  for (const [label, value] of Object.entries({FEN: current.fen, ...current.details})) {
+    const dt = document.createElement("dt");
+    dt.textContent = label;
+    const dd = document.createElement("dd");
+    dd.textContent = value;
+    details.append(dt, dd);
+  }
+  const comment = document.getElementById("comment");
+  comment.value = "";
+  comment.blur();
+}
+
+async function refresh() {
+  const response = await fetch("/api/state");
+  show(await response.json());
+}
+
+async function decide(accept) {
+  if (!current || busy) {
+    return;
+  }
+  busy = true;
+  try {
+    const response = await fetch("/api/decision", {
+      method: "POST",
+      headers: {"Content-Type": "application/json"},
+      body: JSON.stringify({
+        id: current.id,
+        accept: accept,
+        comment: document.getElementById("comment").value,
+      }),
+    });
+    show(await response.json());
+  } finally {
+    busy = false;
+  }
+}
+
+document.addEventListener("keydown", (event) => {
+  const comment = document.getElementById("comment");
+  if (document.activeElement === comment) {
+    if (event.key === "Enter") {
+      decide(true);
+    } else if (event.key === "Escape") {
+      comment.blur();
+    }
+    return;
+  }
+  if (event.key === "a" || event.key === "1" || event.key === "Enter") {
+    decide(true);
+  } else if (event.key === "r" || event.key === "0") {
+    decide(false);
+  } else if (event.key === "c") {
+    event.preventDefault();
+    comment.focus();
+  }
+});
+
+refresh();
+</script>
+</body>
+</html>
+"""
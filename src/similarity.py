@@ -0,0 +1,108 @@
+"""
+Near-duplicate detection for puzzle positions.
+
+A position is described by its 768 piece-square bits (one 64-square
+bitboard for each of the 12 coloured piece types), and the distance between
+two positions with the same side to move is the number of bits that differ:
+moving one pawn gives 2, removing a piece 1.
+
+`SimilarityIndex` finds stored positions within `max_distance` without
+comparing against all of them. The squares are split into max_distance + 1
+groups and each position is filed under the pieces it has on each group; two
+positions that differ in at most max_distance bits agree on at least one
+whole group, so looking up the query's groups finds every near duplicate
+(multi-index hashing). Only the positions found are compared bit by bit.
+"""
+from collections import defaultdict
+
+import chess
+
+_PIECE_TYPES = [
+    (color, piece_type) for color in chess.COLORS for piece_type in chess.PIECE_TYPES
+]
+
+
+def piece_squares(board):
+    """
+    The 768 piece-square bits of a board, or of a FEN, as one integer.
+    """
+    if not isinstance(board, chess.Board):
+        board = chess.Board(board)
+    bits = 0
+    for index, (color, piece_type) in enumerate(_PIECE_TYPES):
+        bits |= board.pieces_mask(piece_type, color) << (64 * index)
+    return bits
+
+
+def distance(bits, other):
+    """
+    Number of piece-squares that differ between two `piece_squares` values.
+    """
+    return bin(bits ^ other).count("1")
+
+
+def _group_masks(groups):
+    masks = []
+    for group in range(groups):
+        squares = 0
+        for square in chess.SQUARES:
+            if square % groups == group:
+                squares |= chess.BB_SQUARES[square]
+        masks.append(
+            sum(squares << (64 * index) for index in range(len(_PIECE_TYPES)))
+        )
+    return masks
+
+
+class SimilarityIndex:
+    """
+    Positions indexed for finding those within `max_distance` piece-square
+    changes of a query. Positions with different sides to move never match.
+    """
+
+    def __init__(self, max_distance):
+        if max_distance < 0:
+            raise ValueError("max_distance must not be negative")
+        self.max_distance = max_distance
+        self._masks = _group_masks(max_distance + 1)
+        self._buckets = defaultdict(list)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _keys(self, board):
+        bits = piece_squares(board)
+        keys = [(board.turn, group, bits & mask) for group, mask in enumerate(self._masks)]
+        return bits, keys
+
+    def add(self, board):
+        """
+        Add a board or FEN.
+        """
+        if not isinstance(board, chess.Board):
+            board = chess.Board(board)
+        bits, keys = self._keys(board)
+        entry = (bits, board.fen())
+        for key in keys:
+            self._buckets[key].append(entry)
+        self._size += 1
+
+    def nearest(self, board):
+        """
+        The closest stored position within `max_distance`, as `(distance, fen)`,
+        or None.
+        """
+        if not isinstance(board, chess.Board):
+            board = chess.Board(board)
+        bits, keys = self._keys(board)
+        best = None
+        for key in keys:
+            for other, fen in self._buckets.get(key, ()):
+                found = distance(bits, other)
+                if found <= self.max_distance and (best is None or found < best[0]):
+                    best = (found, fen)
+        return best
+
+    def is_near(self, board):
+        return self.nearest(board) is not None
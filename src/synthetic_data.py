@@ -0,0 +1,252 @@
+import argparse
+import csv
+import random
+import string
+from pathlib import Path
+
+import chess
+import chess.pgn
+
+# Relative frequency of motif themes, roughly as in the Lichess database.
+DEFAULT_THEME_WEIGHTS = {
+    "fork": 12,
+    "kingsideAttack": 8,
+    "hangingPiece": 8,
+    "pin": 6,
+    "defensiveMove": 6,
+    "sacrifice": 5,
+    "discoveredAttack": 4,
+    "advancedPawn": 4,
+    "deflection": 4,
+    "attraction": 3,
+    "skewer": 2,
+    "quietMove": 2,
+    "backRankMate": 2,
+    "trappedPiece": 2,
+    "exposedKing": 2,
+    "promotion": 1,
+    "zugzwang": 1,
+    "xRayAttack": 1,
+}
+PUZZLES_PER_GAME = 4
+# Puzzles start between these plies of their game.
+PUZZLE_PLIES = (6, 60)
+OPENINGS = [
+    "Sicilian_Defense Sicilian_Defense_Najdorf_Variation",
+    "French_Defense French_Defense_Advance_Variation",
+    "Italian_Game Italian_Game_Giuoco_Piano",
+    "Queens_Gambit_Declined",
+    "Caro-Kann_Defense",
+    "Ruy_Lopez Ruy_Lopez_Berlin_Defense",
+]
+_ID_ALPHABET = string.digits + string.ascii_letters
+
+
+def _puzzle_id(index):
+    """
+    Five character base-62 id, unique for each index.
+    """
+    chars = []
+    for _ in range(5):
+        index, digit = divmod(index, len(_ID_ALPHABET))
+        chars.append(_ID_ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def _random_move(rng, board):
+    """
+    A random legal move, or None when there is none.
+    """
+    # Picking a piece first and generating only its moves is much cheaper
+    # than generating every legal move.
+    squares = list(chess.SquareSet(board.occupied_co[board.turn]))
+    rng.shuffle(squares)
+    for square in squares:
+        moves = list(board.generate_pseudo_legal_moves(from_mask=chess.BB_SQUARES[square]))
+        rng.shuffle(moves)
+        for move in moves:
+            if board.is_legal(move):
+                return move
+    return None
+
+
+def random_game(rng, plies):
+    """
+    Play up to `plies` random legal moves from the starting position.
+    """
+    board = chess.Board()
+    for _ in range(plies):
+        move = _random_move(rng, board)
+        if move is None:
+            break
+        board.push(move)
+    return board
+
+
+def _solution(rng, board):
+    """
+    A line of random legal moves, ending on the solver's move.
+    """
+    board = board.copy(stack=False)
+    moves = []
+    for _ in range(rng.choice([1, 3, 3, 5, 5, 7])):
+        move = _random_move(rng, board)
+        if move is None:
+            break
+        moves.append(move)
+        board.push(move)
+    if len(moves) % 2 == 0:
+        moves = moves[:-1]
+    return moves
+
+
+def _themes(rng, ply, solution_length, theme_weights):
+    motifs, weights = zip(*theme_weights.items())
+    themes = set(rng.choices(motifs, weights=weights, k=rng.randint(1, 3)))
+    themes.add(rng.choices(["advantage", "crushing", "mate"], weights=[5, 4, 2])[0])
+    if "mate" in themes:
+        themes.add(f"mateIn{(solution_length + 1) // 2}")
+    if solution_length == 1:
+        themes.add("oneMove")
+    else:
+        themes.add({3: "short", 5: "long"}.get(solution_length, "veryLong"))
+    if ply < 16:
+        themes.add("opening")
+    elif ply < 46:
+        themes.add("middlegame")
+    else:
+        themes.add("endgame")
+    return sorted(themes)
+
+
+def iter_puzzle_rows(rows, seed=0, theme_weights=None):
+    """
+    Yield `rows` puzzle rows in the Lichess database format.
+
+    Positions come from random games: FEN is the position before the
+    opponent's move, and Moves is that move followed by a legal solution line,
+    so rows load exactly like real ones. The same seed gives the same rows.
+    """
+    rng = random.Random(seed)
+    theme_weights = theme_weights or DEFAULT_THEME_WEIGHTS
+    index = 0
+    while index < rows:
+        game_id = "".join(rng.choices(_ID_ALPHABET, k=8))
+        plies = set(rng.sample(range(*PUZZLE_PLIES), PUZZLES_PER_GAME))
+        board = chess.Board()
+        for ply in range(max(plies) + 1):
+            opponent_move = _random_move(rng, board)
+            if opponent_move is None or index >= rows:
+                break
+            if ply not in plies:
+                board.push(opponent_move)
+                continue
+            fen = board.fen()
+            board.push(opponent_move)
+            solution = _solution(rng, board)
+            if not solution:
+                continue
+            rating = min(3200, max(400, int(rng.gauss(1500, 450))))
+            themes = _themes(rng, ply, len(solution), theme_weights)
+            yield [
+                _puzzle_id(index),
+                fen,
+                " ".join(move.uci() for move in [opponent_move, *solution]),
+                rating,
+                rng.randint(60, 110),
+                rng.randint(50, 100),
+                int(rng.lognormvariate(6, 1.5)),
+                " ".join(themes),
+                f"https://lichess.org/{game_id}#{ply + 1}",
+                rng.choice(OPENINGS) if "opening" in themes else "",
+            ]
+            index += 1
+
+
+def write_puzzle_db(path, rows, seed=0, theme_weights=None):
+    """
+    Write a synthetic lichess_db_puzzle.csv with `rows` puzzles.
+    """
+    from main import LICHESS_COLUMNS
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(LICHESS_COLUMNS)
+        writer.writerows(iter_puzzle_rows(rows, seed=seed, theme_weights=theme_weights))
+    return path
+
+
+def write_pgn(path, games, seed=0):
+    """
+    Write `games` random games with headers to a PGN file.
+    """
+    rng = random.Random(seed)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as handle:
+        for number in range(games):
+            board = random_game(rng, rng.randint(20, 160))
+            game = chess.pgn.Game.from_board(board)
+            game.headers["Event"] = f"Synthetic Open {number // 50 + 1}"
+            game.headers["Site"] = "?"
+            game.headers["Date"] = f"{rng.randint(1950, 2024)}.??.??"
+            game.headers["Round"] = str(number % 50 + 1)
+            game.headers["White"] = f"Player {rng.randint(1, 500)}"
+            game.headers["Black"] = f"Player {rng.randint(1, 500)}"
+            outcome = board.outcome()
+            game.headers["Result"] = outcome.result() if outcome else "*"
+            print(game, file=handle, end="\n\n")
+    return path
+
+
+def _parse_theme_weights(values):
+    weights = {}
+    for value in values:
+        theme, _, weight = value.partition("=")
+        try:
+            weights[theme] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid theme weight: {value}")
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic puzzle databases and PGN files for benchmarking."
+    )
+    subparsers = parser.add_subparsers(dest="kind", required=True)
+
+    puzzles = subparsers.add_parser("puzzles", help="A lichess_db_puzzle.csv-style database.")
+    puzzles.add_argument("out", help="Output CSV path.")
+    puzzles.add_argument("--rows", type=int, default=10000, help="Number of puzzles.")
+    puzzles.add_argument(
+        "--theme",
+        action="append",
+        default=[],
+        metavar="NAME=WEIGHT",
+        help="Motif theme and relative weight, repeatable (replaces the default distribution).",
+    )
+    puzzles.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    pgn = subparsers.add_parser("pgn", help="A PGN file of random games.")
+    pgn.add_argument("out", help="Output PGN path.")
+    pgn.add_argument("--games", type=int, default=1000, help="Number of games.")
+    pgn.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    if args.kind == "puzzles":
+        try:
+            theme_weights = _parse_theme_weights(args.theme)
+        except argparse.ArgumentTypeError as exc:
+            parser.error(str(exc))
+        write_puzzle_db(args.out, args.rows, seed=args.seed, theme_weights=theme_weights)
+        print(f"Wrote {args.rows} puzzles to {args.out}")
+    else:
+        write_pgn(args.out, args.games, seed=args.seed)
+        print(f"Wrote {args.games} games to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Check every row of the Lichess puzzle database before it is used.
+
+Rows are checked for their column count, integer Rating, RatingDeviation,
+Popularity and NbPlays, a legal FEN, and a Moves line that is legal move by
+move from that FEN. The file is split into byte-range chunks checked across
+a process pool. The bad PuzzleIds are written to a quarantine list next to
+the database (lichess_db_puzzle-quarantine.txt), which `load_lichess_db`
+reads to drop those rows up front, and a JSON report of every problem to
+lichess_db_puzzle-validation.json.
+"""
+import argparse
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_LICHESS_DB = ROOT_DIR / "data/lichess_db_puzzle.csv"
+# Rows are checked in chunks of this many bytes, several per worker, so the
+# pool stays busy when some chunks are slower than others.
+CHUNK_BYTES = 16 * 1024 * 1024
+INTEGER_COLUMNS = ["Rating", "RatingDeviation", "Popularity", "NbPlays"]
+
+
+def quarantine_path_for(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(f"{csv_path.stem}-quarantine.txt")
+
+
+def report_path_for(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(f"{csv_path.stem}-validation.json")
+
+
+def load_quarantine(csv_path):
+    """
+    The quarantined PuzzleIds of a database, or an empty set if it has not
+    been validated.
+    """
+    path = quarantine_path_for(csv_path)
+    if not path.exists():
+        return set()
+    with path.open() as handle:
+        return {line.strip() for line in handle if line.strip()}
+
+
+def check_row(row):
+    """
+    Describe what is wrong with a database row, or return None if it is valid.
+
+    :returns: `(kind, message)`, where kind is one of columns, id, integer,
+        fen, position or moves.
+    """
+    import chess
+
+    from main import LICHESS_COLUMNS
+
+    if len(row) < len(LICHESS_COLUMNS):
+        return "columns", f"expected {len(LICHESS_COLUMNS)} columns, found {len(row)}"
+    fields = dict(zip(LICHESS_COLUMNS, (field.strip() for field in row)))
+    if not fields["PuzzleId"]:
+        return "id", "missing PuzzleId"
+    for column in INTEGER_COLUMNS:
+        try:
+            int(fields[column])
+        except ValueError:
+            return "integer", f"{column} is not an integer: {fields[column]!r}"
+    try:
+        board = chess.Board(fields["FEN"])
+    except ValueError as exc:
+        return "fen", f"invalid FEN: {exc}"
+    if not board.is_valid():
+        return "position", f"illegal position: {board.status()!r}"
+    moves = fields["Moves"].split()
+    if not moves:
+        return "moves", "missing Moves"
+    for ply, uci in enumerate(moves, start=1):
+        try:
+            move = chess.Move.from_uci(uci)
+        except ValueError:
+            return "moves", f"invalid move {uci!r} at ply {ply}"
+        if not board.is_legal(move):
+            return "moves", f"illegal move {uci} at ply {ply}"
+        board.push(move)
+    return None
+
+
+def _validate_range(csv_path, start, end):
+    """
+    Check the rows that start within bytes [start, end).
+
+    :returns: The number of rows checked and a `(PuzzleId, kind, message)`
+        triple for each invalid row.
+    """
+    from lichess_themes import iter_rows_in_range
+
+    checked = 0
+    problems = []
+    for row in iter_rows_in_range(csv_path, start, end):
+        if not row or row[0] == "PuzzleId":
+            continue
+        checked += 1
+        problem = check_row(row)
+        if problem is not None:
+            problems.append((row[0].strip(), *problem))
+    return checked, problems
+
+
+def validate_db(csv_path, workers=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Check every row of a database across a process pool.
+
+    :returns: A JSON-serialisable report with the rows checked, the number
+        of invalid rows, counts per kind of problem, and each problem.
+    """
+    size = os.path.getsize(csv_path)
+    bounds = list(range(0, size, chunk_bytes)) + [size]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    workers = workers or os.cpu_count() or 1
+
+    checked = 0
+    problems = []
+    if workers == 1 or len(ranges) <= 1:
+        results = (_validate_range(csv_path, start, end) for start, end in ranges)
+        for range_checked, range_problems in results:
+            checked += range_checked
+            problems.extend(range_problems)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_validate_range, csv_path, start, end) for start, end in ranges
+            ]
+            for future in futures:
+                range_checked, range_problems = future.result()
+                checked += range_checked
+                problems.extend(range_problems)
+
+    kinds = Counter(kind for _, kind, _ in problems)
+    return {
+        "db": str(csv_path),
+        "rows": checked,
+        "invalid": len(problems),
+        "kinds": dict(kinds.most_common()),
+        "problems": [
+            {"PuzzleId": puzzle_id, "kind": kind, "problem": message}
+            for puzzle_id, kind, message in problems
+        ],
+    }
+
+
+def write_results(report, csv_path):
+    """
+    Write the report and the quarantine list next to the database. Rows
+    without a PuzzleId cannot be quarantined and are only reported.
+
+    :returns: The report path, the quarantine path and the quarantined ids.
+    """
+    report_path = report_path_for(csv_path)
+    report_path.write_text(json.dumps(report, indent=2) + "\n")
+    quarantine_path = quarantine_path_for(csv_path)
+    puzzle_ids = sorted({problem["PuzzleId"] for problem in report["problems"]} - {""})
+    quarantine_path.write_text("".join(f"{puzzle_id}\n" for puzzle_id in puzzle_ids))
+    return report_path, quarantine_path, puzzle_ids
+
+
+def format_report(report, limit=20):
+    lines = [f"Checked {report['rows']} puzzles: {report['invalid']} invalid."]
+    for kind, count in report["kinds"].items():
+        lines.append(f"{count:>8}  {kind}")
+    for problem in report["problems"][:limit]:
+        lines.append(f"{problem['PuzzleId'] or '(no id)'}: {problem['problem']}")
+    if report["invalid"] > limit:
+        lines.append(f"... and {report['invalid'] - limit} more in the report.")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Check every row of the Lichess puzzle database and quarantine the invalid ones, "
+            "so the lichess medium skips them."
+        )
+    )
+    parser.add_argument(
+        "--lichess-db",
+        type=str,
+        default=str(DEFAULT_LICHESS_DB),
+        help="Path to lichess_db_puzzle.csv.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes (defaults to the number of CPUs).",
+    )
+    args = parser.parse_args()
+
+    csv_path = Path(args.lichess_db)
+    if not csv_path.exists():
+        raise SystemExit(f"Lichess DB not found at {csv_path}")
+
+    report = validate_db(csv_path, workers=args.workers)
+    report_path, quarantine_path, puzzle_ids = write_results(report, csv_path)
+    print(format_report(report))
+    print(f"Wrote the report to {report_path}")
+    print(f"Wrote {len(puzzle_ids)} quarantined puzzles to {quarantine_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import batch
+from synthetic_data import write_puzzle_db
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+E4_FEN = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """
+    Record renders instead of drawing boards, in threads so the patch applies.
+    """
+    rendered = []
+
+    def fake_render(fen, path, profile):
+        rendered.append(fen)
+        path.write_bytes(b"png")
+        return path
+
+    monkeypatch.setattr(batch, "_render", fake_render)
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", ThreadPoolExecutor)
+    return rendered
+
+
+def _write_manifest(path, manifest):
+    path.write_text(json.dumps(manifest))
+    return path
+
+
+def test_load_manifest_applies_defaults_and_names(tmp_path):
+    manifest = _write_manifest(
+        tmp_path / "manifest.json",
+        {
+            "defaults": {"n": 4, "author": "Coach"},
+            "sheets": [
+                {"theme": "fork", "squad": "Under 10s"},
+                {"medium": "text", "file": "puzzles.txt", "n": 2, "seed": 3},
+            ],
+        },
+    )
+
+    sheets = batch.load_manifest(manifest)
+
+    assert sheets[0]["name"] == "Under_10s"
+    assert sheets[0]["n"] == 4
+    assert sheets[0]["author"] == "Coach"
+    assert sheets[0]["seed"] is None
+    assert sheets[1]["name"] == "sheet-2"
+    assert sheets[1]["file"] == str(tmp_path / "puzzles.txt")
+
+
+@pytest.mark.parametrize(
+    "sheet, message",
+    [
+        ({"theme": "fork", "colour": "red"}, "unknown field"),
+        ({"medium": "cql", "file": "games.pgn"}, "medium must be one of"),
+        ({"medium": "lichess"}, "theme is required"),
+        ({"medium": "csv"}, "file is required"),
+        ({"theme": "fork", "n": 0}, "n must be a positive integer"),
+    ],
+)
+def test_load_manifest_rejects_invalid_sheets(tmp_path, sheet, message):
+    manifest = _write_manifest(tmp_path / "manifest.json", [sheet])
+
+    with pytest.raises(ValueError, match=message):
+        batch.load_manifest(manifest)
+
+
+def test_load_manifest_rejects_duplicate_names(tmp_path):
+    manifest = _write_manifest(
+        tmp_path / "manifest.json", [{"name": "a", "theme": "fork"}, {"name": "a", "theme": "pin"}]
+    )
+
+    with pytest.raises(ValueError, match="already named a"):
+        batch.load_manifest(manifest)
+
+
+def test_run_batch_renders_shared_positions_once(tmp_path, renders):
+    db_path = write_puzzle_db(tmp_path / "puzzles.csv", 200, seed=1)
+    text_path = tmp_path / "puzzles.txt"
+    text_path.write_text(f"{START_FEN}\n{E4_FEN}\n{START_FEN}\n")
+    manifest = _write_manifest(
+        tmp_path / "manifest.json",
+        [
+            {"name": "a", "theme": "fork", "n": 5, "seed": 7, "title": "A", "squad": "Squad A"},
+            {"name": "b", "theme": "fork", "n": 5, "seed": 7, "title": "B"},
+            {"name": "c", "medium": "text", "file": "puzzles.txt", "n": 5},
+        ],
+    )
+    output_dir = tmp_path / "output"
+
+    code = batch.run_batch(manifest, db_path, output_dir, run_pdflatex=False, workers=2)
+
+    assert code == 0
+    # Sheets a and b draw the same positions with the same seed
+    assert len(renders) == 5 + 2
+    a_tex = (output_dir / "a" / "a.tex").read_text()
+    assert "Squad A" in a_tex
+    assert len(list((output_dir / "a" / "images").glob("puzzle_*.png"))) == 5
+    assert len(list((output_dir / "c" / "images").glob("puzzle_*.png"))) == 2
+    assert (output_dir / "b" / "b.tex").exists()
+    assert not (output_dir / ".batch-images").exists()
+
+
+def test_run_batch_reports_invalid_manifest(tmp_path, renders, capsys):
+    manifest = _write_manifest(tmp_path / "manifest.json", [{"medium": "lichess"}])
+
+    assert batch.run_batch(manifest, tmp_path / "missing.csv", tmp_path / "output") == 1
+    assert "theme is required" in capsys.readouterr().out
+    assert renders == []
+
+
+def test_run_batch_skips_bad_lines_per_sheet(tmp_path, renders, capsys):
+    text_path = tmp_path / "puzzles.txt"
+    text_path.write_text(f"{START_FEN}\nnot a fen\n{E4_FEN}\n")
+    manifest = _write_manifest(
+        tmp_path / "manifest.json",
+        [{"name": "club", "medium": "text", "file": "puzzles.txt", "n": 5}],
+    )
+
+    code = batch.run_batch(manifest, tmp_path / "missing.csv", tmp_path / "output", False)
+
+    assert code == 0
+    assert "club: skipped 1 line(s) that are not valid FENs." in capsys.readouterr().out
+    assert len(list((tmp_path / "output" / "club" / "images").glob("puzzle_*.png"))) == 2
+
+
+def test_run_batch_reports_render_errors_per_sheet(tmp_path, renders, monkeypatch, capsys):
+    def failing_render(fen, path, profile):
+        if fen == E4_FEN:
+            raise OSError("no library called cairo")
+        path.write_bytes(b"png")
+        return path
+
+    monkeypatch.setattr(batch, "_render", failing_render)
+    (tmp_path / "good.txt").write_text(f"{START_FEN}\n")
+    (tmp_path / "bad.txt").write_text(f"{START_FEN}\n{E4_FEN}\n")
+    manifest = _write_manifest(
+        tmp_path / "manifest.json",
+        [
+            {"name": "good", "medium": "text", "file": "good.txt"},
+            {"name": "bad", "medium": "text", "file": "bad.txt"},
+        ],
+    )
+
+    code = batch.run_batch(manifest, tmp_path / "missing.csv", tmp_path / "output", False)
+
+    out = capsys.readouterr().out
+    assert code == 1
+    assert "bad: could not render 1 board(s)" in out
+    assert "no library called cairo" in out
+    assert (tmp_path / "output" / "good" / "good.tex").exists()
+    assert not (tmp_path / "output" / "bad" / "bad.tex").exists()
@@ -0,0 +1,68 @@
+import json
+
+import benchmark
+import fen2tex
+
+
+def test_run_benchmarks_records_results(tmp_path):
+    db_path = benchmark.synthetic_db_path(tmp_path, 200)
+
+    results = benchmark.run_benchmarks(
+        db_path,
+        names=["db_load", "theme_filter", "sampling", "fen2tex"],
+        repeat=2,
+        puzzles=3,
+        themes="middlegame",
+    )
+
+    assert json.loads(json.dumps(results)) == results
+    by_name = {result["name"]: result for result in results["results"]}
+    assert list(by_name) == ["db_load", "theme_filter", "sampling", "fen2tex"]
+    assert by_name["db_load"]["items"] == 200
+    assert by_name["sampling"]["items"] == 3
+    assert all(len(result["seconds"]) == 2 for result in by_name.values())
+    assert benchmark.synthetic_db_path(tmp_path, 200) == db_path
+
+
+def test_every_benchmark_runs_without_rendering(tmp_path, monkeypatch):
+    def unavailable(fen, img_name, profile=None):
+        raise OSError('no library called "cairo" was found')
+
+    monkeypatch.setattr(fen2tex, "fen2png", unavailable)
+    monkeypatch.setattr(benchmark.shutil, "which", lambda name: None)
+    db_path = benchmark.synthetic_db_path(tmp_path, 200)
+
+    results = benchmark.run_benchmarks(db_path, repeat=1, puzzles=3, themes="middlegame")
+
+    status = {result["name"]: result["status"] for result in results["results"]}
+    assert list(status) == benchmark.BENCHMARKS
+    assert status["fen2png"] == "skipped"
+    assert status["pdf_compile"] == "skipped"
+    assert status["fen2tex"] == "ok"
+
+
+def test_sampling_skipped_without_matches(tmp_path):
+    db_path = benchmark.synthetic_db_path(tmp_path, 50)
+
+    results = benchmark.run_benchmarks(db_path, names=["sampling"], repeat=1, themes="nosuchtheme")
+
+    assert results["results"][0]["status"] == "skipped"
+
+
+def test_compare_results_flags_regressions():
+    def results(**medians):
+        return {
+            "results": [
+                {"name": name, "status": "ok", "median": median}
+                for name, median in medians.items()
+            ]
+        }
+
+    rows = benchmark.compare_results(
+        results(db_load=1.0, fen2png=2.0), results(db_load=1.1, fen2png=3.0, fen2tex=1.0)
+    )
+
+    assert [(name, regressed) for name, _, _, _, regressed in rows] == [
+        ("db_load", False),
+        ("fen2png", True),
+    ]
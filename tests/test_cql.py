@@ -0,0 +1,142 @@
+import asyncio
+import io
+import sys
+import textwrap
+
+import chess
+import chess.engine
+import pytest
+
+import cql
+
+FAKE_ENGINE = textwrap.dedent(
+    """
+    import sys
+    for line in sys.stdin:
+        cmd = line.strip()
+        if cmd == "uci":
+            print("id name Fake")
+            print("option name MultiPV type spin default 1 min 1 max 500")
+            print("uciok", flush=True)
+        elif cmd == "isready":
+            print("readyok", flush=True)
+        elif cmd.startswith("go"):
+            print("info depth 20 multipv 1 score mate 2")
+            print("info depth 20 multipv 2 score cp 0")
+            print("bestmove (none)", flush=True)
+        elif cmd == "quit":
+            break
+    """
+)
+
+PGN = """[Event "One"]
+[White "A"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+
+[Event "Short"]
+
+1. e4 *
+
+[Event "Two"]
+[White "B"]
+
+1. e4 e5 2. Bc4 Nc6 3. Qh5 Nf6 4. Qxf7# 1-0
+"""
+
+
+def _fake_engine(tmp_path):
+    script = tmp_path / "fake_uci.py"
+    script.write_text(FAKE_ENGINE)
+    return [sys.executable, str(script)]
+
+
+def test_scan_for_mates_reviews_candidates(tmp_path):
+    seen = []
+
+    def review(board, headers):
+        seen.append(headers["Event"])
+        return None if headers["Event"] == "One" else "ok"
+
+    puzzles, comments = asyncio.run(
+        cql.scan_for_mates(io.StringIO(PGN), 2, 5, _fake_engine(tmp_path), review, engines=2)
+    )
+
+    assert sorted(seen) == ["One", "Two"]
+    assert comments == ["ok"]
+    assert len(puzzles) == 1
+
+
+def test_scan_for_mates_stops_at_num_puzzles(tmp_path):
+    puzzles, comments = asyncio.run(
+        cql.scan_for_mates(
+            io.StringIO(PGN), 2, 1, _fake_engine(tmp_path), lambda board, headers: "c", engines=1
+        )
+    )
+
+    assert len(puzzles) == 1
+    assert comments == ["c"]
+
+
+def _info(score):
+    return {"score": chess.engine.PovScore(score, chess.WHITE)}
+
+
+def test_is_unique_win():
+    cp = chess.engine.Cp
+    mate = chess.engine.Mate
+
+    assert cql.is_unique_win([_info(cp(450)), _info(cp(30))], chess.WHITE)
+    assert not cql.is_unique_win([_info(cp(450)), _info(cp(400))], chess.WHITE)
+    assert not cql.is_unique_win([_info(cp(-450)), _info(cp(-900))], chess.WHITE)
+    assert cql.is_unique_win([_info(mate(3)), _info(cp(100))], chess.WHITE)
+    assert not cql.is_unique_win([_info(mate(3)), _info(mate(4))], chess.WHITE)
+    assert cql.is_unique_win([_info(cp(-450)), _info(cp(-30))], chess.BLACK)
+    assert not cql.is_unique_win([_info(cp(450))], chess.WHITE)
+
+
+def test_scan_for_tactics_screens_every_position(tmp_path):
+    reviewed = []
+
+    def review(board, headers):
+        reviewed.append(board.ply())
+        return None
+
+    puzzles, comments = asyncio.run(
+        cql.scan_for_tactics(
+            io.StringIO(PGN), 5, _fake_engine(tmp_path), review, engines=2, min_ply=2
+        )
+    )
+
+    assert puzzles == []
+    # Both games transpose into the same positions at plies 2, 5 and 6.
+    assert sorted(reviewed) == [2, 3, 3, 4, 4, 5, 6]
+
+
+def test_scan_checkpoint_resume(tmp_path):
+    engine = _fake_engine(tmp_path)
+    checkpoint_path = tmp_path / "scan.json"
+    params = {"mode": "mate", "mate_in_n": 2}
+
+    checkpoint = cql.ScanCheckpoint(checkpoint_path, params)
+    puzzles, comments = asyncio.run(
+        cql.scan_for_mates(
+            io.StringIO(PGN), 2, 1, engine, lambda board, headers: "first", 1, checkpoint=checkpoint
+        )
+    )
+    assert comments == ["first"]
+
+    resumed = cql.ScanCheckpoint.load(checkpoint_path, params)
+    assert resumed.puzzles == puzzles
+    assert 0 < resumed.offset < len(PGN)
+
+    puzzles, comments = asyncio.run(
+        cql.scan_for_mates(
+            io.StringIO(PGN), 2, 5, engine, lambda board, headers: "second", 1, checkpoint=resumed
+        )
+    )
+    assert comments == ["first", "second"]
+    assert cql.ScanCheckpoint.load(checkpoint_path, params).offset == len(PGN)
+
+    with pytest.raises(ValueError):
+        cql.ScanCheckpoint.load(checkpoint_path, {"mode": "tactics"})
@@ -0,0 +1,49 @@
+import csv
+
+import csv2fen
+
+PGN = """[Event "Puzzle 1"]
+[Date "2020.01.01"]
+[White "A"]
+[Black "B"]
+[Result "*"]
+[FEN "6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1"]
+
+1... h6 2. Rd8# { 1... h6 2. Rd8# } *
+
+
+[Event "Puzzle 2"]
+[White "C"]
+
+1. e4 e5 2. Qh5 *
+"""
+
+
+def test_extract_game_info(tmp_path):
+    pgn_path = tmp_path / "puzzles.pgn"
+    pgn_path.write_text(PGN)
+    csv_path = tmp_path / "puzzles.csv"
+
+    count = csv2fen.extract_game_info(str(pgn_path), str(csv_path))
+
+    with csv_path.open(newline="") as f:
+        rows = list(csv.reader(f))
+    assert count == 2
+    assert rows[0] == ["Event", "Date", "White", "Black", "Result", "FEN", "Solution"]
+    assert rows[1][:5] == ["Puzzle 1", "2020.01.01", "A", "B", "*"]
+    assert rows[1][6] == "1... h6 2. Rd8# } *"
+    assert rows[2] == ["Puzzle 2", "", "C", "", "", "", ""]
+
+
+def test_extract_game_info_puzzle_columns(tmp_path):
+    pgn_path = tmp_path / "puzzles.pgn"
+    pgn_path.write_text(PGN)
+    csv_path = tmp_path / "puzzles.csv"
+
+    csv2fen.extract_game_info(str(pgn_path), str(csv_path), puzzle_columns=True)
+
+    with csv_path.open(newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]["PuzzleFEN"] == "6k1/5pp1/7p/8/8/8/5PPP/3R2K1 w - - 0 2"
+    assert rows[0]["SolutionMoves"] == "d1d8"
+    assert rows[1]["SolutionMoves"] == "e7e5 d1h5"
@@ -0,0 +1,57 @@
+import csv
+
+import chess
+import pytest
+
+import dedupe
+
+START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def test_position_key_ignores_clocks_and_dead_en_passant():
+    board = chess.Board()
+    board.push_uci("e2e4")
+    # No black pawn can capture on e3, so the en passant square is noise.
+    with_ep = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+    without_ep = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 5 30"
+
+    assert dedupe.position_key(with_ep) == dedupe.position_key(without_ep)
+    assert dedupe.position_key(board) == dedupe.position_key(without_ep)
+    assert dedupe.position_key(START) != dedupe.position_key(without_ep)
+
+
+def test_position_set():
+    seen = dedupe.PositionSet([START])
+
+    assert START in seen
+    assert not seen.add(START.replace(" 0 1", " 3 9"))
+    assert seen.add("8/8/8/8/8/8/8/K6k w - - 0 1")
+    assert len(seen) == 2
+    with pytest.raises(ValueError):
+        seen.add("not a fen")
+
+
+def test_dedupe_text_files(tmp_path):
+    first = tmp_path / "a.txt"
+    second = tmp_path / "b.txt"
+    first.write_text(f"{START}\nnot a fen\n\n")
+    second.write_text(START.replace(" 0 1", " 0 7") + "\n8/8/8/8/8/8/8/K6k w - - 0 1\n")
+    out = tmp_path / "out.txt"
+
+    read, written, invalid = dedupe.dedupe_files([first, second], out)
+
+    assert (read, written, invalid) == (4, 2, 1)
+    assert out.read_text().splitlines() == [START, "8/8/8/8/8/8/8/K6k w - - 0 1"]
+
+
+def test_dedupe_csv(tmp_path):
+    source = tmp_path / "puzzles.csv"
+    source.write_text(f'id,FEN\n1,"{START}"\n2,"{START.replace(" 0 1", " 4 10")}"\n')
+    out = tmp_path / "out.csv"
+
+    read, written, _ = dedupe.dedupe_files([source], out)
+
+    with out.open(newline="") as f:
+        rows = list(csv.reader(f))
+    assert (read, written) == (2, 1)
+    assert rows == [["id", "FEN"], ["1", START]]
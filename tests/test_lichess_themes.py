@@ -1,3 +1,5 @@
+import json
+
 import lichess_themes
 
 
@@ -11,3 +13,48 @@ def test_extract_unique_themes(tmp_path):
     themes = lichess_themes.extract_unique_themes(csv_path)
 
     assert themes == ["fork", "pin", "skewer"]
+
+
+def _write_db(tmp_path):
+    csv_path = tmp_path / "lichess.csv"
+    csv_path.write_text(
+        "PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,NbPlays,Themes,GameUrl,OpeningTags\n"
+        'a,fen,moves,1510,1,1,1,"fork pin",https://lichess.org/a,tag\n'
+        'b,fen,moves,1590,1,1,1,"fork",https://lichess.org/b,tag\n'
+        'c,fen,moves,2210,1,1,1,"pin skewer fork",https://lichess.org/c,tag\n'
+    )
+    return csv_path
+
+
+def test_compute_theme_stats(tmp_path):
+    stats = lichess_themes.compute_theme_stats(_write_db(tmp_path), workers=1)
+
+    assert stats.rows == 3
+    assert stats.themes() == ["fork", "pin", "skewer"]
+    assert stats.counts["fork"] == 3
+    assert stats.matches(["fork", "pin"]) == 2
+    assert stats.matches(["skewer"]) == 1
+    assert stats.ratings[("fork", 1500)] == 2
+    assert stats.ratings[("pin", 2200)] == 1
+
+
+def test_theme_stats_byte_ranges_cover_every_row_once(tmp_path):
+    csv_path = _write_db(tmp_path)
+    size = csv_path.stat().st_size
+    whole = lichess_themes.compute_theme_stats(csv_path, workers=1)
+
+    for cut in range(1, size):
+        merged = lichess_themes._scan_range(csv_path, 0, cut)
+        merged.merge(lichess_themes._scan_range(csv_path, cut, size))
+        assert merged.to_dict() == whole.to_dict()
+
+
+def test_theme_stats_round_trip(tmp_path):
+    stats = lichess_themes.compute_theme_stats(_write_db(tmp_path), workers=1)
+    themes_path = tmp_path / "themes-unique.txt"
+    lichess_themes.stats_path_for(themes_path).write_text(json.dumps(stats.to_dict()))
+
+    loaded = lichess_themes.load_theme_stats(themes_path)
+
+    assert loaded.to_dict() == stats.to_dict()
+    assert lichess_themes.format_theme_counts(loaded).splitlines()[0].split() == ["fork", "3"]
@@ -0,0 +1,102 @@
+import os
+import random
+
+import pytest
+
+from line_index import CsvLines, FenColumn, LineIndex, random_order, sidecar_path
+
+
+def test_lines_by_number(tmp_path):
+    path = tmp_path / "puzzles.txt"
+    path.write_bytes(b"first\r\nsecond\n\nfourth")
+
+    with LineIndex(path) as lines:
+        assert len(lines) == 4
+        assert [lines[number] for number in range(4)] == ["first", "second", "", "fourth"]
+        assert lines[-1] == "fourth"
+        assert list(lines) == ["first", "second", "", "fourth"]
+
+
+def test_trailing_newline_and_empty_file(tmp_path):
+    path = tmp_path / "puzzles.txt"
+    path.write_text("a\nb\n")
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+
+    with LineIndex(path) as lines:
+        assert list(lines) == ["a", "b"]
+    with LineIndex(empty) as lines:
+        assert len(lines) == 0
+        assert list(lines) == []
+
+
+def test_latin1_lines_are_decoded(tmp_path):
+    path = tmp_path / "puzzles.txt"
+    path.write_bytes("Réti\n".encode("latin-1"))
+
+    with LineIndex(path) as lines:
+        assert lines[0] == "Réti"
+
+
+def test_sidecar_is_reused_until_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "puzzles.txt"
+    path.write_text("a\nb\n")
+    LineIndex(path).close()
+    assert sidecar_path(path).exists()
+
+    import line_index
+
+    def fail(mm):
+        raise AssertionError("the index was rebuilt")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(line_index, "_scan_offsets", fail)
+        with LineIndex(path) as lines:
+            assert list(lines) == ["a", "b"]
+
+    path.write_text("a\nb\nc\n")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    with LineIndex(path) as lines:
+        assert list(lines) == ["a", "b", "c"]
+
+
+def test_unwritable_sidecar_keeps_the_index_in_memory(tmp_path, monkeypatch):
+    path = tmp_path / "puzzles.txt"
+    path.write_text("a\nb\n")
+
+    import line_index
+
+    monkeypatch.setattr(line_index, "sidecar_path", lambda path: tmp_path / "missing" / "x.idx")
+    with LineIndex(path) as lines:
+        assert list(lines) == ["a", "b"]
+
+
+def test_random_order_is_a_permutation():
+    order = list(random_order(random.Random(3), 50))
+
+    assert sorted(order) == list(range(50))
+    assert order != list(range(50))
+    assert list(random_order(random.Random(3), 50)) == order
+
+
+def test_csv_rows_and_fen_column(tmp_path):
+    path = tmp_path / "puzzles.csv"
+    path.write_text('﻿Event,FEN\n"Open, 2020",8/8/8/8/8/8/8/K6k w - - 0 1\n\n')
+
+    with LineIndex(path) as lines:
+        rows = CsvLines(lines)
+        assert rows.header == ["Event", "FEN"]
+        assert len(rows) == 2
+        assert rows[0] == {"Event": "Open, 2020", "FEN": "8/8/8/8/8/8/8/K6k w - - 0 1"}
+        assert rows[1] == {}
+        fens = FenColumn(rows)
+        assert [fens[0], fens[1]] == ["8/8/8/8/8/8/8/K6k w - - 0 1", ""]
+
+
+def test_fen_column_is_required(tmp_path):
+    path = tmp_path / "puzzles.csv"
+    path.write_text("Event\nOpen\n")
+
+    with LineIndex(path) as lines, pytest.raises(ValueError, match="FEN column"):
+        FenColumn(CsvLines(lines))
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 import pytest
 import chess
 from PIL import Image
@@ -6,6 +8,20 @@ import main
 from fen2tex import fen2tex
 
 
+E4_FEN = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+
+def _require_cairosvg():
+    """
+    Skip unless boards can be rendered; cairosvg raises OSError on import
+    when libcairo is missing.
+    """
+    try:
+        import cairosvg
+    except (ImportError, OSError) as exc:
+        pytest.skip(f"cairosvg unavailable: {exc}")
+
+
 def _set_input(monkeypatch, values):
     inputs = iter(values)
     monkeypatch.setattr("builtins.input", lambda _: next(inputs))
@@ -99,6 +115,33 @@ def test_get_puzzles_from_lichess_single_row(tmp_path, monkeypatch):
     assert puzzles[0] == board.fen()
 
 
+def test_filter_by_themes_matches_whole_tags():
+    import pandas as pd
+
+    df = pd.DataFrame({"Themes": ["mate mateIn1", "mateIn2 short", "fork mate", None]})
+
+    assert list(main.filter_by_themes(df, ["mate"]).index) == [0, 2]
+    assert list(main.filter_by_themes(df, ["mateIn2"]).index) == [1]
+    assert main.filter_by_themes(df, ["mateIn"]).empty
+
+
+def test_iter_lichess_candidates_skips_corrupt_rows():
+    import pandas as pd
+    from dedupe import PositionSet
+
+    df = pd.DataFrame(
+        {
+            "FEN": ["not a fen", chess.STARTING_FEN, chess.STARTING_FEN, chess.STARTING_FEN],
+            "Moves": ["e2e4", float("nan"), "", "e2e4 e7e5"],
+        }
+    )
+
+    candidates = list(main.iter_lichess_candidates(df, PositionSet()))
+
+    assert [row.name for row, _ in candidates] == [3]
+    assert candidates[0][1].fen() == chess.Board(E4_FEN).fen()
+
+
 def test_fen2tex_writes_tex(tmp_path):
     img_dir = tmp_path / "images"
     img_dir.mkdir()
@@ -126,6 +169,32 @@ def test_fen2tex_writes_tex(tmp_path):
     assert "Squad" in contents
 
 
+@pytest.mark.parametrize(
+    "profile, size, mode",
+    [("full", 390, "RGBA"), ("print", 827, "P"), ("screen", 413, "P"), ("grayscale", 827, "P")],
+)
+def test_fen2png_profiles(tmp_path, profile, size, mode):
+    _require_cairosvg()
+    from fen2tex import fen2png
+
+    path = tmp_path / "board.png"
+    fen2png(chess.STARTING_FEN, str(path), profile=profile)
+
+    with Image.open(path) as image:
+        assert image.size == (size, size)
+        assert image.mode == mode
+        if profile == "grayscale":
+            colors = image.convert("RGB").getcolors()
+            assert all(r == g == b for _, (r, g, b) in colors)
+
+
+def test_fen2png_rejects_unknown_profiles(tmp_path):
+    from fen2tex import fen2png
+
+    with pytest.raises(ValueError, match="Unknown image profile"):
+        fen2png(chess.STARTING_FEN, str(tmp_path / "board.png"), profile="poster")
+
+
 def test_find_mate_in_n_requires_stockfish(monkeypatch, tmp_path):
     monkeypatch.setattr(main, "DEFAULT_STOCKFISH_PATH", None)
     with pytest.raises(ValueError):
@@ -136,3 +205,150 @@ def test_find_mate_in_n_requires_stockfish(monkeypatch, tmp_path):
             stockfish_path=None,
             open_in_browser=False,
         )
+
+
+def test_get_puzzles_from_text_file_skips_repeated_positions(tmp_path, monkeypatch):
+    text_path = tmp_path / "puzzles.txt"
+    text_path.write_text(
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1\n"
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 4 12\n"
+        "8/8/8/8/8/8/8/K6k w - - 0 1\n"
+    )
+
+    _set_input(monkeypatch, ["1", "First", "1", "Second"])
+    puzzles, comments = main.get_puzzles_from_text_file(str(text_path), open_in_browser=False)
+
+    assert comments == ["First", "Second"]
+    assert puzzles[1] == "8/8/8/8/8/8/8/K6k w - - 0 1"
+
+
+def test_get_puzzles_from_text_file_skips_invalid_lines(tmp_path, monkeypatch, capsys):
+    text_path = tmp_path / "puzzles.txt"
+    text_path.write_text(f"not a fen\n{E4_FEN}\n")
+
+    _set_input(monkeypatch, ["1", "Comment"])
+    puzzles, comments = main.get_puzzles_from_text_file(str(text_path), open_in_browser=False)
+
+    assert puzzles == [E4_FEN]
+    assert comments == ["Comment"]
+    assert "Skipping line 1, which is not a valid FEN" in capsys.readouterr().out
+
+
+def test_get_puzzles_from_text_file_calls_on_accept(tmp_path, monkeypatch):
+    text_path = tmp_path / "puzzles.txt"
+    text_path.write_text(
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1\n"
+        "8/8/8/8/8/8/8/K6k w - - 0 1\n"
+    )
+    accepted = []
+
+    _set_input(monkeypatch, ["0", "1", "Comment"])
+    puzzles, _ = main.get_puzzles_from_text_file(
+        str(text_path), open_in_browser=False, on_accept=accepted.append
+    )
+
+    assert accepted == puzzles == ["8/8/8/8/8/8/8/K6k w - - 0 1"]
+
+
+def test_prefetcher_yields_items_and_reraises_errors():
+    def items():
+        yield 1
+        yield 2
+        raise ValueError("bad row")
+
+    with main._Prefetcher(items(), depth=1) as prefetched:
+        assert next(prefetched) == 1
+        assert next(prefetched) == 2
+        with pytest.raises(ValueError):
+            next(prefetched)
+        assert next(prefetched, None) is None
+
+
+def test_render_worker_writes_images_in_final_order(tmp_path, monkeypatch):
+    import fen2tex as fen2tex_module
+
+    def fake_fen2png(fen, img_name, profile):
+        Path(img_name).write_text(fen)
+
+    monkeypatch.setattr(fen2tex_module, "fen2png", fake_fen2png)
+
+    with fen2tex_module.RenderWorker(tmp_path) as renderer:
+        renderer.submit("first")
+        renderer.submit("second")
+        renderer.submit("rejected later")
+        paths = renderer.finish(["second", "first", "third"])
+
+    assert [path.name for path in paths] == ["puzzle_0.png", "puzzle_1.png", "puzzle_2.png"]
+    assert [path.read_text() for path in paths] == ["second", "first", "third"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "puzzle_0.png",
+        "puzzle_1.png",
+        "puzzle_2.png",
+    ]
+
+
+def test_get_puzzles_from_csv_skips_near_duplicates(tmp_path, monkeypatch):
+    from similarity import SimilarityIndex
+
+    csv_path = tmp_path / "puzzles.csv"
+    csv_path.write_text(
+        "fen\n"
+        "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1\n"
+        "6k1/5ppp/8/8/8/7P/5PP1/R5K1 w - - 0 1\n"
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1\n"
+    )
+
+    _set_input(monkeypatch, ["1", "", "1", "", "no"])
+    puzzles, _ = main.get_puzzles_from_csv(
+        str(csv_path),
+        n=2,
+        verbose=False,
+        open_in_browser=False,
+        diversity=SimilarityIndex(2),
+    )
+
+    assert puzzles == [
+        "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    ]
+
+
+def test_get_puzzles_from_csv_with_diversity_keeps_unparseable_rows(tmp_path, monkeypatch):
+    from similarity import SimilarityIndex
+
+    csv_path = tmp_path / "puzzles.csv"
+    csv_path.write_text("fen\n6k1/5ppp/8/8/8/8/5PPP/R5K1 x - - 0 1\n")
+
+    _set_input(monkeypatch, ["1", "", "no"])
+    puzzles, _ = main.get_puzzles_from_csv(
+        str(csv_path), n=1, verbose=False, open_in_browser=False, diversity=SimilarityIndex(2)
+    )
+
+    assert puzzles == ["6k1/5ppp/8/8/8/8/5PPP/R5K1 x - - 0 1"]
+
+
+@pytest.mark.parametrize("option", ["--engines", "--workers"])
+@pytest.mark.parametrize("value", ["0", "-2", "two"])
+def test_main_rejects_counts_below_one(monkeypatch, capsys, option, value):
+    argv = ["wuzzle-cli", "cql", "_", "--file", "games.pgn", option, value]
+    monkeypatch.setattr("sys.argv", argv)
+
+    with pytest.raises(SystemExit) as excinfo:
+        main.main()
+
+    assert excinfo.value.code == 2
+    assert option in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "extra", [["--engines", "2"], ["--checkpoint", "scan.json"], ["--resume"], ["--mine"]]
+)
+def test_main_rejects_engine_options_with_query(monkeypatch, capsys, extra):
+    argv = ["wuzzle-cli", "cql", "_", "--file", "games.pgn", "--query", "material:KQk"] + extra
+    monkeypatch.setattr("sys.argv", argv)
+
+    with pytest.raises(SystemExit) as excinfo:
+        main.main()
+
+    assert excinfo.value.code == 2
+    assert f"{extra[0]} cannot be combined with --query" in capsys.readouterr().err
@@ -0,0 +1,66 @@
+import bz2
+import gzip
+import lzma
+
+import chess.pgn
+import pytest
+
+import pgn_input
+
+PGN = '[Event "Café"]\n[White "Müller"]\n\n1. e4 e5 *\n'
+
+
+@pytest.mark.parametrize(
+    "suffix, compress",
+    [(".gz", gzip.compress), (".bz2", bz2.compress), (".xz", lzma.compress), ("", bytes)],
+)
+def test_open_pgn_decompresses_by_magic_bytes(tmp_path, suffix, compress):
+    # The name is deliberately misleading: detection uses the magic bytes.
+    path = tmp_path / f"games.pgn{suffix}"
+    path.write_bytes(compress(PGN.encode("utf-8")))
+
+    with pgn_input.open_pgn(path) as handle:
+        game = chess.pgn.read_game(handle)
+
+    assert game.headers["White"] == "Müller"
+    assert [m.uci() for m in game.mainline_moves()] == ["e2e4", "e7e5"]
+
+
+def test_open_pgn_zstd(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "games.pgn.zst"
+    path.write_bytes(zstandard.ZstdCompressor().compress(PGN.encode("utf-8")))
+
+    with pgn_input.open_pgn(path) as handle:
+        assert handle.read() == PGN
+
+
+def test_open_pgn_falls_back_to_latin1(tmp_path):
+    path = tmp_path / "mixed.pgn"
+    path.write_bytes(PGN.encode("utf-8") + "\n".encode() + PGN.encode("latin-1"))
+
+    with pgn_input.open_pgn(path) as handle:
+        first = chess.pgn.read_game(handle)
+        second = chess.pgn.read_game(handle)
+
+    assert first.headers["Event"] == second.headers["Event"] == "Café"
+
+
+def test_text_input_tell_and_seek(tmp_path):
+    path = tmp_path / "games.pgn.gz"
+    path.write_bytes(gzip.compress((PGN + "\n" + PGN.replace("e4", "d4")).encode("utf-8")))
+
+    with pgn_input.open_pgn(path) as handle:
+        chess.pgn.read_game(handle)
+        offset = handle.tell()
+
+    with pgn_input.open_pgn(path) as handle:
+        handle.seek(offset)
+        game = chess.pgn.read_game(handle)
+
+    assert game.next().move.uci() == "d2d4"
+
+
+def test_uncompressed_name():
+    assert pgn_input.uncompressed_name("a/games.pgn.zst").name == "games.pgn"
+    assert pgn_input.uncompressed_name("games.pgn").name == "games.pgn"
@@ -0,0 +1,114 @@
+import gzip
+
+import pytest
+
+import pgn_splitter
+
+
+def _game(index, moves="1. e4 e5 *"):
+    return f'[Event "Game {index}"]\n[Site "?"]\n\n{moves}\n'
+
+
+def _write_games(path, count):
+    path.write_text("\n".join(_game(i) for i in range(count)))
+
+
+def test_iter_games_splits_on_tags(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    pgn_path.write_text('\n\n[Site "no event"]\n\n1. d4 *\n' + _game(1) + "\n\n" + _game(2))
+
+    with pgn_path.open("rb") as handle:
+        games = list(pgn_splitter.iter_games(handle))
+
+    assert len(games) == 3
+    assert games[0].startswith(b'[Site "no event"]')
+    assert games[2].startswith(b'[Event "Game 2"]')
+
+
+def test_iter_games_keeps_wrapped_comments(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    moves = "1. e4 { White opens\n[%clk 0:03:00] } e5 { [%eval 0.2] }\n[%clk 0:02:59] 2. Nf3 *"
+    pgn_path.write_text(_game(0, moves) + "\n" + _game(1))
+
+    with pgn_path.open("rb") as handle:
+        games = list(pgn_splitter.iter_games(handle))
+
+    assert len(games) == 2
+    assert b"[%clk 0:02:59] 2. Nf3 *" in games[0]
+    assert games[1].startswith(b'[Event "Game 1"]')
+
+
+def test_split_pgn_max_games(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    _write_games(pgn_path, 5)
+
+    paths = pgn_splitter.split_pgn(str(pgn_path), max_games=2, output_dir=tmp_path / "out")
+
+    assert [p.name for p in paths] == ["games_1.pgn", "games_2.pgn", "games_3.pgn"]
+    assert paths[0].read_text().count("[Event ") == 2
+    assert paths[2].read_text().count("[Event ") == 1
+    assert paths[0].read_text().endswith("*\n")
+
+
+def test_split_pgn_max_bytes(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    _write_games(pgn_path, 6)
+    game_size = len(_game(0).strip())
+
+    # Three games, two blank-line separators and the final newline fit exactly.
+    paths = pgn_splitter.split_pgn(str(pgn_path), max_bytes=3 * game_size + 5)
+
+    assert len(paths) == 2
+    assert all(p.stat().st_size == 3 * game_size + 5 for p in paths)
+
+
+def test_split_pgn_shards_are_balanced(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    _write_games(pgn_path, 12)
+
+    paths = pgn_splitter.split_pgn(str(pgn_path), shards=3)
+
+    assert [p.read_text().count("[Event ") for p in paths] == [4, 4, 4]
+
+
+def test_split_pgn_shards_of_compressed_input_are_balanced(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    _write_games(pgn_path, 3000)
+    gz_path = tmp_path / "games.pgn.gz"
+    gz_path.write_bytes(gzip.compress(pgn_path.read_bytes()))
+
+    paths = pgn_splitter.split_pgn(str(gz_path), shards=4, output_dir=tmp_path / "gz")
+    plain_paths = pgn_splitter.split_pgn(str(pgn_path), shards=4, output_dir=tmp_path / "plain")
+
+    counts = [p.read_text().count("[Event ") for p in paths]
+    assert counts == [p.read_text().count("[Event ") for p in plain_paths]
+    assert all(700 <= count <= 800 for count in counts)
+
+
+def test_split_pgn_rejects_mixed_limits(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    _write_games(pgn_path, 1)
+
+    with pytest.raises(ValueError):
+        pgn_splitter.split_pgn(str(pgn_path), max_games=2, shards=2)
+
+
+@pytest.mark.parametrize("limits", [{"max_games": 0}, {"max_bytes": 0}, {"max_games": -3}])
+def test_split_pgn_rejects_limits_below_one(tmp_path, limits):
+    pgn_path = tmp_path / "games.pgn"
+    _write_games(pgn_path, 2)
+
+    with pytest.raises(ValueError, match="must be at least 1"):
+        pgn_splitter.split_pgn(str(pgn_path), **limits)
+
+
+def test_split_pgn_compressed_input(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    _write_games(pgn_path, 3)
+    gz_path = tmp_path / "games.pgn.gz"
+    gz_path.write_bytes(gzip.compress(pgn_path.read_bytes()))
+
+    paths = pgn_splitter.split_pgn(str(gz_path), max_games=2, output_dir=tmp_path / "out")
+
+    assert [p.name for p in paths] == ["games_1.pgn", "games_2.pgn"]
+    assert paths[1].read_text().startswith('[Event "Game 2"]')
@@ -0,0 +1,44 @@
+import io
+
+import chess
+import pytest
+
+import pgn_stream
+
+PGN = """[Event "Test"]
+[White "W"]
+[Black "B"]
+
+1. e4 { long comment } e5 (1... c5 2. Nf3 d6) 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+
+[Event "Second"]
+
+1. d4 *
+"""
+
+
+def test_read_game_tail_positions():
+    handle = io.StringIO(PGN)
+    tail = pgn_stream.read_game_tail(handle, 3)
+
+    assert tail.headers["White"] == "W"
+    assert tail.plies == 7
+    assert tail.board.is_checkmate()
+
+    expected = chess.Board()
+    for san in ["e4", "e5", "Qh5", "Nc6"]:
+        expected.push_san(san)
+    assert tail.position(3).fen() == expected.fen()
+
+    second = pgn_stream.read_game_tail(handle, 3)
+    assert second.headers["Event"] == "Second"
+    assert second.plies == 1
+    assert pgn_stream.read_game_tail(handle, 3) is None
+
+
+def test_read_game_tail_is_bounded():
+    tail = pgn_stream.read_game_tail(io.StringIO(PGN), 2)
+
+    assert len(tail.board.move_stack) == 2
+    with pytest.raises(ValueError):
+        tail.position(3)
@@ -0,0 +1,121 @@
+import csv
+
+import chess
+import pytest
+
+import main
+import position_index
+import validate_db
+from dedupe import position_key
+from synthetic_data import write_puzzle_db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return write_puzzle_db(tmp_path / "puzzles.csv", 300, seed=6)
+
+
+def _rows(db_path):
+    with open(db_path, newline="") as handle:
+        return [row for row in csv.reader(handle) if row and row[0] != "PuzzleId"]
+
+
+def _shown_board(row):
+    board = chess.Board(row[1])
+    board.push_uci(row[2].split()[0])
+    return board
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_every_puzzle_is_found_by_its_position(db_path, workers):
+    # Small chunks put row boundaries inside chunks
+    index_path, count = position_index.build_position_index(
+        db_path, workers=workers, chunk_bytes=4096
+    )
+
+    rows = _rows(db_path)
+    assert index_path == position_index.index_path_for(db_path)
+    assert count == len({position_key(_shown_board(row)) for row in rows})
+    with position_index.PositionIndex(db_path) as index:
+        first = {}
+        for row in rows:
+            first.setdefault(position_key(_shown_board(row)), row[0])
+        for row in rows:
+            found = index.lookup(_shown_board(row))
+            assert found["PuzzleId"] == first[position_key(_shown_board(row))]
+        assert index.lookup(chess.Board("8/8/8/8/8/8/6k1/4K2R w K - 0 1")) is None
+
+
+def test_details_give_the_solution_in_san(db_path):
+    position_index.build_position_index(db_path, workers=1)
+    row = _rows(db_path)[0]
+    board = _shown_board(row)
+
+    with position_index.PositionIndex(db_path) as index:
+        details = index.details(board.fen())
+
+    moves = [chess.Move.from_uci(move) for move in row[2].split()[1:]]
+    assert details["Solution"] == board.variation_san(moves)
+    assert details["Themes"] == row[7]
+    assert details["Rating"] == row[3]
+    assert details["Lichess puzzle"] == f"https://lichess.org/training/{row[0]}"
+
+
+def test_quarantined_puzzles_are_left_out(db_path):
+    row = _rows(db_path)[0]
+    validate_db.quarantine_path_for(db_path).write_text(f"{row[0]}\n")
+    position_index.build_position_index(db_path, workers=1)
+
+    with position_index.PositionIndex(db_path) as index:
+        found = index.lookup(_shown_board(row))
+    assert found is None or found["PuzzleId"] != row[0]
+
+
+def test_stale_index_is_not_opened(db_path, capsys):
+    assert position_index.open_position_index(db_path) is None
+    position_index.build_position_index(db_path, workers=1)
+    index = position_index.open_position_index(db_path)
+    assert index is not None
+    index.close()
+
+    with open(db_path, "a") as handle:
+        handle.write("\n")
+    assert position_index.open_position_index(db_path) is None
+    assert "out of date" in capsys.readouterr().out
+
+
+def test_index_goes_out_of_date_when_the_quarantine_changes(db_path, capsys):
+    position_index.build_position_index(db_path, workers=1)
+    validate_db.quarantine_path_for(db_path).write_text("nothing\n")
+
+    assert position_index.open_position_index(db_path) is None
+    assert "out of date" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("keep", [0, 10, 64, 200])
+def test_corrupt_index_is_not_opened(db_path, capsys, keep):
+    index_path, _ = position_index.build_position_index(db_path, workers=1)
+    index_path.write_bytes(index_path.read_bytes()[:keep])
+
+    assert position_index.open_position_index(db_path) is None
+    assert "Cannot use the position index" in capsys.readouterr().out
+
+
+def test_csv_candidates_show_lichess_details(db_path, tmp_path, monkeypatch):
+    position_index.build_position_index(db_path, workers=1)
+    row = _rows(db_path)[0]
+    csv_path = tmp_path / "games.csv"
+    csv_path.write_text(f"fen\n{_shown_board(row).fen()}\n")
+    printed = []
+    monkeypatch.setattr("builtins.print", lambda *args: printed.append(" ".join(args)))
+    inputs = iter(["1", "", "no"])
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+
+    with position_index.PositionIndex(db_path) as index:
+        puzzles, _ = main.get_puzzles_from_csv(
+            str(csv_path), n=1, verbose=False, open_in_browser=False, positions=index
+        )
+
+    assert len(puzzles) == 1
+    assert f"Lichess puzzle: https://lichess.org/training/{row[0]}" in printed
+    assert f"Themes: {row[7]}" in printed
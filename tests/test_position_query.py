@@ -0,0 +1,65 @@
+import io
+
+import chess
+import pytest
+
+import position_query
+from position_query import PositionQuery
+
+ROOK_ENDGAME = "6k1/8/P7/8/8/8/r7/R5K1 w - - 0 1"
+BLOCKED = "6k1/p7/P7/8/8/8/r7/R5K1 w - - 0 1"
+
+
+def _matches(query, fen):
+    return PositionQuery(query).matches(chess.Board(fen))
+
+
+def test_piece_designators():
+    assert _matches("Ra1", ROOK_ENDGAME)
+    assert _matches("P[a-h]6", ROOK_ENDGAME)
+    assert not _matches("P[a-h]7", ROOK_ENDGAME)
+    assert _matches("[QR][ab][1-2]", ROOK_ENDGAME)
+    assert _matches("a", ROOK_ENDGAME)
+    assert not _matches("q", ROOK_ENDGAME)
+
+
+def test_counts_material_and_side_to_move():
+    assert _matches("#P == 1 #r = 1 wtm", ROOK_ENDGAME)
+    assert not _matches("#A > 3", ROOK_ENDGAME)
+    assert _matches("material:KRPkr", ROOK_ENDGAME)
+    assert _matches("material:RP*rp*", ROOK_ENDGAME)
+    assert not _matches("material:KRkr", ROOK_ENDGAME)
+
+
+def test_passed_attacks_and_pins():
+    assert _matches("passed(P[a-h]6)", ROOK_ENDGAME)
+    assert not _matches("passed(P[a-h]6)", BLOCKED)
+    assert _matches("attacks(R, r)", ROOK_ENDGAME)
+    assert not _matches("attacks(P, r)", ROOK_ENDGAME)
+    assert _matches("pinned(n)", "4k3/4n3/8/8/8/8/8/4R1K1 b - - 0 1")
+
+
+def test_boolean_operators():
+    assert _matches("btm or Ra1", ROOK_ENDGAME)
+    assert _matches("not (q or Q) and (R)", ROOK_ENDGAME)
+    assert not _matches("not R", ROOK_ENDGAME)
+
+
+def test_invalid_queries():
+    for text in ["", "Xa1", "#R ==", "attacks(R)", "Ra9", "(R"]:
+        with pytest.raises(ValueError):
+            PositionQuery(text)
+
+
+def test_iter_matching_positions():
+    pgn = io.StringIO(
+        '[Event "One"]\n\n1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0\n\n'
+        '[Event "Two"]\n\n1. d4 d5 *\n'
+    )
+
+    results = list(position_query.iter_matching_positions(pgn, "attacks(Q, p)"))
+
+    assert len(results) == 1
+    board, headers = results[0]
+    assert headers["Event"] == "One"
+    assert board.fen().startswith("rnbqkbnr/pppp1ppp/8/4p2Q/4P3")
@@ -0,0 +1,81 @@
+import json
+import sys
+import time
+
+import pytest
+
+import main
+import profiling
+
+
+@pytest.fixture
+def recorder():
+    recorder = profiling.enable()
+    yield recorder
+    profiling.disable()
+
+
+def test_span_is_a_no_op_when_disabled():
+    with profiling.span("stage") as stage:
+        stage.add_items(3)
+
+    assert profiling.disable() is None
+
+
+def test_spans_exclude_input_wait(monkeypatch, recorder):
+    def slow_input(prompt):
+        time.sleep(0.2)
+        return "1"
+
+    monkeypatch.setattr("builtins.input", slow_input)
+
+    with profiling.span("select") as outer:
+        assert profiling.prompt("Pick: ") == "1"
+        outer.add_items(1)
+    with profiling.span("background", exclude_input=False):
+        profiling.prompt("Again: ")
+
+    stages = {stage["name"]: stage for stage in profiling.summarize(recorder)}
+    assert list(stages) == ["select", "background"]
+    assert stages["select"]["active"] < 0.1
+    assert stages["select"]["items"] == 1
+    assert stages["background"]["active"] >= 0.2
+    assert recorder.input_wait >= 0.4
+
+
+def test_write_trace(tmp_path, recorder):
+    with profiling.span("render", track="worker"):
+        with profiling.span("svg2png") as stage:
+            stage.add_items(2)
+    trace_path = tmp_path / "trace.json"
+
+    profiling.write_trace(recorder, trace_path)
+
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    threads = [event["args"]["name"] for event in events if event["ph"] == "M"]
+    assert [event["name"] for event in spans] == ["render", "svg2png"]
+    assert spans[1]["args"]["items"] == 2
+    assert spans[0]["dur"] >= spans[1]["dur"]
+    assert threads == ["worker", "thread 2"]
+    assert "svg2png" in profiling.format_summary(recorder)
+
+
+def test_main_profile_writes_trace(tmp_path, monkeypatch, capsys):
+    text_file = tmp_path / "puzzles.txt"
+    text_file.write_text("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1\n")
+    trace_path = tmp_path / "trace.json"
+    inputs = iter(["0"])
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["wuzzle-cli", "text", "_", "--file", str(text_file), "--no-open"]
+        + ["--output-dir", str(tmp_path), "--profile", str(trace_path)],
+    )
+
+    assert main.main() == 1
+
+    names = {event["name"] for event in json.loads(trace_path.read_text())["traceEvents"]}
+    assert {"main", "select", "read_file", "input"} <= names
+    assert "Waiting for input (excluded)" in capsys.readouterr().out
@@ -0,0 +1,181 @@
+import http.client
+import io
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+
+import pytest
+
+import puzzle_server
+import review_server
+from main import load_lichess_db
+from puzzle_server import PuzzleIndex, PuzzleService, make_server
+from synthetic_data import write_puzzle_db
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    db_path = write_puzzle_db(tmp_path_factory.mktemp("db") / "puzzles.csv", 300, seed=4)
+    return PuzzleIndex(load_lichess_db(db_path))
+
+
+@pytest.fixture
+def service(index, monkeypatch):
+    monkeypatch.setattr(
+        review_server, "render_board", lambda fen, profile="screen": f"PNG {fen}".encode()
+    )
+    service = PuzzleService(index)
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def base_url(service):
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    yield f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _get_json(url):
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def test_query_matches_every_theme_as_a_whole_tag(index):
+    puzzles = index.query("fork,middlegame", n=5, seed=1)
+
+    assert len(puzzles) == 5
+    for puzzle in puzzles:
+        assert {"fork", "middlegame"} <= set(puzzle["themes"])
+    assert len({puzzle["fen"] for puzzle in puzzles}) == 5
+    assert index.query("fork,middlegame", n=5, seed=1) == puzzles
+
+
+def test_query_filters_by_rating(index):
+    puzzles = index.query("fork", n=50, seed=2, min_rating=1400, max_rating=1600)
+
+    assert puzzles
+    assert all(1400 <= puzzle["rating"] <= 1600 for puzzle in puzzles)
+
+
+def test_query_rejects_unknown_themes(index):
+    with pytest.raises(ValueError, match="Unknown theme"):
+        index.query("notATheme")
+
+
+def test_theme_counts_match_the_database(index):
+    counts = index.theme_counts()
+
+    assert counts["fork"] == index.df["Themes"].str.split().apply(lambda t: "fork" in t).sum()
+
+
+def test_http_endpoints(base_url, index):
+    assert _get_json(f"{base_url}/health") == {
+        "puzzles": len(index),
+        "themes": len(index.theme_rows),
+    }
+    puzzles = _get_json(f"{base_url}/puzzles?themes=fork&n=3&seed=5")["puzzles"]
+    assert puzzles == index.query("fork", n=3, seed=5)
+
+    fen = puzzles[0]["fen"]
+    with urllib.request.urlopen(
+        f"{base_url}/board.png?fen={urllib.request.quote(fen)}", timeout=10
+    ) as response:
+        assert response.headers["Content-Type"] == "image/png"
+        assert response.read() == f"PNG {fen}".encode()
+
+
+def test_http_errors(base_url):
+    for path, status in [
+        ("/puzzles?themes=notATheme", 400),
+        ("/puzzles?themes=fork&n=abc", 400),
+        ("/board.png?fen=invalid", 400),
+        ("/missing", 404),
+    ]:
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            urllib.request.urlopen(base_url + path, timeout=10)
+        assert excinfo.value.code == status
+
+
+def test_query_skips_corrupt_rows(tmp_path):
+    db_path = write_puzzle_db(tmp_path / "puzzles.csv", 40, seed=9)
+    df = load_lichess_db(db_path)
+    df.loc[df.index[:10], "Moves"] = float("nan")
+    df.loc[df.index[10:20], "FEN"] = "not a fen"
+    index = PuzzleIndex(df)
+
+    puzzles = index.query("", n=40, seed=1)
+
+    assert puzzles
+    assert {puzzle["id"] for puzzle in puzzles} <= set(df["PuzzleId"][20:])
+
+
+def test_unexpected_errors_are_json_500s(base_url, service, monkeypatch, capsys):
+    def broken(fen):
+        raise OSError("renderer crashed")
+
+    monkeypatch.setattr(service, "board", broken)
+
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        urllib.request.urlopen(f"{base_url}/board.png?fen=x", timeout=10)
+    assert excinfo.value.code == 500
+    assert json.loads(excinfo.value.read()) == {"error": "Internal server error"}
+    assert "renderer crashed" in capsys.readouterr().err
+
+
+def test_sheet_as_tex_archive(base_url):
+    body = json.dumps(
+        {"themes": "fork", "n": 4, "seed": 3, "title": "Forks & pins", "format": "tex"}
+    ).encode()
+    request = urllib.request.Request(f"{base_url}/sheet", data=body)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        archive = zipfile.ZipFile(io.BytesIO(response.read()))
+
+    names = archive.namelist()
+    assert "sheet.tex" in names
+    assert sorted(name for name in names if name.startswith("images/")) == [
+        f"images/puzzle_{idx}.png" for idx in range(4)
+    ]
+    assert r"Forks \& pins" in archive.read("sheet.tex").decode()
+
+
+def test_sheet_pdf_needs_pdflatex(base_url, monkeypatch):
+    monkeypatch.setattr(puzzle_server.shutil, "which", lambda name: None)
+    request = urllib.request.Request(f"{base_url}/sheet", data=b'{"themes": "fork"}')
+
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        urllib.request.urlopen(request, timeout=10)
+    assert excinfo.value.code == 503
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_unix_socket(service, tmp_path, index):
+    socket_path = tmp_path / "wuzzle.sock"
+    server = make_server(service, socket_path=socket_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = _UnixConnection(str(socket_path))
+        connection.request("GET", "/health")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read())["puzzles"] == len(index)
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,134 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import main
+import review_server
+from review_server import Candidate, ReviewServer
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+E4_FEN = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(review_server, "render_board", lambda fen: f"PNG {fen}".encode())
+    server = ReviewServer(port=0)
+    yield server
+    server.close()
+
+
+def _get(server, path):
+    with urllib.request.urlopen(server.url + path.lstrip("/"), timeout=10) as response:
+        return response.read()
+
+
+def _decide(server, candidate_id, accept, comment=""):
+    body = json.dumps({"id": candidate_id, "accept": accept, "comment": comment}).encode()
+    request = urllib.request.Request(
+        server.url + "api/decision",
+        data=body,
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _review_in_thread(server, candidates, n, **kwargs):
+    result = {}
+
+    def run():
+        result["value"] = server.review(iter(candidates), n, **kwargs)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def _current(server):
+    for _ in range(100):
+        state = json.loads(_get(server, "/api/state"))
+        if state["current"] is not None:
+            return state
+        threading.Event().wait(0.02)
+    raise AssertionError("no candidate was offered")
+
+
+def test_review_accepts_and_rejects_from_the_page(server):
+    accepted = []
+    candidates = [
+        Candidate(START_FEN, "https://lichess.org/a", {"Themes": "fork"}),
+        Candidate(E4_FEN, "https://lichess.org/b", caption=lambda comment: f"[{comment}]"),
+    ]
+    thread, result = _review_in_thread(server, candidates, 1, on_accept=accepted.append)
+
+    state = _current(server)
+    assert state["current"]["fen"] == START_FEN
+    assert state["current"]["details"] == {"Themes": "fork"}
+    assert state["upcoming"] == [1]
+
+    state = _decide(server, state["current"]["id"], False)
+    assert state["current"]["fen"] == E4_FEN
+    _decide(server, state["current"]["id"], True, "Nice")
+    thread.join(timeout=10)
+
+    assert result["value"] == ([E4_FEN], ["[Nice]"], False)
+    assert accepted == [E4_FEN]
+    assert json.loads(_get(server, "/api/state"))["done"]
+
+
+def test_review_reports_exhausted_candidates(server):
+    thread, result = _review_in_thread(server, [Candidate(START_FEN, "")], 2)
+
+    _decide(server, _current(server)["current"]["id"], True, "Only")
+    thread.join(timeout=10)
+
+    assert result["value"] == ([START_FEN], ["Only"], True)
+
+
+def test_board_endpoint_serves_queued_renders(server):
+    thread, _ = _review_in_thread(server, [Candidate(START_FEN, "")], 1)
+    state = _current(server)
+
+    assert _get(server, f"/board/{state['current']['id']}.png") == f"PNG {START_FEN}".encode()
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        _get(server, "/board/99.png")
+    assert excinfo.value.code == 404
+
+    _decide(server, state["current"]["id"], False)
+    thread.join(timeout=10)
+
+
+def test_decision_for_a_stale_candidate_is_rejected(server):
+    thread, _ = _review_in_thread(server, [Candidate(START_FEN, "")], 1)
+    state = _current(server)
+
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        _decide(server, state["current"]["id"] + 1, True)
+    assert excinfo.value.code == 409
+
+    _decide(server, state["current"]["id"], False)
+    thread.join(timeout=10)
+
+
+def test_text_file_selection_with_the_web_reviewer(server, tmp_path):
+    text_path = tmp_path / "puzzles.txt"
+    text_path.write_text(f"{START_FEN}\n{E4_FEN}\n")
+    result = {}
+
+    def run():
+        result["value"] = main.get_puzzles_from_text_file(
+            str(text_path), open_in_browser=False, reviewer=server.review
+        )
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    state = _current(server)
+    state = _decide(server, state["current"]["id"], True, "First")
+    _decide(server, state["current"]["id"], True, "Second")
+    thread.join(timeout=10)
+
+    assert result["value"] == ([START_FEN, E4_FEN], ["First", "Second"])
@@ -0,0 +1,58 @@
+import random
+
+import chess
+import pytest
+
+from similarity import SimilarityIndex, distance, piece_squares
+from synthetic_data import random_game
+
+FEN = "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1"
+# The same position with the h2 pawn on h3
+FEN_PAWN_MOVED = "6k1/5ppp/8/8/8/7P/5PP1/R5K1 w - - 0 1"
+
+
+def test_distance_counts_changed_piece_squares():
+    base = piece_squares(FEN)
+
+    assert distance(base, base) == 0
+    assert distance(base, piece_squares(FEN_PAWN_MOVED)) == 2
+    assert distance(base, piece_squares("6k1/5ppp/8/8/8/8/5PP1/R5K1 w - - 0 1")) == 1
+
+
+def test_nearest_finds_close_positions_only():
+    index = SimilarityIndex(2)
+    index.add(FEN)
+
+    assert index.nearest(FEN_PAWN_MOVED) == (2, chess.Board(FEN).fen())
+    assert not index.is_near("6k1/5ppp/8/8/8/7P/5P2/R5K1 w - - 0 1")
+    # Same pieces, other side to move
+    assert not index.is_near("6k1/5ppp/8/8/8/8/5PPP/R5K1 b - - 0 1")
+
+
+def test_index_agrees_with_brute_force():
+    rng = random.Random(5)
+    boards = [random_game(rng, rng.randint(2, 30)) for _ in range(300)]
+    index = SimilarityIndex(4)
+    for board in boards[:150]:
+        index.add(board)
+
+    for query in boards[150:]:
+        bits = piece_squares(query)
+        expected = min(
+            (
+                distance(bits, piece_squares(board))
+                for board in boards[:150]
+                if board.turn == query.turn
+            ),
+            default=None,
+        )
+        found = index.nearest(query)
+        if expected is None or expected > 4:
+            assert found is None
+        else:
+            assert found[0] == expected
+
+
+def test_negative_distance_is_rejected():
+    with pytest.raises(ValueError):
+        SimilarityIndex(-1)
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# Total import time allowed for `--help` and for the text medium up to its
+# first prompt. pandas alone takes longer than this.
+IMPORT_BUDGET_SECONDS = 0.4
+HEAVY_MODULES = ["asyncio", "cairosvg", "chess.engine", "chess.pgn", "pandas", "PIL"]
+
+_RUN_CLI = """
+import builtins
+import sys
+
+def stop_at_prompt(prompt=""):
+    print("MODULES", " ".join(sorted(sys.modules)))
+    raise SystemExit(0)
+
+builtins.input = stop_at_prompt
+sys.argv = ["wuzzle-cli"] + sys.argv[1:]
+import main
+try:
+    main.main()
+finally:
+    print("MODULES", " ".join(sorted(sys.modules)))
+"""
+
+
+def _run_cli(*args):
+    """
+    Run the CLI in a fresh interpreter, returning the modules loaded when it
+    exits or first asks for input, and the total time spent importing.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC), env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _RUN_CLI, *args],
+        capture_output=True,
+        text=True,
+        env=env,
+        timeout=60,
+    )
+    modules_line = next(
+        line for line in result.stdout.splitlines() if line.startswith("MODULES ")
+    )
+    modules = set(modules_line.split()[1:])
+    import_us = 0
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            self_us = line.split(":", 1)[1].split("|")[0].strip()
+            if self_us.isdigit():
+                import_us += int(self_us)
+    return modules, import_us / 1e6
+
+
+def _heavy(modules):
+    return [
+        name
+        for name in HEAVY_MODULES
+        if any(module == name or module.startswith(name + ".") for module in modules)
+    ]
+
+
+def test_help_imports_nothing_heavy():
+    modules, import_seconds = _run_cli("--help")
+
+    assert _heavy(modules) == []
+    assert "chess" not in modules
+    assert import_seconds < IMPORT_BUDGET_SECONDS
+
+
+def test_text_medium_imports_nothing_heavy(tmp_path):
+    text_file = tmp_path / "puzzles.txt"
+    text_file.write_text("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1\n")
+
+    modules, import_seconds = _run_cli(
+        "text",
+        "_",
+        "--file",
+        str(text_file),
+        "--no-open",
+        "--output-dir",
+        str(tmp_path / "output"),
+    )
+
+    assert "chess" in modules
+    assert _heavy(modules) == []
+    assert import_seconds < IMPORT_BUDGET_SECONDS
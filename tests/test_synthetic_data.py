@@ -0,0 +1,47 @@
+import csv
+
+import chess
+import chess.pgn
+
+import synthetic_data
+from main import LICHESS_COLUMNS, load_lichess_db
+
+
+def test_puzzle_rows_are_valid(tmp_path):
+    path = synthetic_data.write_puzzle_db(tmp_path / "db.csv", 60, seed=3)
+
+    with open(path, newline="") as handle:
+        rows = list(csv.reader(handle))
+    assert rows[0] == LICHESS_COLUMNS
+    assert len(rows) == 61
+    assert len({row[0] for row in rows[1:]}) == 60
+    for row in rows[1:]:
+        board = chess.Board(row[1])
+        moves = row[2].split()
+        assert len(moves) % 2 == 0
+        for move in moves:
+            assert chess.Move.from_uci(move) in board.legal_moves
+            board.push_uci(move)
+        assert 400 <= int(row[3]) <= 3200
+        assert row[7]
+    assert len(load_lichess_db(path)) == 60
+
+
+def test_puzzle_rows_follow_seed_and_theme_weights():
+    first = list(synthetic_data.iter_puzzle_rows(20, seed=1, theme_weights={"pin": 1}))
+    second = list(synthetic_data.iter_puzzle_rows(20, seed=1, theme_weights={"pin": 1}))
+
+    assert first == second
+    assert all("pin" in row[7].split() for row in first)
+    assert not any("fork" in row[7].split() for row in first)
+
+
+def test_write_pgn(tmp_path):
+    path = synthetic_data.write_pgn(tmp_path / "games.pgn", 5, seed=2)
+
+    games = []
+    with open(path) as handle:
+        while (game := chess.pgn.read_game(handle)) is not None:
+            games.append(game)
+    assert len(games) == 5
+    assert all(not game.errors and game.end().ply() > 0 for game in games)
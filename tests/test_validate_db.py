@@ -0,0 +1,64 @@
+import csv
+import json
+
+import pytest
+
+import validate_db
+from main import load_lichess_db
+from synthetic_data import write_puzzle_db
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+URL = "https://lichess.org/abc#1"
+
+BAD_ROWS = [
+    ["bad01", START_FEN, "e2e4", "1500", "80", "90", "100", "fork", URL],
+    ["bad02", START_FEN, "e2e4 e7e5", "high", "80", "90", "100", "fork", URL, ""],
+    ["bad03", "not a fen", "e2e4", "1500", "80", "90", "100", "fork", URL, ""],
+    ["bad04", "8/8/8/8/8/8/8/8 w - - 0 1", "e2e4", "1500", "80", "90", "100", "fork", URL, ""],
+    ["bad05", START_FEN, "e2e4 e2e4", "1500", "80", "90", "100", "fork", URL, ""],
+    ["bad06", START_FEN, "e2e4 zz", "1500", "80", "90", "100", "fork", URL, ""],
+    ["bad07", START_FEN, "", "1500", "80", "90", "100", "fork", URL, ""],
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = write_puzzle_db(tmp_path / "puzzles.csv", 300, seed=2)
+    with open(path, "a", newline="") as handle:
+        csv.writer(handle).writerows(BAD_ROWS)
+    return path
+
+
+def test_check_row_kinds():
+    kinds = [validate_db.check_row(row)[0] for row in BAD_ROWS]
+
+    assert kinds == ["columns", "integer", "fen", "position", "moves", "moves", "moves"]
+    valid = ["ok", START_FEN, "e2e4 e7e5", "1500", "80", "90", "100", "fork", URL, ""]
+    assert validate_db.check_row(valid) is None
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validate_db_finds_every_bad_row(db_path, workers):
+    # Small chunks put row boundaries inside chunks
+    report = validate_db.validate_db(db_path, workers=workers, chunk_bytes=4096)
+
+    assert report["rows"] == 300 + len(BAD_ROWS)
+    assert sorted(problem["PuzzleId"] for problem in report["problems"]) == [
+        row[0] for row in BAD_ROWS
+    ]
+    assert report["kinds"]["moves"] == 3
+
+
+def test_quarantined_rows_are_skipped_when_loading(db_path):
+    report = validate_db.validate_db(db_path, workers=1)
+    report_path, quarantine_path, puzzle_ids = validate_db.write_results(report, db_path)
+
+    assert json.loads(report_path.read_text())["invalid"] == len(BAD_ROWS)
+    assert validate_db.load_quarantine(db_path) == set(puzzle_ids)
+    df = load_lichess_db(db_path)
+    assert len(df) == 300
+    assert not df["PuzzleId"].isin(puzzle_ids).any()
+
+
+def test_load_quarantine_without_validation(tmp_path):
+    assert validate_db.load_quarantine(tmp_path / "puzzles.csv") == set()